@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#
+# Latency, peak memory and entity recall of chunked parsing (Ibex.get_entities_chunked)
+# on long documents, against parsing each document whole
+#
+# Usage (with d3m_ibex installed): python benchmarks/bench_chunking.py [--input docs.txt] [--language english] [--mb 1] [--chunk-sizes 10000,100000]
+#
+
+import argparse
+import json
+import multiprocessing
+import resource
+import time
+
+from d3m_ibex import Ibex
+from d3m_ibex.d3m_ibex import PARSERS, get_rss
+
+from bench_profiles import load_documents
+
+
+def make_long_document(documents, size, sentences_per_paragraph=8):
+    ''' an email-thread-like document of about `size` characters: the sample documents
+    repeated, grouped into paragraphs '''
+    paragraphs, length, i = [], 0, 0
+    while length < size:
+        paragraph = ' '.join(documents[(i + j) % len(documents)] for j in range(sentences_per_paragraph))
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+        i += sentences_per_paragraph
+    return '\n\n'.join(paragraphs)
+
+
+def run(ibex, document, language, chunk_size, results):
+    ''' parse in a forked child, so each run's peak memory is measured on its own '''
+    start_rss = get_rss()
+    start_time = time.time()
+    if chunk_size:
+        entities = ibex.get_entities_chunked(document, language, chunk_size=chunk_size)
+    else:
+        PARSERS[ibex.parser_name].max_length = len(document) + 1
+        entities = ibex.get_entities(document, language)
+    elapsed_time = time.time() - start_time
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    results.send((elapsed_time, peak_rss - start_rss if start_rss is not None else None, entities))
+
+
+def measure(ibex, document, language, chunk_size):
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.get_context('fork').Process(target=run, args=(ibex, document, language, chunk_size, sender))
+    process.start()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure chunked parsing of long documents")
+    parser.add_argument('--input', help='text file with one document per line (default: built-in samples)')
+    parser.add_argument('--language', default='english')
+    parser.add_argument('--mb', type=float, default=1.0, help='size of the long document in megabytes')
+    parser.add_argument('--chunk-sizes', default='10000,50000,100000', help='comma-separated chunk sizes in characters')
+    args = parser.parse_args()
+
+    ibex = Ibex(language=args.language)
+    ibex.warmup([args.language])
+    document = make_long_document(load_documents(args.input, args.language, 1000), int(args.mb * 2**20))
+
+    runs = {}
+    reference = None
+    for chunk_size in [0] + [int(size) for size in args.chunk_sizes.split(',')]:
+        elapsed_time, peak_rss, entities = measure(ibex, document, args.language, chunk_size)
+        entities = set(entities)
+        if reference is None:
+            reference = entities
+        runs['whole' if not chunk_size else str(chunk_size)] = {
+            'seconds': elapsed_time,
+            'peak_rss_growth_mb': peak_rss / 2**20 if peak_rss is not None else None,
+            'entities': len(entities),
+            'recall': len(entities & reference) / len(reference) if reference else 1.0,
+            'extra': len(entities - reference),
+        }
+
+    print(json.dumps({'language': args.language, 'document_chars': len(document), 'runs': runs}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
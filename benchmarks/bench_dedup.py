@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+#
+# Near-duplicate window (d3m_ibex.dedup): a corpus is streamed through
+# get_entities_batch with and without the window, with near-duplicates of a fraction
+# of its documents (a word added, dropped or changed) mixed in. Reports the fraction
+# of documents whose parse was skipped, docs/sec, the cost of signatures and lookups,
+# and how many skipped documents got other entities than parsing them gives.
+#
+# Usage (with d3m_ibex installed): python benchmarks/bench_dedup.py [--corpus corpus.jsonl] [--docs 5000] [--duplicates 0.3] [--threshold 0.9] [--output result.json]
+#
+
+import argparse
+import json
+import random
+import time
+
+from d3m_ibex.d3m_ibex import Ibex
+from d3m_ibex.dedup import NearDuplicateWindow
+
+from corpus import add_corpus_arguments, environment, get_corpus
+
+EDITS = ['wow', 'must read', 'via', 'unbelievable', 'thread', 'update']
+
+
+def near_duplicate(rng, text):
+    ''' text with one word added, dropped or changed '''
+    words = text.split(' ')
+    position = rng.randrange(len(words))
+    edit = rng.choice(['add', 'drop', 'change'])
+    if edit == 'add' or len(words) < 2:
+        words.insert(position, rng.choice(EDITS))
+    elif edit == 'drop':
+        del words[position]
+    else:
+        words[position] = rng.choice(EDITS)
+    return ' '.join(words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure near-duplicate skip rate, speed and parity")
+    add_corpus_arguments(parser, docs=5000)
+    parser.add_argument('--duplicates', type=float, default=0.3, help='near-duplicates added per document')
+    parser.add_argument('--threshold', type=float, default=0.9, help='similarity at which documents match')
+    parser.add_argument('--batch-size', type=int, default=32, help='documents per get_entities_batch call')
+    parser.add_argument('--profile', default='fast')
+    parser.add_argument('--output', help='also write the result to this file')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    result = {'benchmark': 'dedup', 'environment': environment(), 'threshold': args.threshold, 'languages': {}}
+    records = get_corpus(args)
+    for language in sorted(set(record['language'] for record in records)):
+        documents = []
+        for record in records:
+            if record['language'] == language:
+                documents.append(record['text'])
+                if rng.random() < args.duplicates:
+                    documents.append(near_duplicate(rng, record['text']))
+
+        window = NearDuplicateWindow(threshold=args.threshold)
+        timings = {}
+        outputs = {}
+        for name, ibex in (('baseline', Ibex(language=language, profile=args.profile)),
+                           ('dedup', Ibex(language=language, profile=args.profile, dedup=window))):
+            ibex.get_entities_batch(documents[:args.batch_size], language)  # warm up
+            window.clear()
+            start_time = time.perf_counter()
+            outputs[name] = []
+            for start in range(0, len(documents), args.batch_size):
+                outputs[name].extend(ibex.get_entities_batch(documents[start:start + args.batch_size], language))
+            timings[name] = time.perf_counter() - start_time
+
+        stats = window.stats()
+        start_time = time.perf_counter()
+        for document in documents:
+            window.find((language, 'bench'), window.signature(document) or window.signature('a b c d e'))
+        lookup_seconds = time.perf_counter() - start_time
+
+        result['languages'][language] = {
+            'docs': len(documents),
+            'skip_rate': stats['skip_rate'],
+            'skipped': stats['skips'],
+            'docs_per_sec': {name: len(documents) / seconds for name, seconds in timings.items()},
+            'usec_per_lookup': lookup_seconds / len(documents) * 1e6,
+            'docs_with_other_entities': sum(set(a) != set(b) for a, b in zip(outputs['baseline'], outputs['dedup'])),
+        }
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
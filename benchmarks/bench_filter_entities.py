@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+#
+# Check Ibex.filter_entities against the per-entity Ibex.filter_entity, and time both
+#
+# Usage (with d3m_ibex installed): python benchmarks/bench_filter_entities.py [--input docs.txt] [--language english]
+#
+
+import argparse
+import json
+import time
+
+from d3m_ibex import Ibex
+from d3m_ibex.d3m_ibex import PARSERS, prep_texts
+
+from bench_profiles import load_documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time vectorized entity filtering")
+    parser.add_argument('--input', help='text file with one document per line (default: built-in samples)')
+    parser.add_argument('--language', default='english')
+    parser.add_argument('--docs', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    ibex = Ibex(language=args.language)
+    parser_name = ibex.load_parser(args.language)
+    documents = load_documents(args.input, args.language, args.docs)
+    docs = list(PARSERS[parser_name].pipe(prep_texts(documents), disable=ibex.disable))
+
+    def per_entity():
+        return [[ent for ent in doc.ents if not ibex.filter_entity(ent)] for doc in docs]
+
+    def vectorized():
+        return [ibex.filter_entities(doc) for doc in docs]
+
+    mismatches = sum(
+        [(ent.start, ent.end) for ent in expected] != [(ent.start, ent.end) for ent in actual]
+        for expected, actual in zip(per_entity(), vectorized()))
+
+    timings = {}
+    for name, function in [('filter_entity_sec', per_entity), ('filter_entities_sec', vectorized)]:
+        best = None
+        for _ in range(args.repeat):
+            start_time = time.time()
+            function()
+            elapsed_time = time.time() - start_time
+            best = elapsed_time if best is None else min(best, elapsed_time)
+        timings[name] = best
+
+    print(json.dumps({
+        'docs': len(docs),
+        'entities': sum(len(doc.ents) for doc in docs),
+        'mismatched_docs': mismatches,
+        'timings': timings,
+        'speedup': timings['filter_entity_sec'] / timings['filter_entities_sec'],
+    }, indent=2))
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+#
+# Accuracy and latency of language detection (d3m_ibex.langid) on a generated or
+# recorded corpus whose language fields are taken as the truth
+#
+# Usage (with d3m_ibex installed): python benchmarks/bench_langid.py [--corpus corpus.jsonl] [--docs 20000] [--max-chars 400] [--output result.json]
+#
+
+import argparse
+import json
+import time
+
+from d3m_ibex.langid import DEFAULT_MAX_CHARS, detect_language
+
+from corpus import add_corpus_arguments, environment, get_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure language detection accuracy and latency")
+    add_corpus_arguments(parser, docs=20000)
+    parser.add_argument('--max-chars', type=int, default=DEFAULT_MAX_CHARS, help='characters looked at per document')
+    parser.add_argument('--min-confidence', type=float, default=0.75, help='confidence at which detections are used')
+    parser.add_argument('--output', help='also write the result to this file')
+    args = parser.parse_args()
+
+    records = get_corpus(args)
+    latencies, confusion = [], {}
+    correct = confident = confident_correct = 0
+    for record in records:
+        start_time = time.perf_counter()
+        language, confidence = detect_language(record['text'], args.max_chars)
+        latencies.append(time.perf_counter() - start_time)
+
+        key = '%s->%s' % (record['language'], language)
+        confusion[key] = confusion.get(key, 0) + 1
+        correct += language == record['language']
+        if confidence >= args.min_confidence:
+            confident += 1
+            confident_correct += language == record['language']
+
+    latencies.sort()
+    usec = lambda fraction: latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1e6
+    result = {
+        'benchmark': 'langid',
+        'environment': environment(),
+        'docs': len(records),
+        'max_chars': args.max_chars,
+        'accuracy': correct / len(records),
+        # detections at or above min_confidence are the ones that route documents
+        'confident_fraction': confident / len(records),
+        'confident_accuracy': confident_correct / confident if confident else None,
+        'confusion': confusion,
+        'usec_per_doc': {
+            'mean': sum(latencies) / len(latencies) * 1e6,
+            'p50': usec(0.50),
+            'p99': usec(0.99),
+            'max': latencies[-1] * 1e6,
+        },
+    }
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
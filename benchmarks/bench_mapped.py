@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+#
+# Memory of several processes that each load a parser and parse a corpus, with the
+# parser in process memory and with its vectors and weights memory-mapped from a
+# shared directory (d3m_ibex.mapped). Reports per-process resident memory and the
+# proportional set size (PSS: shared pages split between the processes mapping them)
+# summed over the processes, which is what they take from the host together, and
+# checks that mapped parsers find the same entities.
+#
+# Usage (with d3m_ibex installed, on Linux): python benchmarks/bench_mapped.py [--parser en_core_web_md] [--processes 4] [--mmap-dir /tmp/ibex-mmap] [--docs 500] [--output result.json]
+#
+
+import argparse
+import json
+import multiprocessing
+import tempfile
+
+from corpus import add_corpus_arguments, environment, get_corpus
+
+
+def get_memory(pid):
+    ''' resident and proportional set size of a process in bytes '''
+    memory = {}
+    with open('/proc/%d/smaps_rollup' % pid) as smaps:
+        for line in smaps:
+            fields = line.split()
+            if fields[0] in ('Rss:', 'Pss:'):
+                memory[fields[0][:-1].lower()] = int(fields[1]) * 1024
+    return memory
+
+
+def run(parser_name, mmap_dir, texts, ready, done, results):
+    ''' load a parser, parse texts, report the entities found and wait to be measured '''
+    from d3m_ibex.d3m_ibex import Ibex
+    from d3m_ibex.registry import REGISTRY
+    REGISTRY.configure({'bench': parser_name}, mmap_dir=mmap_dir)
+    entities = Ibex(language='bench', profile='fast').get_entities_batch(texts, 'bench')
+    results.put(entities)
+    ready.release()
+    done.wait()
+
+
+def measure(parser_name, mmap_dir, texts, n_processes):
+    context = multiprocessing.get_context('spawn')
+    ready, done, results = context.Semaphore(0), context.Event(), context.Queue()
+    processes = [context.Process(target=run, args=(parser_name, mmap_dir, texts, ready, done, results))
+                 for _ in range(n_processes)]
+    for process in processes:
+        process.start()
+    entities = [results.get() for _ in processes]
+    for _ in processes:
+        ready.acquire()
+    memory = [get_memory(process.pid) for process in processes]
+    done.set()
+    for process in processes:
+        process.join()
+    return {
+        'rss_mb_per_process': sum(m['rss'] for m in memory) / len(memory) / 2**20,
+        'pss_mb_total': sum(m['pss'] for m in memory) / 2**20,
+    }, entities[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the memory of processes with and without memory-mapped parsers")
+    add_corpus_arguments(parser, docs=500)
+    parser.add_argument('--parser', default='en_core_web_md', help='spacy model package or directory')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--mmap-dir', help='directory of mapped arrays (default: a temporary one)')
+    parser.add_argument('--output', help='also write the result to this file')
+    args = parser.parse_args()
+
+    texts = [record['text'] for record in get_corpus(args)]
+    mmap_dir = args.mmap_dir or tempfile.mkdtemp(prefix='ibex-mmap-')
+    # the first run exports the arrays, so the mapped run is measured on a warm directory
+    measure(args.parser, mmap_dir, texts[:10], 1)
+    in_memory, expected = measure(args.parser, None, texts, args.processes)
+    mapped, entities = measure(args.parser, mmap_dir, texts, args.processes)
+
+    result = {
+        'benchmark': 'mapped',
+        'environment': environment(),
+        'parser': args.parser,
+        'processes': args.processes,
+        'docs': len(texts),
+        'in_memory': in_memory,
+        'mapped': mapped,
+        'pss_saved_mb': in_memory['pss_mb_total'] - mapped['pss_mb_total'],
+        'same_entities': [set(doc) for doc in entities] == [set(doc) for doc in expected],
+    }
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
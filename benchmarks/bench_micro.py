@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+#
+# Micro-benchmarks of the extraction stages: prep_text, entity filtering and
+# get_entities, per language, on a generated or recorded corpus
+#
+# Usage (with d3m_ibex installed): python benchmarks/bench_micro.py [--corpus corpus.jsonl] [--docs 2000] [--profile fast] [--output result.json]
+#
+
+import argparse
+import json
+import time
+
+from d3m_ibex import Ibex
+from d3m_ibex.d3m_ibex import PARSERS, PROFILES, prep_text, prep_texts
+
+from corpus import add_corpus_arguments, environment, get_corpus
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        elapsed_time = time.perf_counter() - start_time
+        best = elapsed_time if best is None else min(best, elapsed_time)
+    return best
+
+
+def bench_language(language, documents, profile, repeat):
+    ''' best-of-`repeat` time of each operation over all documents of a language '''
+    ibex = Ibex(language=language, profile=profile)
+    ibex.warmup([language])
+    parser = PARSERS[ibex.parser_name]
+    docs = list(parser.pipe(prep_texts(documents), disable=ibex.disable))
+
+    operations = {
+        'prep_text': lambda: [prep_text(document) for document in documents],
+        'prep_texts': lambda: prep_texts(documents),
+        'filter_entity': lambda: [[ent for ent in doc.ents if not ibex.filter_entity(ent)] for doc in docs],
+        'filter_entities': lambda: [ibex.filter_entities(doc) for doc in docs],
+        'get_entities': lambda: [ibex.get_entities(document, language) for document in documents],
+        'get_entities_batch': lambda: ibex.get_entities_batch(documents, language),
+    }
+    results = {}
+    for name, operation in operations.items():
+        # parsing dominates and is slow, so get_entities is timed once
+        elapsed_time = best_time(operation, 1 if name.startswith('get_entities') else repeat)
+        results[name] = {
+            'seconds': elapsed_time,
+            'docs_per_sec': len(documents) / elapsed_time,
+            'usec_per_doc': elapsed_time / len(documents) * 1e6,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time prep_text, entity filtering and get_entities")
+    add_corpus_arguments(parser, docs=2000)
+    parser.add_argument('--profile', default='fast', choices=sorted(PROFILES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='also write the result to this file')
+    args = parser.parse_args()
+
+    by_language = {}
+    for record in get_corpus(args):
+        by_language.setdefault(record['language'], []).append(record['text'])
+
+    result = {
+        'benchmark': 'micro',
+        'environment': environment(),
+        'profile': args.profile,
+        'docs': {language: len(documents) for language, documents in by_language.items()},
+        'chars': {language: sum(map(len, documents)) for language, documents in by_language.items()},
+        'languages': {language: bench_language(language, documents, args.profile, args.repeat)
+                      for language, documents in by_language.items()},
+    }
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+#
+# Check prep_text/prep_texts against the original multi-pass implementation on randomly
+# generated documents, then time both on long email bodies and on batches of tweets
+#
+# Usage (with d3m_ibex installed): python benchmarks/bench_prep_text.py [--cases 100000] [--seed 0]
+#
+
+import argparse
+import json
+import random
+import re
+import time
+
+from d3m_ibex.d3m_ibex import prep_text, prep_texts
+
+# the original prep_text: one regex pass per filter, in dict order, then a pass
+# collapsing the spaces
+REFERENCE_FILTERS = [
+    (re.compile(r'RT @\w+'), ''),  # retweet (filter before removing mentions)
+    (re.compile(r'https?://\S+'), ''),  # uri
+    (re.compile(r'#\w*'), ''),  # hashtag
+    (re.compile(r'@\w*'), ''),  # mention
+    (re.compile(r'\s'), ' '),  # whitespace [ \t\n\r\f\v]
+]
+REFERENCE_SPACES = re.compile('  +')
+
+def reference_prep_text(text):
+    for regex, replacement in REFERENCE_FILTERS:
+        text = regex.sub(replacement, text)
+    return REFERENCE_SPACES.sub(' ', text)
+
+# building blocks of generated documents, including fragments that are only
+# meaningful when glued to their neighbours ('#tag' + 'https://..', 'R' + 'T @')
+TOKENS = ['word', 'Madrid', 'ñandú', 'Ünïcödé', '¿Qué?', 'RT @bob', 'RT', 'R', 'T', '@', '#',
+          '@ana', '#tag', '#tag_2', 'http://x.co/a?b=1', 'https://t.co/Zz', 'http', 'https:', '://',
+          '/', '.', ',', ':', '\n', '\t', '\r\n', '\xa0', '\x1c', '\x00', ' ', '  ']
+SEPARATORS = ['', ' ', ' ', '\n']
+
+
+def random_document(rng, max_tokens=12):
+    tokens = [rng.choice(TOKENS) + rng.choice(SEPARATORS) for _ in range(rng.randint(0, max_tokens))]
+    return ''.join(tokens)
+
+
+def check_equivalence(cases, seed):
+    rng = random.Random(seed)
+    mismatches = []
+    batch = []
+    for _ in range(cases):
+        text = random_document(rng)
+        if prep_text(text) != reference_prep_text(text):
+            mismatches.append(text)
+        batch.append(text)
+    if prep_texts(batch) != [reference_prep_text(text) for text in batch]:
+        mismatches.append('<batch>')
+    # prep_texts preps a batch with a NUL in it one document at a time; without, joined
+    batch = [text for text in batch if '\x00' not in text]
+    if prep_texts(batch) != [reference_prep_text(text) for text in batch]:
+        mismatches.append('<joined batch>')
+    return mismatches
+
+
+def email_body(rng, n_words):
+    words = ['the', 'meeting', 'with', 'Madrid', 'Barack Obama', 'report,', 'España.', '@ana',
+             '#budget', 'https://example.com/a/b?c=d', 'RT @bob', '\n', '\n\n', '>', 'Thanks,']
+    return ' '.join(rng.choice(words) for _ in range(n_words))
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start_time = time.time()
+        function()
+        elapsed_time = time.time() - start_time
+        best = elapsed_time if best is None else min(best, elapsed_time)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time prep_text against the original implementation")
+    parser.add_argument('--cases', type=int, default=100000, help='random documents to compare')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--email-words', type=int, default=200000, help='words in the long email body')
+    parser.add_argument('--tweets', type=int, default=10000, help='documents in the tweet batch')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    mismatches = check_equivalence(args.cases, args.seed)
+
+    rng = random.Random(args.seed)
+    email = email_body(rng, args.email_words)
+    tweets = [random_document(rng, 20).replace('\x00', '') for _ in range(args.tweets)]
+    timings = {
+        'email_reference_sec': best_time(lambda: reference_prep_text(email), args.repeat),
+        'email_prep_text_sec': best_time(lambda: prep_text(email), args.repeat),
+        'tweets_reference_sec': best_time(lambda: [reference_prep_text(tweet) for tweet in tweets], args.repeat),
+        'tweets_prep_text_sec': best_time(lambda: [prep_text(tweet) for tweet in tweets], args.repeat),
+        'tweets_prep_texts_sec': best_time(lambda: prep_texts(tweets), args.repeat),
+    }
+
+    print(json.dumps({
+        'cases': args.cases,
+        'mismatches': len(mismatches),
+        'mismatch_examples': mismatches[:10],
+        'email_chars': len(email),
+        'tweets': len(tweets),
+        'timings': timings,
+        'email_speedup': timings['email_reference_sec'] / timings['email_prep_text_sec'],
+        'tweets_speedup': timings['tweets_reference_sec'] / timings['tweets_prep_texts_sec'],
+    }, indent=2))
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
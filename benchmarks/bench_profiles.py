@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#
+# Compare Ibex extraction profiles (see d3m_ibex.PROFILES) for speed and entity parity
+#
+# Usage (with d3m_ibex installed): python benchmarks/bench_profiles.py [--input docs.txt] [--language english] [--repeat 3]
+#
+
+import argparse
+import json
+import time
+
+from d3m_ibex import Ibex
+from d3m_ibex.d3m_ibex import PROFILES, WARMUP_TEXT
+
+SAMPLE_DOCS = {
+    'english': [
+        'The Trump administration struggled on Monday to defend its policy of separating parents from their sons and daughters at the southern US border amid growing national outrage.',
+        'RT @nytimes: Apple and Google face new scrutiny from the European Commission in Brussels https://t.co/abc #tech',
+        'Angela Merkel and Emmanuel Macron met in Paris to discuss the future of the European Union and NATO.',
+    ],
+    'spanish': [
+        'El Comité de Ética, Control y Disciplina de la UEFA multó este jueves con 20.000 euros a Cristiano Ronaldo, delantero de la Juventus.',
+        'RT @elpais: Pedro Sánchez se reunió con Angela Merkel en Berlín https://t.co/xyz #política',
+        'El Real Madrid ganó al Atlético de Madrid en el estadio Santiago Bernabéu.',
+    ],
+}
+
+
+def load_documents(path, language, n_docs):
+    if path:
+        with open(path) as input_file:
+            documents = [line.strip() for line in input_file if line.strip()]
+    else:
+        documents = SAMPLE_DOCS.get(language, SAMPLE_DOCS['english']) + [WARMUP_TEXT.get(language, WARMUP_TEXT['english'])]
+    return (documents * (n_docs // len(documents) + 1))[:n_docs]
+
+
+def run_profile(profile, documents, language, repeat):
+    ''' best-of-`repeat` docs/sec of a profile, and the entities it extracted '''
+    ibex = Ibex(language=language, profile=profile)
+    ibex.warmup([language])
+    best = None
+    for _ in range(repeat):
+        start_time = time.time()
+        entities = ibex.get_entities_batch(documents, language)
+        elapsed_time = time.time() - start_time
+        best = elapsed_time if best is None else min(best, elapsed_time)
+    return len(documents) / best, entities
+
+
+def parity(reference, candidate):
+    ''' fraction of documents with identical entity sets, and mean Jaccard similarity '''
+    exact, jaccard = 0, 0.0
+    for expected, actual in zip(reference, candidate):
+        expected, actual = set(expected), set(actual)
+        exact += expected == actual
+        union = expected | actual
+        jaccard += len(expected & actual) / len(union) if union else 1.0
+    return exact / len(reference), jaccard / len(reference)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Ibex extraction profiles for speed and entity parity")
+    parser.add_argument('--input', help='text file with one document per line (default: built-in samples)')
+    parser.add_argument('--language', default='english')
+    parser.add_argument('--docs', type=int, default=1000, help='number of documents to parse per run')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    documents = load_documents(args.input, args.language, args.docs)
+    reference_speed, reference = run_profile('full', documents, args.language, args.repeat)
+    results = {'language': args.language, 'docs': len(documents), 'profiles': {}}
+    for profile in PROFILES:
+        speed, entities = (reference_speed, reference) if profile == 'full' else \
+            run_profile(profile, documents, args.language, args.repeat)
+        exact, jaccard = parity(reference, entities)
+        results['profiles'][profile] = {
+            'docs_per_sec': speed,
+            'speedup': speed / reference_speed,
+            'exact_match': exact,
+            'mean_jaccard': jaccard,
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+#
+# Import-time budget check: imports a module in a fresh interpreter under
+# `python -X importtime`, reports its cumulative import time and heaviest imports as
+# JSON, and exits with status 1 when it is over --budget-ms or imports a --forbid
+# module. tests/test_import_time.py runs the same check with the test suite; this
+# script reports where the time goes.
+#
+# Usage (from the repository root): python benchmarks/check_import_time.py [--module ibex_server] [--budget-ms 400] [--forbid spacy,nltk,flask,pandas] [--repeat 3] [--output result.json]
+#
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from corpus import environment
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def import_times(module):
+    ''' self and cumulative import time in microseconds of each module imported by
+    `import module` in a fresh interpreter, in import order '''
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+                             cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        raise Exception('importing %s failed:\n%s' % (module, process.stderr[-2000:]))
+
+    times = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail when importing a module takes too long or pulls in heavy dependencies")
+    parser.add_argument('--module', default='ibex_server')
+    parser.add_argument('--budget-ms', type=float, default=400, help='maximum cumulative import time, best of --repeat')
+    parser.add_argument('--forbid', default='spacy,thinc,nltk,flask,pandas',
+                        help='comma-separated modules that must not be imported')
+    parser.add_argument('--repeat', type=int, default=3, help='imports timed, the fastest one counts')
+    parser.add_argument('--top', type=int, default=10, help='heaviest imports listed')
+    parser.add_argument('--output', help='also write the result to this file')
+    args = parser.parse_args()
+
+    best = None
+    for _ in range(args.repeat):
+        times = import_times(args.module)
+        total = sum(cumulative for name, _, cumulative in times if name == args.module)
+        if best is None or total < best[0]:
+            best = (total, times)
+    total, times = best
+
+    forbidden = set(name.strip() for name in args.forbid.split(',') if name.strip())
+    imported = sorted(set(name for name, _, _ in times if name.split('.')[0] in forbidden))
+    # top-level packages, by the cumulative time of their first import
+    packages = {}
+    for name, _, cumulative in times:
+        if '.' not in name:
+            packages[name] = max(packages.get(name, 0), cumulative)
+    heaviest = sorted(packages.items(), key=lambda item: -item[1])[:args.top]
+
+    result = {
+        'benchmark': 'import_time',
+        'environment': environment(),
+        'module': args.module,
+        'import_ms': total / 1000.0,
+        'budget_ms': args.budget_ms,
+        'modules_imported': len(times),
+        'forbidden_imported': imported,
+        'heaviest_ms': {name: cumulative / 1000.0 for name, cumulative in heaviest},
+        'ok': total / 1000.0 <= args.budget_ms and not imported,
+    }
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    if not result['ok']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+#
+# Synthetic tweet-like and email-like documents in English and Spanish for the
+# benchmarks, and loading of recorded corpora (JSONL with text and language fields,
+# or plain text with one document per line)
+#
+# Usage: python benchmarks/corpus.py [--docs 10000] [--kinds tweet,email] [--languages english,spanish] [--seed 0] > corpus.jsonl
+#
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+
+VOCABULARY = {
+    'english': {
+        'people': ['Barack Obama', 'Angela Merkel', 'Emmanuel Macron', 'Theresa May', 'Elon Musk', 'Serena Williams', 'John Smith'],
+        'places': ['Washington', 'Berlin', 'Paris', 'London', 'New York', 'Texas', 'the southern US border'],
+        'orgs': ['the European Union', 'NATO', 'Apple', 'Google', 'the United Nations', 'the FBI', 'Goldman Sachs'],
+        'verbs': ['met', 'criticized', 'praised', 'called', 'visited', 'sued', 'announced a deal with'],
+        'times': ['on Monday', 'last week', 'this morning', 'in 2018', 'yesterday', 'after the summit'],
+        'filler': ['amid growing outrage', 'according to a report', 'despite the protests', 'in a statement',
+                   'for the first time', 'as markets fell'],
+        'greetings': ['Hi team,', 'Dear John,', 'Hello all,', 'Good morning,'],
+        'closings': ['Thanks,', 'Best regards,', 'Cheers,', 'Sincerely,'],
+        'quote': 'On Monday, {person} wrote:',
+    },
+    'spanish': {
+        'people': ['Pedro Sánchez', 'Cristiano Ronaldo', 'Angela Merkel', 'Mariano Rajoy', 'Lionel Messi', 'Felipe VI', 'Ana Botín'],
+        'places': ['Madrid', 'Barcelona', 'Berlín', 'Sevilla', 'México', 'Buenos Aires', 'el estadio Santiago Bernabéu'],
+        'orgs': ['la UEFA', 'la Juventus', 'el Real Madrid', 'la Unión Europea', 'el Banco Santander', 'el Gobierno', 'la OTAN'],
+        'verbs': ['se reunió con', 'criticó a', 'elogió a', 'llamó a', 'visitó', 'demandó a', 'firmó un acuerdo con'],
+        'times': ['el lunes', 'la semana pasada', 'esta mañana', 'en 2018', 'ayer', 'tras la cumbre'],
+        'filler': ['en medio de la polémica', 'según un informe', 'pese a las protestas', 'en un comunicado',
+                   'por primera vez', 'mientras caían los mercados'],
+        'greetings': ['Hola a todos,', 'Estimado Juan,', 'Buenos días,', 'Hola equipo,'],
+        'closings': ['Gracias,', 'Saludos,', 'Un abrazo,', 'Atentamente,'],
+        'quote': 'El lunes, {person} escribió:',
+    },
+}
+
+HASHTAGS = ['#news', '#politics', '#breaking', '#futbol', '#economía', '#tech']
+HANDLES = ['@nytimes', '@elpais', '@reuters', '@ana', '@bob_smith', '@marca']
+
+
+def sentence(rng, words):
+    subject = rng.choice(words['people'] + words['orgs'])
+    target = rng.choice(words['people'] + words['places'] + words['orgs'])
+    parts = [subject, rng.choice(words['verbs']), target]
+    if rng.random() < 0.6:
+        parts.append(rng.choice(words['times']))
+    if rng.random() < 0.5:
+        parts.append(rng.choice(words['filler']))
+    text = ' '.join(parts)
+    return text[0].upper() + text[1:] + rng.choice(['.', '.', '.', '!', '?'])
+
+
+def tweet(rng, language):
+    ''' a sentence or two with retweet markers, mentions, hashtags and links '''
+    words = VOCABULARY[language]
+    parts = []
+    if rng.random() < 0.3:
+        parts.append('RT %s:' % rng.choice(HANDLES))
+    parts.extend(sentence(rng, words) for _ in range(rng.randint(1, 2)))
+    for _ in range(rng.randint(0, 3)):
+        parts.insert(rng.randint(0, len(parts)), rng.choice(HASHTAGS + HANDLES))
+    if rng.random() < 0.5:
+        parts.append('https://t.co/%x' % rng.getrandbits(32))
+    return ' '.join(parts)
+
+
+def email(rng, language, paragraphs=None):
+    ''' a greeting, paragraphs of sentences, a closing, and sometimes a quoted reply '''
+    words = VOCABULARY[language]
+    lines = [rng.choice(words['greetings']), '']
+    for _ in range(paragraphs or rng.randint(1, 6)):
+        lines.append(' '.join(sentence(rng, words) for _ in range(rng.randint(2, 6))))
+        lines.append('')
+    lines.extend([rng.choice(words['closings']), rng.choice(words['people'])])
+    if rng.random() < 0.4:
+        lines.extend(['', words['quote'].format(person=rng.choice(words['people']))])
+        lines.extend('> ' + sentence(rng, words) for _ in range(rng.randint(1, 4)))
+    return '\n'.join(lines)
+
+
+GENERATORS = {'tweet': tweet, 'email': email}
+
+
+def generate(n_docs, kinds=('tweet', 'email'), languages=('english', 'spanish'), seed=0):
+    ''' `n_docs` synthetic documents as {'text', 'language', 'kind'} records, the same
+    for the same arguments '''
+    rng = random.Random(seed)
+    records = []
+    for _ in range(n_docs):
+        kind, language = rng.choice(kinds), rng.choice(languages)
+        records.append({'text': GENERATORS[kind](rng, language), 'language': language, 'kind': kind})
+    return records
+
+
+def load_corpus(path, language='english'):
+    ''' records of a recorded corpus: JSONL records with a 'text' field (and optionally
+    'language'), or plain text with one document per line '''
+    records = []
+    with open(path, encoding='utf-8') as corpus_file:
+        for line in corpus_file:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line) if line.startswith('{') else {'text': line}
+            record.setdefault('language', language)
+            records.append(record)
+    return records
+
+
+def get_corpus(args):
+    ''' the corpus selected by the --corpus, --docs, --kinds, --languages and --seed
+    arguments of a benchmark '''
+    if getattr(args, 'corpus', None):
+        records = load_corpus(args.corpus)
+        return (records * (args.docs // len(records) + 1))[:args.docs]
+    return generate(args.docs, args.kinds.split(','), args.languages.split(','), args.seed)
+
+
+def add_corpus_arguments(parser, docs=10000):
+    parser.add_argument('--corpus', help='recorded corpus to use instead of generated documents')
+    parser.add_argument('--docs', type=int, default=docs, help='number of documents')
+    parser.add_argument('--kinds', default='tweet,email', help='comma-separated kinds of generated documents')
+    parser.add_argument('--languages', default='english,spanish', help='comma-separated languages of generated documents')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def environment():
+    ''' what a result was measured on, so results can be compared across commits '''
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    try:
+        import spacy
+        spacy_version = spacy.__version__
+    except ImportError:
+        spacy_version = None
+    return {'commit': commit, 'python': platform.python_version(), 'spacy': spacy_version, 'machine': platform.machine()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic benchmark corpus as JSONL")
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+    for record in get_corpus(args):
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+#
+# Load generator for the gRPC Extract endpoint: sends documents from a generated or
+# recorded corpus at a fixed concurrency and reports throughput, latency percentiles,
+# server memory and, from its /metrics endpoint, the mean batch size and cache hit
+# ratio as JSON. The corpus is cycled through with a unique word added to each
+# request, so repeats are parsed rather than served from the server's entity cache
+# (--repeat-texts sends them unchanged).
+#
+# Usage (from the repository root, with the server running):
+#   python benchmarks/load_grpc.py [--target localhost:50053] [--concurrency 8] [--duration 30] [--metrics-url http://localhost:50054/metrics] [--output result.json]
+#
+
+import argparse
+import itertools
+import json
+import os
+import random
+import string
+import sys
+import threading
+import time
+import urllib.request
+
+import grpc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import grapevine_pb2
+import grapevine_pb2_grpc
+
+from corpus import add_corpus_arguments, environment, get_corpus
+
+LANGUAGE_CODES = {'english': 'en', 'spanish': 'es'}
+
+
+def percentile(values, fraction):
+    ''' nearest-rank percentile of sorted values '''
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def server_rss(args):
+    ''' resident memory of the server in bytes: read from /proc with --server-pid, or
+    scraped from its /metrics endpoint with --metrics-url '''
+    if args.server_pid:
+        with open('/proc/%d/status' % args.server_pid) as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    if args.metrics_url:
+        try:
+            with urllib.request.urlopen(args.metrics_url, timeout=5) as response:
+                for line in response.read().decode('utf-8').splitlines():
+                    if line.startswith('ibex_process_resident_memory_bytes '):
+                        return int(float(line.split()[1]))
+        except OSError:
+            return None
+    return None
+
+
+def scrape_metrics(args):
+    ''' samples of the server /metrics endpoint, by name with labels (e.g.
+    'ibex_cache_lookups_total{result="hits"}'), or an empty dict without --metrics-url '''
+    samples = {}
+    if not args.metrics_url:
+        return samples
+    try:
+        with urllib.request.urlopen(args.metrics_url, timeout=5) as response:
+            for line in response.read().decode('utf-8').splitlines():
+                if line and not line.startswith('#'):
+                    name, value = line.rsplit(None, 1)
+                    samples[name] = float(value)
+    except OSError:
+        pass
+    return samples
+
+
+def increase(before, after, name, labels=''):
+    ''' increase between two scrapes of the samples of a metric, summed over the
+    samples whose labels contain `labels` '''
+    return sum(value - before.get(sample, 0) for sample, value in after.items()
+               if sample.split('{')[0] == name and labels in sample)
+
+
+def mean_batch_size(before, after):
+    ''' documents per get_entities_batch call on the server between two scrapes '''
+    batches = increase(before, after, 'ibex_batch_size_count')
+    if batches <= 0:
+        return None
+    return increase(before, after, 'ibex_batch_size_sum') / batches
+
+
+def cache_hit_ratio(before, after):
+    ''' fraction of entity cache lookups on the server between two scrapes that hit '''
+    lookups = increase(before, after, 'ibex_cache_lookups_total')
+    if lookups <= 0:
+        return None
+    return (increase(before, after, 'ibex_cache_lookups_total', 'result="hits"') +
+            increase(before, after, 'ibex_cache_lookups_total', 'result="disk_hits"')) / lookups
+
+
+def make_unique(message, rng):
+    ''' copy of a message with a random lowercase word added, so the server parses it
+    again instead of answering from its entity cache '''
+    nonce = ''.join(rng.choice(string.ascii_lowercase) for _ in range(10))
+    return grapevine_pb2.Message(text='%s %s' % (message.text, nonce), language=message.language)
+
+
+def worker(stub, messages, deadline, latencies, errors, lock, timeout, unique):
+    ''' send messages one at a time until the deadline or the messages run out '''
+    rng = random.Random()
+    while time.time() < deadline:
+        with lock:
+            message = next(messages, None)
+        if message is None:
+            return
+        if unique:
+            message = make_unique(message, rng)
+        start_time = time.perf_counter()
+        try:
+            stub.Extract(message, timeout=timeout)
+        except grpc.RpcError as error:
+            with lock:
+                errors[error.code().name] = errors.get(error.code().name, 0) + 1
+            continue
+        elapsed_time = time.perf_counter() - start_time
+        with lock:
+            latencies.append(elapsed_time)
+
+
+def run(stub, messages, concurrency, duration, max_requests, timeout, unique=True):
+    ''' cycle through messages from `concurrency` threads for `duration` seconds or
+    `max_requests` requests, each made unique with `unique`. Returns the elapsed time,
+    sorted latencies and error counts. '''
+    messages = itertools.cycle(messages)
+    if max_requests is not None:
+        messages = itertools.islice(messages, max_requests)
+    latencies, errors, lock = [], {}, threading.Lock()
+    deadline = time.time() + duration
+    threads = [threading.Thread(target=worker, args=(stub, messages, deadline, latencies, errors, lock, timeout, unique))
+               for _ in range(concurrency)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start_time, sorted(latencies), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the gRPC Extract endpoint and report throughput and latency")
+    add_corpus_arguments(parser, docs=5000)
+    parser.add_argument('--target', default='localhost:50053')
+    parser.add_argument('--concurrency', type=int, default=8, help='requests in flight')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run for')
+    parser.add_argument('--requests', type=int, help='stop after this many requests')
+    parser.add_argument('--warmup', type=float, default=2, help='seconds of unmeasured requests first')
+    parser.add_argument('--timeout', type=float, default=30, help='per-request deadline in seconds')
+    parser.add_argument('--repeat-texts', action='store_true',
+                        help='send corpus texts unchanged, so repeats may be served from the server cache')
+    parser.add_argument('--metrics-url', help='server /metrics endpoint to read its memory from')
+    parser.add_argument('--server-pid', type=int, help='server process id to read its memory from (same host)')
+    parser.add_argument('--output', help='also write the result to this file')
+    args = parser.parse_args()
+
+    records = get_corpus(args)
+    messages = [grapevine_pb2.Message(text=record['text'], language=LANGUAGE_CODES.get(record['language'], 'en'))
+                for record in records]
+
+    channel = grpc.insecure_channel(args.target)
+    grpc.channel_ready_future(channel).result(timeout=60)
+    stub = grapevine_pb2_grpc.ExtractorStub(channel)
+
+    if args.warmup:
+        run(stub, messages, args.concurrency, args.warmup, None, args.timeout, not args.repeat_texts)
+    rss_before, metrics_before = server_rss(args), scrape_metrics(args)
+    elapsed_time, latencies, errors = run(stub, messages, args.concurrency, args.duration, args.requests, args.timeout,
+                                          not args.repeat_texts)
+    rss_after, metrics_after = server_rss(args), scrape_metrics(args)
+
+    ms = lambda seconds: seconds * 1000 if seconds is not None else None
+    result = {
+        'benchmark': 'load_grpc',
+        'environment': environment(),
+        'target': args.target,
+        'concurrency': args.concurrency,
+        'unique_texts': not args.repeat_texts,
+        'seconds': elapsed_time,
+        'requests': len(latencies),
+        'errors': errors,
+        'docs_per_sec': len(latencies) / elapsed_time,
+        'latency_ms': {
+            'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': ms(percentile(latencies, 0.50)),
+            'p95': ms(percentile(latencies, 0.95)),
+            'p99': ms(percentile(latencies, 0.99)),
+            'max': ms(latencies[-1]) if latencies else None,
+        },
+        'server_rss_bytes': {'before': rss_before, 'after': rss_after},
+        # with batching on, concurrent Extract calls are parsed together (--metrics-url)
+        'server_mean_batch_size': mean_batch_size(metrics_before, metrics_after),
+        # near 0 unless --repeat-texts; a high ratio means the cache was measured, not parsing
+        'server_cache_hit_ratio': cache_hit_ratio(metrics_before, metrics_after),
+    }
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
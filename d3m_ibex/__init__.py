@@ -1,7 +1,14 @@
-from d3m_ibex.d3m_ibex import Ibex
-
 __version__ = '1.1.2'
 
 __all__ = [
           'Ibex'
-          ]
\ No newline at end of file
+          ]
+
+
+def __getattr__(name):
+    ''' import Ibex, and with it spacy, on first use rather than with the package, so
+    modules like d3m_ibex.metrics load without it '''
+    if name == 'Ibex':
+        from d3m_ibex.d3m_ibex import Ibex
+        return Ibex
+    raise AttributeError("module 'd3m_ibex' has no attribute %r" % name)
@@ -0,0 +1,119 @@
+''' Dynamic micro-batching of concurrently submitted documents '''
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger('d3m_ibex')
+
+_STOP = object() # sentinel telling a batching thread to exit
+
+
+class MicroBatcher():
+    ''' Queues documents submitted concurrently (e.g. by unary RPC handlers) per
+    language and hands them to `process_batch(documents, language)` in batches.
+    A batch is flushed once it holds `max_batch_size` documents or `max_wait_ms`
+    have passed since its first document was queued, trading a bounded amount of
+    latency for parsing many documents in one nlp.pipe call.
+
+    `submit` raises queue.Full when `max_queue_depth` documents of a language are
+    already waiting, so callers can shed load instead of queueing without limit.
+    '''
+
+    def __init__(self, process_batch, max_batch_size: int=32, max_wait_ms: float=5,
+                 max_queue_depth: int=1024, threads_per_language: int=1):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_depth = max_queue_depth
+        self.threads_per_language = threads_per_language
+
+        self.queues = {}
+        self.threads = []
+        self.lock = threading.Lock()
+
+
+    def submit(self, document: str, language: str='english'):
+        ''' queue a document for extraction. Returns a Future resolving to its entities '''
+        future = Future()
+        self.get_queue(language).put_nowait((document, future))
+        return future
+
+
+    def get_queue(self, language: str):
+        ''' return the queue for a language, starting its batching threads on first use '''
+        if language not in self.queues:
+            with self.lock:
+                if language not in self.queues:
+                    language_queue = queue.Queue(maxsize=self.max_queue_depth)
+                    for _ in range(self.threads_per_language):
+                        thread = threading.Thread(target=self.run, args=(language, language_queue), daemon=True)
+                        thread.start()
+                        self.threads.append((language_queue, thread))
+                    self.queues[language] = language_queue
+        return self.queues[language]
+
+
+    def queue_depth(self, language: str=None):
+        ''' number of documents waiting to be batched, for one or all languages '''
+        if language is not None:
+            return self.queues[language].qsize() if language in self.queues else 0
+        return sum(language_queue.qsize() for language_queue in self.queues.values())
+
+
+    def next_batch(self, language_queue):
+        ''' block for the first item of a batch, then top it up until it is full or
+        max_wait has passed. Returns None once the batcher is stopped. '''
+        item = language_queue.get()
+        if item is _STOP:
+            return None
+
+        batch = [item]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                item = language_queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # let this batch finish, then exit on the next call
+                language_queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+
+    def run(self, language: str, language_queue):
+        ''' batching thread: flush batches of a language through process_batch, fanning
+        results (or the exception) back out to the waiting futures '''
+        while True:
+            batch = self.next_batch(language_queue)
+            if batch is None:
+                return
+
+            documents = [document for document, _ in batch]
+            try:
+                results = self.process_batch(documents, language)
+            except Exception as ex:
+                logger.exception("Problem extracting a batch of %d %s documents", len(batch), language)
+                for _, future in batch:
+                    future.set_exception(ex)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+    def stop(self):
+        ''' stop all batching threads once queued documents are processed '''
+        with self.lock:
+            for language_queue, _ in self.threads:
+                language_queue.put(_STOP)
+            for _, thread in self.threads:
+                thread.join()
+            self.threads = []
+            self.queues = {}
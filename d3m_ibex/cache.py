@@ -0,0 +1,167 @@
+''' Cache of extracted entities keyed by preprocessed document text '''
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger('d3m_ibex')
+
+# expired rows are purged from the on-disk store once every this many writes
+_PURGE_EVERY = 10000
+
+
+class EntityCache():
+    ''' In-process LRU cache of entity lists with an optional time-to-live, for streams
+    where many documents are identical once prep_text has stripped retweet markers,
+    URLs, hashtags and mentions.
+
+    Keys combine the parser, the extraction profile and a hash of the prepped text (see
+    make_key); Ibex adds the version of its exclude list to the profile, so entries
+    go stale once the list is reloaded. At most `max_size` entries are kept in memory, least recently used
+    first out; entries older than `ttl` seconds are dropped (0 keeps them forever).
+    If `path` is given, entries are also written to an SQLite database there, which
+    outlives restarts and can be shared by several processes on a host; memory misses
+    fall back to it. Each thread reads and writes the database on a connection of its
+    own, outside the lock on the in-memory entries, so lookups do not queue behind
+    another thread's disk I/O.
+    '''
+
+    def __init__(self, max_size: int=100000, ttl: float=3600, path: str=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+
+        self.items = OrderedDict()  # key -> (expiry time, entities)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self.local = threading.local()  # SQLite connection of each thread
+        self.db_writes = 0
+
+
+    def __getstate__(self):
+        # locks and database connections do not survive pickling into a spawned process
+        state = self.__dict__.copy()
+        state.update(lock=None, local=None)
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+
+    @staticmethod
+    def make_key(parser_name: str, profile: str, text: str):
+        ''' cache key of a prepped document for a parser and extraction profile. Outer
+        whitespace, e.g. left behind where prep_text removed a leading 'RT @user', is
+        ignored. '''
+        digest = hashlib.sha1(text.strip().encode('utf-8')).hexdigest()
+        return '%s:%s:%s' % (parser_name, profile, digest)
+
+
+    def get(self, key: str):
+        ''' cached entities for a key, or None '''
+        now = time.time()
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None:
+                expires, entities = item
+                if not self.ttl or expires > now:
+                    self.items.move_to_end(key)
+                    self.hits += 1
+                    return list(entities)
+                del self.items[key]
+                self.expirations += 1
+            if not self.path:
+                self.misses += 1
+                return None
+
+        entities = self.db_get(key, now)
+        with self.lock:
+            if entities is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self.set_item(key, entities, now)
+        return list(entities)
+
+
+    def put(self, key: str, entities):
+        now = time.time()
+        with self.lock:
+            self.set_item(key, tuple(entities), now)
+        if self.path:
+            self.db_put(key, entities, now)
+
+
+    def set_item(self, key, entities, now):
+        self.items[key] = (now + self.ttl, entities)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+            self.evictions += 1
+
+
+    def get_db(self):
+        ''' SQLite connection of this thread, (re)opened lazily so forked workers get their own '''
+        db = getattr(self.local, 'db', None)
+        if db is None or self.local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS entities (key TEXT PRIMARY KEY, entities TEXT, expires REAL)')
+            self.local.db, self.local.pid = db, os.getpid()
+        return db
+
+
+    def db_get(self, key, now):
+        try:
+            row = self.get_db().execute('SELECT entities, expires FROM entities WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error:
+            logger.exception("Problem reading entity cache %s", self.path)
+            return None
+        if row is None or (self.ttl and row[1] <= now):
+            return None
+        return tuple(json.loads(row[0]))
+
+
+    def db_put(self, key, entities, now):
+        try:
+            db = self.get_db()
+            db.execute('INSERT OR REPLACE INTO entities VALUES (?, ?, ?)', (key, json.dumps(list(entities)), now + self.ttl))
+            self.db_writes += 1
+            if self.ttl and self.db_writes % _PURGE_EVERY == 0:
+                db.execute('DELETE FROM entities WHERE expires <= ?', (now,))
+        except sqlite3.Error:
+            logger.exception("Problem writing entity cache %s", self.path)
+
+
+    def stats(self):
+        ''' hit/miss/eviction counters and current size '''
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'size': len(self.items),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+        if self.path:
+            self.get_db().execute('DELETE FROM entities')
@@ -0,0 +1,311 @@
+''' ibex-extract: offline bulk entity extraction over JSONL, CSV and Parquet files '''
+import argparse
+import collections
+import csv
+import json
+import logging
+import os
+import sys
+import time
+
+from d3m_ibex.d3m_ibex import Ibex, LANGUAGES, PROFILES, DEFAULT_BATCH_SIZE
+from d3m_ibex.langid import LanguageRouter, ROUTING_MODES
+from d3m_ibex.registry import REGISTRY, parse_models
+
+logger = logging.getLogger('d3m_ibex')
+
+FORMATS = {
+    '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'jsonl',
+    '.csv': 'csv',
+    '.parquet': 'parquet', '.pq': 'parquet',
+}
+
+
+def get_format(path: str):
+    ''' input format from a file extension, jsonl for stdin '''
+    if path == '-':
+        return 'jsonl'
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise Exception('cannot tell the format of %s, pass --format' % path)
+    return FORMATS[extension]
+
+
+def read_jsonl(path: str, columns=None):
+    input_file = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    try:
+        for line in input_file:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+
+
+def read_csv(path: str, columns=None):
+    # email bodies easily exceed the default limit of 128KB per field
+    csv.field_size_limit(2**31 - 1)
+    with open(path, newline='', encoding='utf-8') as input_file:
+        for record in csv.DictReader(input_file):
+            yield record
+
+
+def read_parquet(path: str, columns=None, batch_size: int=10000):
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception('reading parquet files requires pyarrow (pip install d3m_ibex[parquet])')
+    parquet_file = pyarrow.parquet.ParquetFile(path)
+    if columns is not None:
+        columns = [column for column in columns if column in parquet_file.schema_arrow.names]
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        for record in batch.to_pylist():
+            yield record
+
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv, 'parquet': read_parquet}
+
+
+def read_records(path: str, input_format: str, columns=None, offset: int=0):
+    ''' stream the records of an input file as dicts, skipping the first `offset` '''
+    records = READERS[input_format](path, columns)
+    for index, record in enumerate(records):
+        if index >= offset:
+            yield index, record
+
+
+def get_language(record, language_field: str, default: str=None):
+    ''' language name of a record, from a language name or code in `language_field` '''
+    language = REGISTRY.get_language(str(record.get(language_field) or '')) if language_field else None
+    return language or default
+
+
+def batches(records, batch_size: int):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def read_checkpoint(path: str):
+    ''' (records done, bytes of output written) saved by write_checkpoint, or zeros '''
+    if not path or not os.path.exists(path):
+        return 0, 0
+    with open(path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    return checkpoint['offset'], checkpoint['output_bytes']
+
+
+def write_checkpoint(path: str, offset: int, output_bytes: int):
+    ''' atomically record that the first `offset` records are in the first
+    `output_bytes` bytes of the output '''
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as checkpoint_file:
+        json.dump({'offset': offset, 'output_bytes': output_bytes}, checkpoint_file)
+    os.replace(temp_path, path)
+
+
+class Extractor():
+    ''' extracts entities from batches of records, in this process or on a WorkerPool.
+    Up to `max_pending` batches are in flight on the pool; results come back in
+    input order. '''
+
+    def __init__(self, args):
+        self.args = args
+        self.pool = None
+        self.ibex = None
+        if args.processes > 1:
+            from d3m_ibex.workers import WorkerPool
+            self.pool = WorkerPool(args.processes, args.languages, profile=args.profile,
+                                   chunk_size=args.chunk_size).start()
+        else:
+            self.ibex = Ibex(profile=args.profile, chunk_size=args.chunk_size)
+            self.ibex.warmup(args.languages)
+        self.router = LanguageRouter(args.detect_language, args.min_confidence, default=args.language)
+        self.max_pending = 2 * args.processes
+        self.pending = collections.deque()
+
+
+    def submit(self, batch):
+        ''' start extracting a batch of (index, record) pairs. Returns the batches that
+        finished in the meantime, as lists of (index, record, language, entities). '''
+        args = self.args
+        texts = [str(record.get(args.text_field) or '') for _, record in batch]
+        languages = [self.router.route(text, get_language(record, args.language_field))
+                     for text, (_, record) in zip(texts, batch)]
+
+        by_language = {}
+        for i, language in enumerate(languages):
+            if texts[i].strip():
+                by_language.setdefault(language, []).append(i)
+
+        groups = []
+        for language, indices in by_language.items():
+            documents = [texts[i] for i in indices]
+            if self.pool is not None:
+                method = 'get_rich_entities_batch' if args.rich else 'get_entities_batch'
+                groups.append((indices, self.pool.submit(documents, language, method)))
+            else:
+                groups.append((indices, self.ibex.get_entities_batch(documents, language, batch_size=args.spacy_batch_size,
+                                                                     rich=args.rich)))
+        self.pending.append((batch, languages, groups))
+
+        done = []
+        while len(self.pending) > self.max_pending:
+            done.append(self.result(self.pending.popleft()))
+        return done
+
+
+    def drain(self):
+        ''' results of all batches still in flight '''
+        done = [self.result(pending) for pending in self.pending]
+        self.pending.clear()
+        return done
+
+
+    def result(self, pending):
+        batch, languages, groups = pending
+        entities = [[] for _ in batch]
+        for indices, group_entities in groups:
+            if self.pool is not None:
+                group_entities = group_entities.result()
+            for i, doc_entities in zip(indices, group_entities):
+                entities[i] = doc_entities
+        return [(index, record, language, doc_entities)
+                for (index, record), language, doc_entities in zip(batch, languages, entities)]
+
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.stop()
+
+
+def write_results(output, results, id_field: str):
+    for index, record, language, entities in results:
+        result = {'index': index}
+        if id_field:
+            result['id'] = record.get(id_field)
+        result['language'] = language
+        # RichEntity tuples are written as objects
+        result['entities'] = [entity._asdict() if hasattr(entity, '_asdict') else entity for entity in entities]
+        output.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(prog='ibex-extract',
+        description="Extract named entities from the records of a JSONL, CSV or Parquet file, "
+                    "writing one JSON line per record")
+    parser.add_argument('input', help="input file, or - for JSONL on stdin")
+    parser.add_argument('-o', '--output', default='-', help="output JSONL file (default: stdout)")
+    parser.add_argument('--format', choices=sorted(READERS), help="input format (default: from the file extension)")
+    parser.add_argument('--text-field', default='text', help="field holding the document text")
+    parser.add_argument('--language-field', default='language',
+                        help="field holding the language name or code of a record; empty to use --language for all")
+    parser.add_argument('--id-field', default='id', help="field copied to the output as id; empty to leave out")
+    parser.add_argument('--language', default='english',
+                        help="language of records without a (supported) language field, when it is not detected")
+    parser.add_argument('--detect-language', default='missing', choices=ROUTING_MODES,
+                        help="detect the language of records from their text: only of those without a (supported) "
+                             "language field, of all records, or of none")
+    parser.add_argument('--min-confidence', type=float, default=0.75,
+                        help="detections less confident than this (0.5 to 1) leave the given language")
+    parser.add_argument('--languages', help="comma-separated languages whose parsers are loaded up front (default: all)")
+    parser.add_argument('--models', default=','.join(LANGUAGES),
+                        help="comma-separated supported languages, each as language (for its default parser) or "
+                             "language:parser, e.g. english,spanish,french:fr_core_news_md")
+    parser.add_argument('--memory-budget-mb', type=float, default=0,
+                        help="evict least recently used parsers beyond this much memory, per process (0: never)")
+    parser.add_argument('--max-vocab-growth', type=int, default=1000000,
+                        help="reload a parser once its vocab has grown by this many strings (0: never)")
+    parser.add_argument('--mmap-dir', help="memory-map parser vectors and weights from this directory, "
+                                           "exporting them there on first use, so processes share one copy")
+    parser.add_argument('--profile', default='fast', choices=sorted(PROFILES))
+    parser.add_argument('--batch-size', type=int, default=1000, help="records read and extracted per batch")
+    parser.add_argument('--spacy-batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="documents per nlp.pipe batch")
+    parser.add_argument('--rich', action='store_true',
+                        help="write entities as objects with their label, offsets and count instead of strings")
+    parser.add_argument('--chunk-size', type=int, default=None, help="parse documents longer than this in chunks")
+    parser.add_argument('--processes', type=int, default=1, help="worker processes parsing batches")
+    parser.add_argument('--checkpoint', help="file recording progress after each batch (default: OUTPUT.checkpoint)")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue from the checkpoint, truncating output written after it")
+    parser.add_argument('--progress-seconds', type=float, default=10.0, help="seconds between progress reports")
+    args = parser.parse_args(argv)
+
+    try:
+        REGISTRY.configure(parse_models(args.models), memory_budget=int(args.memory_budget_mb * 2**20) or None,
+                           max_vocab_growth=args.max_vocab_growth or None, mmap_dir=args.mmap_dir)
+    except Exception as ex:
+        parser.error(str(ex))
+    if args.language not in LANGUAGES:
+        parser.error('--language must be one of %s' % ', '.join(LANGUAGES))
+    args.languages = [language.strip() for language in (args.languages or ','.join(LANGUAGES)).split(',') if language.strip()]
+    if args.checkpoint is None and args.output != '-':
+        args.checkpoint = args.output + '.checkpoint'
+    if args.resume and (args.output == '-' or not args.checkpoint):
+        parser.error('--resume needs an --output file')
+    return args
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    args = get_args(argv)
+
+    offset, output_bytes = read_checkpoint(args.checkpoint) if args.resume else (0, 0)
+    if args.output == '-':
+        output = sys.stdout
+    elif args.resume and os.path.exists(args.output):
+        # drop anything written after the checkpoint, it is extracted again
+        output = open(args.output, 'r+', encoding='utf-8')
+        output.truncate(output_bytes)
+        output.seek(output_bytes)
+    else:
+        output = open(args.output, 'w', encoding='utf-8')
+    if offset:
+        logger.info("resuming %s after %d records", args.input, offset)
+
+    input_format = args.format or get_format(args.input)
+    columns = [field for field in (args.text_field, args.language_field, args.id_field) if field]
+    records = read_records(args.input, input_format, columns, offset)
+
+    extractor = Extractor(args)
+    start_time = last_report = time.time()
+    done = 0
+
+    def write(results):
+        nonlocal done, offset, last_report
+        if not results:
+            return
+        write_results(output, results, args.id_field)
+        done += len(results)
+        offset = results[-1][0] + 1
+        if args.checkpoint and args.output != '-':
+            output.flush()
+            write_checkpoint(args.checkpoint, offset, output.tell())
+        now = time.time()
+        if now - last_report >= args.progress_seconds:
+            last_report = now
+            logger.info("%d records done (offset %d), %.1f records/sec", done, offset, done / (now - start_time))
+
+    try:
+        for batch in batches(records, args.batch_size):
+            for results in extractor.submit(batch):
+                write(results)
+        for results in extractor.drain():
+            write(results)
+    finally:
+        extractor.stop()
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed_time = time.time() - start_time
+    logger.info("extracted entities from %d records in %.1f sec, %.1f records/sec",
+        done, elapsed_time, done / elapsed_time if elapsed_time else 0.0)
+
+
+if __name__ == '__main__':
+    main()
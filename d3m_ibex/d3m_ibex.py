@@ -1,58 +1,233 @@
 ''' Extract named entities from documents '''
 import os, sys
+from collections import namedtuple
 from typing import List
 import re
 import string
 import logging
+import time
 import traceback
+import numpy
 import spacy
+from spacy.attrs import LOWER, POS, TAG, IS_STOP
+from spacy.strings import hash_string
+from spacy.symbols import PROPN, DET, ADP
 
+from d3m_ibex.metrics import STAGE_SECONDS, BATCH_SIZE, DOCUMENTS, Gauge
+from d3m_ibex.exclude import ExcludeList
+from d3m_ibex.registry import REGISTRY, PARSER_STATS, get_rss
 
 
-REGEX_FILTERS = {
-    re.compile('RT @\w+'): '',  # retweet (filter before removing mentions)
-    re.compile('https?://\S+'): '',  # uri
-    re.compile('#\w*'): '',  # hashtag
-    re.compile('@\w*'): '',  # mention
-    # re.compile('\d+'): '',  # number
-    # re.compile('[{chars}]'.format(chars=string.punctuation + '¿¡')): '',
-    re.compile('\s'): ' ',  # whitespace [ \t\n\r\f\v]
-}
 
+# content removed by prep_text, applied in this order: retweets go before mentions, and
+# URLs before hashtags and mentions so that '#news' glued to 'https://..' loses both.
+# Hashtags and mentions share a pass: '[#@]\w*' consumes every word character after
+# the sigil, so removing one never exposes text the other would match.
+# The rules are kept as separate passes rather than one alternation: the regex engine
+# scans for each pattern's leading literal far faster than it tries an alternation at
+# every position.
+PREP_RULES = [
+    re.compile(r'RT @\w+'),  # retweet
+    re.compile(r'https?://\S+'),  # uri
+    re.compile(r'[#@]\w*'),  # hashtag, mention
+    # re.compile(r'\d+'),  # number
+    # re.compile('[{chars}]'.format(chars=re.escape(string.punctuation + '¿¡'))),
+]
 
-SPACES_REGEX = re.compile('  +')
+# separates documents joined for batch preprocessing. The rules prep_texts runs over
+# joined documents end a URL at it, so no rule matches across it; documents that
+# contain it are prepped one by one instead.
+_DOC_SEPARATOR = '\x00'
+_JOINED_PREP_RULES = [PREP_RULES[0], re.compile(r'https?://[^\s\x00]+'), PREP_RULES[2]]
 
 logger = logging.getLogger('d3m_ibex')
 logger.setLevel(logging.DEBUG)
 
-def prep_text(text: str):
+def collapse_whitespace(text: str):
+    r''' replace each run of whitespace [ \t\n\r\f\v...] with a single space. Same
+    result as re.sub('\s+', ' ', text), in a fraction of the time. '''
+    words = text.split()
+    if not words:
+        return ' ' if text else ''
+    return ((' ' if text[0].isspace() else '') + ' '.join(words)
+            + (' ' if text[-1].isspace() else ''))
+
+def prep_text(text: str, rules=PREP_RULES):
     ''' preprocess text, removing content irrelevant for entity recognition or topic selection'''
-    for regex, replacement in REGEX_FILTERS.items():
-        text = regex.sub(replacement, text)
+    for regex in rules:
+        text = regex.sub('', text)
+
+    # collapse whitespace last to catch runs created by the removals
+    return collapse_whitespace(text)
+
+WHITESPACE = re.compile(r'\s+')
+
+def remove_matches(regex, text: str, offsets, replacement: str=''):
+    ''' replace the matches of regex in text, keeping the original offset of each
+    remaining character (a replacement takes the offset of its match) '''
+    pieces, kept, last = [], [], 0
+    for match in regex.finditer(text):
+        pieces.append(text[last:match.start()])
+        kept.append(offsets[last:match.start()])
+        if replacement:
+            pieces.append(replacement)
+            kept.append(offsets[match.start():match.start() + len(replacement)])
+        last = match.end()
+    if not pieces:
+        return text, offsets
+    pieces.append(text[last:])
+    kept.append(offsets[last:])
+    return ''.join(pieces), numpy.concatenate(kept)
+
+def prep_text_offsets(text: str):
+    ''' prep_text that also returns the offset in `text` of each character of the
+    prepped text, as a numpy array, to map entity offsets back to the original '''
+    offsets = numpy.arange(len(text))
+    for regex in PREP_RULES:
+        text, offsets = remove_matches(regex, text, offsets)
+    return remove_matches(WHITESPACE, text, offsets, ' ')
+
+def prep_texts(texts: List[str]):
+    ''' prep_text for a list of documents, run over all of them joined together so each
+    regex pass is a single call '''
+    texts = list(texts)
+    if any(_DOC_SEPARATOR in text for text in texts):
+        return [prep_text(text) for text in texts]
+    return prep_text(_DOC_SEPARATOR.join(texts), _JOINED_PREP_RULES).split(_DOC_SEPARATOR) if texts else []
+
+# chunked parsing of long documents: text is split at paragraph breaks and sentence ends
+# (a period, question or exclamation mark after two word characters, so initials like
+# 'U.S.' and titles like 'Mr.' do not end a sentence)
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_END = re.compile(r'(?<=\w\w[.!?])(?<![A-Z]\w[.!?]) ')
+
+# default size in characters of the chunks get_entities_chunked parses, and of the
+# overlap between consecutive chunks of a sentence too long to fit in one
+DEFAULT_CHUNK_SIZE = 100000
+DEFAULT_CHUNK_OVERLAP = 200
+
+def split_sentences(text: str):
+    ''' prepped paragraphs of a text, split at sentence ends. Each piece keeps the
+    single space that follows it, so joining pieces rebuilds the prepped text. '''
+    for paragraph in prep_texts(PARAGRAPH_BREAK.split(text)):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        start = 0
+        for match in SENTENCE_END.finditer(paragraph):
+            yield paragraph[start:match.end()]
+            start = match.end()
+        yield paragraph[start:] + ' '
+
+def split_window(text: str, chunk_size: int, overlap: int):
+    ''' split a sentence longer than chunk_size at spaces into windows that overlap
+    by about `overlap` characters. Each window owns the half of each overlap nearest
+    to it, see chunk_text, and comes with its offset in the sentence. '''
+    windows = []
+    start, keep_from = 0, 0
+    while len(text) - start > chunk_size:
+        end = text.rfind(' ', start + 2 * overlap, start + chunk_size) + 1 or start + chunk_size
+        next_start = text.find(' ', end - overlap, end) + 1 or end - overlap
+        keep_to = (next_start + end) // 2
+        windows.append((text[start:end], keep_from - start, keep_to - start, start))
+        start, keep_from = next_start, keep_to
+    windows.append((text[start:], keep_from - start, len(text) - start, start))
+    return windows
+
+def chunk_text(text: str, chunk_size: int=DEFAULT_CHUNK_SIZE, overlap: int=DEFAULT_CHUNK_OVERLAP):
+    ''' prep a long text and split it into chunks of at most chunk_size characters,
+    packing whole sentences into each chunk. Returns (chunk, keep_from, keep_to,
+    offset) tuples: only entities starting at a character offset in [keep_from,
+    keep_to) of a chunk are kept, so an entity in the overlap of two windows of an
+    over-long sentence is taken from the window that holds it whole, and only once.
+    offset is where the chunk starts in the prepped text (without leading whitespace),
+    which is the pieces of split_sentences joined.
+    '''
+    overlap = min(overlap, chunk_size // 4)
+    chunks, window, window_length, position = [], [], 0, 0
+
+    def flush():
+        chunk = ''.join(window)
+        if chunk:
+            chunks.append((chunk, 0, len(chunk), position - len(chunk)))
 
-    # replace multiple whitespaces last to catch those created by substitions above
-    return SPACES_REGEX.sub(' ', text)
+    for sentence in split_sentences(text):
+        if window_length + len(sentence) > chunk_size:
+            flush()
+            window, window_length = [], 0
+        if len(sentence) > chunk_size:
+            chunks.extend((chunk, keep_from, keep_to, position + start)
+                          for chunk, keep_from, keep_to, start in split_window(sentence, chunk_size, overlap))
+        else:
+            window.append(sentence)
+            window_length += len(sentence)
+        position += len(sentence)
+    flush()
+    return chunks
 
-PARSERS = {}
+# loaded parsers by name, held by the parser registry, which may evict them
+PARSERS = REGISTRY.parsers
 
 current_path = os.path.dirname(os.path.abspath(__file__))
 exclude_path = os.path.join(current_path, 'exclude_words.txt')
-if os.path.isfile(exclude_path):
-    with open(exclude_path) as exclude_file:
-        EXCLUDE_WORDS = set(word.strip('\n') for word in exclude_file.readlines())
-else:
-    # TODO move to logger
-    logger.warn('warning: cannot find exclude_words.txt')
-    EXCLUDE_WORDS = set()
-
-LANGUAGES = ['english', 'spanish']  # 'hungarian', 'french', 'italian'
-
-# mapping from language name to name of spacy parser
-LANG_TO_PARSER = {
-    'english': 'en_core_web_md',
-    'spanish': 'es_core_news_md'
+
+# words and phrases removed from entities, shared by Ibex instances unless given their
+# own. Reloaded in place when watched (see ExcludeList.watch and config.ini).
+EXCLUDE = ExcludeList(exclude_path)
+
+# the exclude words as loaded at import, and their string store hashes
+EXCLUDE_WORDS = EXCLUDE.index.words
+EXCLUDE_HASHES = EXCLUDE.index.hashes
+
+# hashes of the determiner tags that filter_entity does not allow in multi-word entities
+# (wh-determiners and interrogatives)
+DISALLOWED_DET_TAGS = numpy.array([hash_string('WDT'), hash_string('DET__PronType=Int')], dtype=numpy.uint64)
+
+# an entity occurrence: its text, spacy label (PERSON, ORG, GPE, ...) and character
+# offsets [start, end) in the document it was found in
+Entity = namedtuple('Entity', ['text', 'label', 'start', 'end'])
+# all occurrences of an entity text with one label in a document, as returned in rich
+# mode: the offsets of the first one, the number of them and the offsets of each
+RichEntity = namedtuple('RichEntity', ['text', 'label', 'start', 'end', 'count', 'starts', 'ends'])
+
+def group_entities(spans):
+    ''' RichEntity for each distinct (text, label) of a document's entity occurrences,
+    in order of first occurrence '''
+    groups = {}
+    for span in spans:
+        groups.setdefault((span.text, span.label), []).append(span)
+    return [RichEntity(text, label, occurrences[0].start, occurrences[0].end, len(occurrences),
+                       [occurrence.start for occurrence in occurrences], [occurrence.end for occurrence in occurrences])
+            for (text, label), occurrences in groups.items()]
+
+# number of documents spacy parses together in get_entities_batch
+DEFAULT_BATCH_SIZE = 64
+
+# supported languages, and mapping from language name to name of spacy parser. Both
+# belong to the parser registry and change when it is configured, e.g. to add
+# 'french', 'italian' or 'hungarian'.
+LANGUAGES = REGISTRY.languages
+LANG_TO_PARSER = REGISTRY.models
+
+# pipeline components skipped when parsing, per extraction profile. filter_entity only
+# needs tokens, POS/tags (tagger), is_stop (lexical) and doc.ents (ner), so the 'fast'
+# profile skips the dependency parser, which is the most expensive component.
+PROFILES = {
+    'full': [],
+    'fast': ['parser'],
+}
+
+# short documents run through each parser at warmup
+WARMUP_TEXT = {
+    'english': 'Barack Obama met Angela Merkel in Berlin on Monday.',
+    'spanish': 'Cristiano Ronaldo jugó con la Juventus en Madrid el lunes.',
+    'french': 'Emmanuel Macron a rencontré Angela Merkel à Berlin lundi.',
+    'italian': 'Sergio Mattarella ha incontrato Angela Merkel a Berlino lunedì.',
+    'hungarian': 'Orbán Viktor hétfőn Berlinben találkozott Angela Merkellel.',
 }
 
+Gauge('ibex_process_resident_memory_bytes', 'Resident memory of this process').set_function(get_rss)
+
 def log_traceback(ex, ex_traceback=None):
     if ex_traceback is None:
         ex_traceback = ex.__traceback__
@@ -64,21 +239,58 @@ def log_traceback(ex, ex_traceback=None):
 class Ibex():
 
 
-    def __init__(self, language = None):
-        pass
-                
+    def __init__(self, language = None, profile: str='full', cache=None, preload: bool=True,
+                 chunk_size: int=None, exclude=None, dedup=None):
+        ''' An Ibex instance holds no per-request state and is safe to share between
+        threads. If `language` is given it is used whenever a call does not name a
+        language (otherwise calls default to english), and its parser is loaded here
+        unless `preload` is False. Documents longer than `chunk_size` characters after
+        prep_text are parsed in chunks (see get_entities_chunked); by default only
+        those too long for the parser are. `exclude` is the ExcludeList of words removed
+        from entities, by default EXCLUDE. With a NearDuplicateWindow as `dedup`,
+        documents near-identical to one parsed shortly before take its entities
+        instead of being parsed (entity strings only, not offsets).
+        '''
+        if profile not in PROFILES:
+            raise Exception('unknown profile %s, expected one of %s' % (profile, ', '.join(PROFILES)))
+        self.profile = profile
+        # pipeline components this instance does not run
+        self.disable = PROFILES[profile]
+        # optional EntityCache of results keyed by prepped text
+        self.cache = cache
+        self.chunk_size = chunk_size
+        # words removed from entities; its index may be swapped for a new one at any time
+        self.exclude = exclude or EXCLUDE
+        # optional NearDuplicateWindow of recently parsed documents
+        self.dedup = dedup
+
+        self.language = language or 'english'
+        self.parser_name = self.load_parser(language) if language is not None and preload else None
+
+
+    @property
+    def exclude_words(self):
+        return self.exclude.index.words
+
+
+    @property
+    def exclude_hashes(self):
+        return self.exclude.index.hashes
 
 
     def filter_entity(self, entity):
         ''' filter entities identified by spacy. For single-word entities, remove
         those in the exclude list or not proper nouns. for multi-word entities, make
-        sure all words are not stop words with some exceptions.
+        sure all words are not stop words with some exceptions, and that they do not
+        contain an excluded phrase.
         '''
+        # one index for the whole entity, even if the exclude list is reloaded meanwhile
+        index = self.exclude.index
 
         if len(entity) == 1:
             # for single word entities, remove if stop word or number
             ent = entity[0]
-            return (ent.is_stop or ent.text.lower() in EXCLUDE_WORDS
+            return (ent.is_stop or ent.lower in index.hash_set
                     or ent.pos_ != 'PROPN'
                     # or ent.pos_ == 'NUM'
                     # or ent.pos_ == 'PUNCT')
@@ -86,62 +298,384 @@ class Ibex():
             # TODO allow single entities that are not tagged as a proper noun?
 
         # for multi-word entities, remove if there are any stop words with exceptions for some POS
-        remove = [(word.is_stop or (word.text.lower() in EXCLUDE_WORDS))
+        remove = [(word.is_stop or (word.lower in index.hash_set))
                 # allow determiners that are not wh-determiners or interrogatives
                 and not (word.pos_ == 'DET' and word.tag_ != 'WDT' and word.tag_ != 'DET__PronType=Int')
                 and word.pos_ != 'ADP'  # and adpositions
                 for word in entity]
 
-        return any(remove)
+        return any(remove) or bool(index.phrase_spans([word.lower for word in entity]))
 
 
-    def get_entities(self, document: str, language: str='english'):
-        ''' Takes a document and returns a list of extracted entities '''
-        if language == 'spanish':
-            try:
-                import es_core_news_md
-                logger.info("Success importing en_core_web_md")
-            except ImportError:
-                logger.error("Error importing es_core_news_md")
-                sys.exit(-1)
-        else:
-            try:
-                import en_core_web_md
-                logger.info("Success importing en_core_web_md")
-            except ImportError:
-                logger.error("Error importing en_core_web_md")
-                sys.exit(-1)
+    def get_parser_name(self, language: str):
+        ''' resolve a language (or the name of a spacy parser) to a parser name '''
+        return REGISTRY.get_parser_name(language)
+
+
+    def load_parser(self, language: str='english'):
+        ''' resolve a language to a spacy parser name, loading the parser if it is
+        not already in memory. Returns the parser name (see REGISTRY.get).
+        '''
+        parser_name = self.get_parser_name(language)
+        REGISTRY.get(parser_name)
+        return parser_name
+
+
+    def get_parser(self, language: str=None):
+        ''' name of the parser for a language, defaulting to the language this instance
+        is bound to; the bound parser is resolved once, in __init__ '''
+        if language is None or language == self.language:
+            if self.parser_name is None:
+                self.parser_name = self.load_parser(self.language)
+            return self.parser_name
+        return self.load_parser(language)
+
+
+    def get_chunk_size(self, parser_name: str):
+        ''' length above which a prepped document is parsed in chunks '''
+        max_length = REGISTRY.get(parser_name).max_length
+        return min(self.chunk_size, max_length) if self.chunk_size else max_length
+
+
+    def warmup(self, languages: List[str]=LANGUAGES):
+        ''' load the parsers for `languages` and run a short document through each, so the
+        first requests do not pay for model loading. Returns the load time and resident
+        memory growth of each parser, keyed by parser name.
+        '''
+        report = {}
+        for language in languages:
+            parser_name = self.load_parser(language)
+            start_time = time.time()
+            REGISTRY.get(parser_name)(prep_text(WARMUP_TEXT.get(language, WARMUP_TEXT['english'])), disable=self.disable)
+            stats = dict(PARSER_STATS.get(parser_name, {}), warm_seconds=time.time() - start_time)
+            report[parser_name] = stats
+
+            rss = stats.get('rss_bytes')
+            logger.info("Warmed up parser %s: loaded in %.2f sec, %s MB, first parse in %.3f sec",
+                parser_name, stats.get('load_seconds', 0.0),
+                '%.0f' % (rss / 2**20) if rss is not None else 'unknown', stats['warm_seconds'])
+        return report
+
+
+    def filter_entities(self, doc):
+        ''' entities of a parsed spacy doc that filter_entity keeps, decided for all of
+        them at once from the doc's token attribute arrays instead of token by token.
+        '''
+        ents = doc.ents
+        if not ents:
+            return []
+
+        index = self.exclude.index
+        lower, pos, tag, is_stop = doc.to_array([LOWER, POS, TAG, IS_STOP]).T
+        excluded = (is_stop != 0) | numpy.isin(lower, index.hashes)
+
+        # single-word entities: remove stop words, excluded words and non proper nouns
+        remove_single = excluded | (pos != PROPN)
+        # multi-word entities: remove if any word is a stop or excluded word, allowing
+        # determiners that are not wh-determiners or interrogatives, and adpositions
+        allowed = ((pos == DET) & ~numpy.isin(tag, DISALLOWED_DET_TAGS)) | (pos == ADP)
+        removed_words = numpy.concatenate(([0], numpy.cumsum(excluded & ~allowed)))
+
+        starts = numpy.array([ent.start for ent in ents])
+        ends = numpy.array([ent.end for ent in ents])
+        remove = numpy.where(ends - starts == 1,
+                             remove_single[starts],
+                             removed_words[ends] > removed_words[starts])
+        # multi-word entities containing an excluded phrase
+        for phrase_start, phrase_end in index.phrase_spans(lower):
+            remove |= (ends - starts > 1) & (starts <= phrase_start) & (ends >= phrase_end)
+        return [ent for ent, removed in zip(ents, remove) if not removed]
+
+
+    def extract_entities(self, doc):
+        ''' extract the unique, filtered entity strings from a parsed spacy doc '''
+        ents = set(ent.text for ent in self.filter_entities(doc))
+        return list(ents)
 
+
+    def extract_entity_spans(self, doc, offset: int=0):
+        ''' the filtered entity occurrences of a parsed spacy doc as Entity tuples, in
+        document order, with character offsets into the parsed text minus `offset` '''
+        return [Entity(ent.text, ent.label_, ent.start_char - offset, ent.end_char - offset)
+                for ent in self.filter_entities(doc)]
+
+
+    def get_entities(self, document: str, language: str=None, rich: bool=False):
+        ''' Takes a document and returns a list of extracted entities. With `rich`, the
+        entities are RichEntity tuples with their label, offsets and count (see
+        get_rich_entities_batch) instead of strings. '''
         if isinstance(document, List):
             document = " ".join(document)
-        # if language given is not the name of a spacy parser, try to convert it to one
-        parser_name = language if language in LANG_TO_PARSER.values() else LANG_TO_PARSER.get(language.lower())
-        if not parser_name:
-            raise Exception('language not supported')
-
-        # if requested parser is not already in memory, try to load from spacy
-        if parser_name not in PARSERS:
-            try:
-                logger.info("Trying to load parser.")
-                if language == 'spanish':
-                    PARSERS[parser_name] = es_core_news_md.load()
-                else:
-                    PARSERS[parser_name] = en_core_web_md.load()
-                #PARSERS[parser_name] = spacy.load(parser_name)
-            except Exception:
-                logger.exception("Error loading parser")
-                sys.exit(-1)
-        else:
-            logger.info("Found parser %s in memory" % parser_name)
+        if rich:
+            return self.get_rich_entities_batch([document], language)[0]
+
+        parser_name = self.get_parser(language)
 
-        def get_ents(doc):
+        def get_ents(text):
             ''' prep, parse, then extract entities from doc text '''
-            doc = prep_text(doc)  # preprocess string
-            doc = PARSERS[parser_name](doc)  # parse prepped doc
-            ents = set(ent.text for ent in doc.ents if not self.filter_entity(ent))  # extract entities
-            return list(ents)
+            DOCUMENTS.labels(parser_name).inc()
+            start_time = time.perf_counter()
+            doc = prep_text(text)  # preprocess string
+            STAGE_SECONDS.labels('prep', parser_name).observe(time.perf_counter() - start_time)
+            profile = self.get_result_profile(self.profile)
+            if self.cache is not None:
+                key = self.cache.make_key(parser_name, profile, doc)
+                entities = self.cache.get(key)
+                if entities is not None:
+                    return entities
+            if self.dedup is not None:
+                namespace = (parser_name, profile)
+                signature = self.dedup.signature(doc)
+                entry = self.dedup.find(namespace, signature) if signature is not None else None
+                reused = entry is not None and entry.entities is not None
+                self.dedup.record(int(signature is not None), int(reused))
+                if reused:
+                    return list(entry.entities)
+            chunk_size = self.get_chunk_size(parser_name)
+            if len(doc) > chunk_size:
+                entities = self.parse_chunked(parser_name, text, chunk_size)  # chunk_text preps each paragraph
+            else:
+                start_time = time.perf_counter()
+                doc = REGISTRY.get(parser_name)(doc, disable=self.disable)  # parse prepped doc
+                parsed_time = time.perf_counter()
+                entities = self.extract_entities(doc)
+                STAGE_SECONDS.labels('parse', parser_name).observe(parsed_time - start_time)
+                STAGE_SECONDS.labels('filter', parser_name).observe(time.perf_counter() - parsed_time)
+            if self.cache is not None:
+                self.cache.put(key, entities)
+            if self.dedup is not None and signature is not None:
+                self.dedup.add(namespace, signature, tuple(entities))
+            return entities
+
+        entities = get_ents(document)
+        # parsing adds unseen token strings to the parser's vocab
+        REGISTRY.check_growth(parser_name)
+        return entities
+
+
+    def get_entities_batch(self, documents: List[str], language: str=None,
+                           batch_size: int=DEFAULT_BATCH_SIZE, n_process: int=1, rich: bool=False):
+        ''' Takes a list of documents and returns a list of extracted entities for each
+        document, in input order. Documents are streamed through spacy's nlp.pipe,
+        which parses them in batches of `batch_size`. `n_process` > 1 fans parsing out
+        over several processes (requires spacy>=2.2.2). Documents that are identical
+        after prep_text, or found in the cache, are only parsed once. With `rich`, see
+        get_rich_entities_batch.
+        '''
+        if rich:
+            return self.get_rich_entities_batch(documents, language, batch_size, n_process)
+        parser_name = self.get_parser(language)
+        documents = list(documents)
+
+        DOCUMENTS.labels(parser_name).inc(len(documents))
+        BATCH_SIZE.labels(parser_name).observe(len(documents))
+        start_time = time.perf_counter()
+        texts = prep_texts(documents)
+        STAGE_SECONDS.labels('prep', parser_name).observe(time.perf_counter() - start_time)
+
+        return self.process_batch(parser_name, documents, texts, self.profile,
+                                  lambda text, doc: self.extract_entities(doc),
+                                  lambda document, text, chunk_size: self.parse_chunked(parser_name, document, chunk_size,
+                                                                                        n_process=n_process),
+                                  batch_size, n_process, near_duplicates=True)
+
+
+    def get_entity_spans_batch(self, documents: List[str], language: str=None,
+                               batch_size: int=DEFAULT_BATCH_SIZE, n_process: int=1):
+        ''' get_entities_batch that returns, for each document, every occurrence of the
+        entities it keeps as an Entity (text, label, start, end), in document order, with
+        character offsets into the original document, before prep_text.
+        '''
+        parser_name = self.get_parser(language)
+        documents = list(documents)
+
+        DOCUMENTS.labels(parser_name).inc(len(documents))
+        BATCH_SIZE.labels(parser_name).observe(len(documents))
+        start_time = time.perf_counter()
+        prepped = [prep_text_offsets(document) for document in documents]
+        texts = [text for text, _ in prepped]
+        STAGE_SECONDS.labels('prep', parser_name).observe(time.perf_counter() - start_time)
+
+        # spans are computed and cached relative to the prepped text without leading
+        # whitespace, which cache keys ignore, then shifted back per document
+        def extract(text, doc):
+            return self.extract_entity_spans(doc, len(text) - len(text.lstrip()))
+
+        def parse_chunked(document, text, chunk_size):
+            return self.parse_chunked_spans(parser_name, document, text.lstrip(), chunk_size, n_process=n_process)
+
+        results = self.process_batch(parser_name, documents, texts, self.profile + '+spans', extract, parse_chunked,
+                                     batch_size, n_process)
+
+        spans = []
+        for (text, offsets), doc_spans in zip(prepped, results):
+            shift = len(text) - len(text.lstrip())
+            spans.append([Entity(ent_text, label, int(offsets[start + shift]), int(offsets[end + shift - 1]) + 1)
+                          for ent_text, label, start, end in doc_spans])
+        return spans
+
+
+    def get_rich_entities_batch(self, documents: List[str], language: str=None,
+                                batch_size: int=DEFAULT_BATCH_SIZE, n_process: int=1):
+        ''' get_entities_batch returning, for each document, a RichEntity per distinct
+        entity text and label: the offsets of its first occurrence in the original
+        document, the number of occurrences and the offsets of each, so callers need
+        not parse documents again to find entity types and positions.
+        '''
+        return [group_entities(spans) for spans in self.get_entity_spans_batch(documents, language, batch_size, n_process)]
+
+
+    def get_result_profile(self, profile: str):
+        ''' the profile that cache keys and near-duplicate namespaces are made with: the
+        extraction profile and the version of the exclude list, so results filtered
+        with a list since reloaded are never reused '''
+        return '%s.%s' % (profile, self.exclude.index.version)
+
+
+    def process_batch(self, parser_name: str, documents, texts, cache_profile: str, extract, parse_chunked,
+                      batch_size: int=DEFAULT_BATCH_SIZE, n_process: int=1, near_duplicates: bool=False):
+        ''' results of extract(text, doc) for the prepped `texts` of `documents`, or of
+        parse_chunked(document, text, chunk_size) for those longer than the chunk size.
+        Texts found in the cache under `cache_profile` are not parsed again, and
+        identical texts are parsed once. With `near_duplicates`, for results that do not
+        depend on the exact text, texts near-identical to one in the dedup window or
+        earlier in the batch take its results. '''
+        pipe_kwargs = {'batch_size': batch_size, 'disable': self.disable}
+        if n_process != 1:
+            pipe_kwargs['n_process'] = n_process
+
+        cache_profile = self.get_result_profile(cache_profile)
+        results = [None] * len(texts)
+        if self.cache is not None:
+            keys = [self.cache.make_key(parser_name, cache_profile, text) for text in texts]
+            results = [self.cache.get(key) for key in keys]
+
+        # parse each distinct uncached text once
+        to_parse = {}
+        for i, text in enumerate(texts):
+            if results[i] is None:
+                to_parse.setdefault(text, []).append(i)
+
+        # window entries of the texts parsed here, by index of their first document
+        entries = {}
+        if near_duplicates and self.dedup is not None and to_parse:
+            namespace = (parser_name, cache_profile)
+            pending = {}  # id of an entry added for this batch -> its text
+            lookups = skips = 0
+            for text in list(to_parse):
+                signature = self.dedup.signature(text)
+                if signature is None:
+                    continue
+                lookups += 1
+                entry = self.dedup.find(namespace, signature)
+                if entry is not None and entry.entities is not None:
+                    for i in to_parse.pop(text):
+                        results[i] = list(entry.entities)
+                    skips += 1
+                elif entry is not None and id(entry) in pending:
+                    # parsed once, with the near-identical text earlier in this batch
+                    to_parse[pending[id(entry)]].extend(to_parse.pop(text))
+                    skips += 1
+                else:
+                    entry = self.dedup.add(namespace, signature)
+                    pending[id(entry)] = text
+                    entries[to_parse[text][0]] = entry
+            self.dedup.record(lookups, skips)
+
+        def set_results(indices, entities):
+            if self.cache is not None:
+                self.cache.put(keys[indices[0]], entities)
+            if indices[0] in entries:
+                entries[indices[0]].entities = tuple(entities)
+            for i in indices:
+                results[i] = list(entities)
+
+        # long documents are parsed on their own, in chunks
+        chunk_size = self.get_chunk_size(parser_name)
+        for text in [text for text in to_parse if len(text) > chunk_size]:
+            indices = to_parse.pop(text)
+            set_results(indices, parse_chunked(documents[indices[0]], text, chunk_size))
+
+        if to_parse:
+            self.parse_pipe(parser_name, iter(to_parse), to_parse.items(),
+                            lambda item, doc: set_results(item[1], extract(item[0], doc)), pipe_kwargs)
+        # parsing adds unseen token strings to the parser's vocab
+        REGISTRY.check_growth(parser_name)
+        return results
+
+
+    def parse_pipe(self, parser_name: str, texts, items, handle, pipe_kwargs):
+        ''' parse texts with nlp.pipe, calling handle(item, doc) with the item of each
+        text and its parsed doc. nlp.pipe parses lazily as it is iterated, so time
+        spent in handle is recorded as the filter stage and the rest as parse. '''
+        start_time = time.perf_counter()
+        filter_time = 0.0
+        for item, doc in zip(items, REGISTRY.get(parser_name).pipe(texts, **pipe_kwargs)):
+            filter_start = time.perf_counter()
+            handle(item, doc)
+            filter_time += time.perf_counter() - filter_start
+        STAGE_SECONDS.labels('parse', parser_name).observe(time.perf_counter() - start_time - filter_time)
+        STAGE_SECONDS.labels('filter', parser_name).observe(filter_time)
+
+
+    def get_entities_chunked(self, document: str, language: str=None, chunk_size: int=DEFAULT_CHUNK_SIZE,
+                             overlap: int=DEFAULT_CHUNK_OVERLAP, batch_size: int=1, n_process: int=1):
+        ''' get_entities for long documents: the document is split into chunks of at
+        most `chunk_size` characters at paragraph and sentence boundaries (see
+        chunk_text), which are streamed through nlp.pipe `batch_size` at a time and,
+        with `n_process` > 1, parsed in parallel. Peak memory is bounded by the chunks
+        in flight instead of growing with the document. Entities of all chunks are
+        merged into one list of unique entities.
+        '''
+        parser_name = self.get_parser(language)
+
+        if isinstance(document, List):
+            document = " ".join(document)
+
+        return self.parse_chunked(parser_name, document, min(chunk_size, REGISTRY.get(parser_name).max_length),
+                                  overlap, batch_size, n_process)
+
+
+    def parse_chunked(self, parser_name: str, document: str, chunk_size: int,
+                      overlap: int=DEFAULT_CHUNK_OVERLAP, batch_size: int=1, n_process: int=1):
+        chunks = chunk_text(document, chunk_size, overlap)
+        pipe_kwargs = {'batch_size': batch_size, 'disable': self.disable}
+        if n_process != 1:
+            pipe_kwargs['n_process'] = n_process
+
+        ents = set()
+        def handle(chunk, doc):
+            _, keep_from, keep_to, _ = chunk
+            ents.update(ent.text for ent in self.filter_entities(doc) if keep_from <= ent.start_char < keep_to)
+
+        self.parse_pipe(parser_name, (chunk for chunk, _, _, _ in chunks), chunks, handle, pipe_kwargs)
+        return list(ents)
+
+
+    def parse_chunked_spans(self, parser_name: str, document: str, text: str, chunk_size: int,
+                            overlap: int=DEFAULT_CHUNK_OVERLAP, batch_size: int=1, n_process: int=1):
+        ''' parse_chunked returning entity occurrences (see get_entity_spans_batch) with
+        offsets into `text`, the prepped document without leading whitespace. Chunks of
+        the document are prepped copies of pieces of it, at the offsets chunk_text
+        gives them. '''
+        chunks = []
+        for chunk, keep_from, keep_to, start in chunk_text(document, chunk_size, overlap):
+            if not text.startswith(chunk.rstrip(), start):
+                logger.warning("Chunk not found at its offset in the prepped document, dropping its entities")
+                start = -1
+            chunks.append((chunk, keep_from, keep_to, start))
+        pipe_kwargs = {'batch_size': batch_size, 'disable': self.disable}
+        if n_process != 1:
+            pipe_kwargs['n_process'] = n_process
+
+        spans = []
+        def handle(chunk, doc):
+            _, keep_from, keep_to, start = chunk
+            if start >= 0:
+                spans.extend(ent for ent in self.extract_entity_spans(doc, -start) if keep_from <= ent.start - start < keep_to)
 
-        return get_ents(document)
+        self.parse_pipe(parser_name, (chunk for chunk, _, _, _ in chunks), chunks, handle, pipe_kwargs)
+        return spans
 
 
 if __name__ == '__main__':
@@ -0,0 +1,200 @@
+''' Window of recently parsed documents, looked up by MinHash signature, so near-identical
+documents arriving close together are parsed once '''
+import re
+import threading
+import time
+import zlib
+from collections import deque
+
+import numpy
+
+WORD = re.compile(r'\w+')
+# how far under the threshold MinHash estimates of similarity can be and still be
+# checked, about 3 standard deviations of the estimate with 24 MinHash values
+ESTIMATE_MARGIN = 0.2
+
+
+def mix(hashes):
+    ''' splitmix64 finalizer of an array of uint64, spreading every input bit over all
+    output bits '''
+    hashes = (hashes ^ (hashes >> numpy.uint64(30))) * numpy.uint64(0xbf58476d1ce4e5b9)
+    hashes = (hashes ^ (hashes >> numpy.uint64(27))) * numpy.uint64(0x94d049bb133111eb)
+    return hashes ^ (hashes >> numpy.uint64(31))
+
+
+def get_features(words):
+    ''' sorted unique 64-bit hashes of a list of words and of the pairs of consecutive
+    words. Word hashes are crc32 (stable across processes and fast) mixed to 64 bits. '''
+    hashes = mix(numpy.array([zlib.crc32(word.encode('utf-8')) for word in words], dtype=numpy.uint64))
+    return numpy.unique(numpy.concatenate([hashes, mix(hashes[:-1] * numpy.uint64(31) + hashes[1:])]))
+
+
+def similarity(features, other):
+    ''' Jaccard similarity of two sorted arrays of unique feature hashes '''
+    common = len(numpy.intersect1d(features, other, assume_unique=True))
+    return common / (len(features) + len(other) - common)
+
+
+class Signature():
+    ''' the features of a document and their MinHash: the smallest hash of the features
+    under each of `len(seeds)` hash functions '''
+    __slots__ = ('features', 'minhash')
+
+    def __init__(self, features, seeds):
+        self.features = features
+        self.minhash = mix(features[:, None] ^ seeds[None, :]).min(axis=0)
+
+
+class WindowEntry():
+    ''' a document in the window: its Signature, when it was added, and its entities
+    once parsed (None until then) '''
+    __slots__ = ('namespace', 'signature', 'added', 'entities')
+
+    def __init__(self, namespace, signature, added, entities=None):
+        self.namespace = namespace
+        self.signature = signature
+        self.added = added
+        self.entities = entities
+
+
+class NearDuplicateWindow():
+    ''' Recently parsed documents, for streams that repeat a post with small changes
+    (another trailing link or mention, a typo fixed) that defeat the exact EntityCache.
+
+    Two documents are near-identical when the Jaccard similarity of the words and word
+    pairs of their prepped texts is at least `threshold`. Only candidates found by
+    MinHash locality-sensitive hashing are compared: MinHash signatures are split
+    into `bands` bands of `rows` values, and documents agreeing on a whole band are
+    candidates. With 6 bands of 4 rows, documents 90% similar are candidates 99.8%
+    of the time and documents 30% similar 5% of the time. Documents of fewer than
+    `min_words` words are never matched, as a word or two changed in them may change
+    their entities.
+
+    Documents stay in the window for `window_seconds`, and at most `max_size` of them
+    are kept, oldest first out. Entries are namespaced (by parser and profile), so
+    documents are only matched against documents parsed the same way.
+    '''
+
+    def __init__(self, threshold: float=0.9, window_seconds: float=60, max_size: int=10000, min_words: int=5,
+                 bands: int=6, rows: int=4):
+        if not 0 < threshold <= 1:
+            raise Exception('near-duplicate threshold must be above 0 and at most 1')
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.max_size = max_size
+        self.min_words = min_words
+        self.bands = bands
+        self.rows = rows
+        self.seeds = mix(numpy.arange(1, bands * rows + 1, dtype=numpy.uint64))
+
+        self.entries = deque()  # oldest first
+        self.index = {}  # (namespace, band, band value) -> entries
+        self.lock = threading.Lock()
+        self.lookups = 0
+        self.skips = 0
+        self.expirations = 0
+        self.evictions = 0
+
+
+    def __getstate__(self):
+        # locks do not survive pickling into a spawned process
+        state = self.__dict__.copy()
+        state['lock'] = None
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+    def signature(self, text: str):
+        ''' Signature of a prepped text, or None if it is too short to be matched '''
+        words = WORD.findall(text.lower())
+        if len(words) < self.min_words:
+            return None
+        return Signature(get_features(words), self.seeds)
+
+
+    def band_keys(self, namespace, signature):
+        minhash = signature.minhash.tobytes()
+        size = 8 * self.rows
+        return [(namespace, band, minhash[band * size:(band + 1) * size]) for band in range(self.bands)]
+
+
+    def find(self, namespace, signature):
+        ''' the most recent entry near-identical to a Signature, or None '''
+        now = time.time()
+        with self.lock:
+            self.expire(now)
+            candidates = set()
+            for key in self.band_keys(namespace, signature):
+                candidates.update(self.index.get(key, ()))
+        if not candidates:
+            return None
+        # the fraction of equal MinHash values estimates the similarity; only
+        # candidates whose estimate is close to the threshold are compared exactly
+        candidates = sorted(candidates, key=lambda entry: -entry.added)
+        estimates = (numpy.array([entry.signature.minhash for entry in candidates]) == signature.minhash).mean(axis=1)
+        for entry, estimate in zip(candidates, estimates):
+            if estimate >= self.threshold - ESTIMATE_MARGIN and \
+                    similarity(entry.signature.features, signature.features) >= self.threshold:
+                return entry
+        return None
+
+
+    def add(self, namespace, signature, entities=None):
+        ''' add a document to the window. Returns its entry, whose entities may be set
+        once it is parsed. '''
+        now = time.time()
+        entry = WindowEntry(namespace, signature, now, entities)
+        with self.lock:
+            self.expire(now)
+            self.entries.append(entry)
+            for key in self.band_keys(namespace, signature):
+                self.index.setdefault(key, []).append(entry)
+            while len(self.entries) > self.max_size:
+                self.remove(self.entries.popleft())
+                self.evictions += 1
+        return entry
+
+
+    def expire(self, now):
+        ''' drop entries older than the window. Call with self.lock held. '''
+        while self.entries and (self.window_seconds and self.entries[0].added + self.window_seconds <= now):
+            self.remove(self.entries.popleft())
+            self.expirations += 1
+
+
+    def remove(self, entry):
+        for key in self.band_keys(entry.namespace, entry.signature):
+            entries = self.index[key]
+            entries.remove(entry)
+            if not entries:
+                del self.index[key]
+
+
+    def record(self, lookups: int, skips: int):
+        ''' count documents looked up, and those whose parse was skipped '''
+        with self.lock:
+            self.lookups += lookups
+            self.skips += skips
+
+
+    def stats(self):
+        ''' lookup/skip/eviction counters and current size '''
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'lookups': self.lookups,
+                'skips': self.skips,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'skip_rate': self.skips / self.lookups if self.lookups else 0.0,
+            }
+
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.index.clear()
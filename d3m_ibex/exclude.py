@@ -0,0 +1,241 @@
+''' Compiled index of the words and phrases removed from entities, stored in a compact
+binary file that is memory-mapped, and reloaded when its source file changes '''
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+import numpy
+from spacy.strings import hash_string
+
+logger = logging.getLogger('d3m_ibex')
+
+# binary format, little-endian: MAGIC, then the number of word hashes, phrases, phrase
+# tokens and bytes of source text as uint32; the sorted uint64 string store hashes of
+# the single words; the uint64 token hashes of all phrases, one after another; the
+# uint32 offsets of each phrase into those tokens (one more than the number of
+# phrases); and the words and phrases as UTF-8, one per line
+MAGIC = b'IBEXEXC1'
+HEADER = struct.Struct('<8sIIII')
+
+
+def read_entries(path: str):
+    ''' lowercased words and phrases of an exclude list, one per line, with blank lines
+    and lines starting with # left out. Phrases are split into words on whitespace. '''
+    entries = []
+    with open(path, encoding='utf-8') as exclude_file:
+        for line in exclude_file:
+            words = line.strip().lower().split()
+            if words and not words[0].startswith('#'):
+                entries.append(tuple(words))
+    return entries
+
+
+def compile_entries(entries):
+    ''' binary exclude index for a list of entries, each a tuple of words '''
+    entries = sorted(set(entries))
+    hashes = numpy.array(sorted(set(hash_string(entry[0]) for entry in entries if len(entry) == 1)), dtype='<u8')
+    phrases = [entry for entry in entries if len(entry) > 1]
+    phrase_tokens = numpy.array([hash_string(word) for phrase in phrases for word in phrase], dtype='<u8')
+    phrase_offsets = numpy.cumsum([0] + [len(phrase) for phrase in phrases]).astype('<u4')
+    text = '\n'.join(' '.join(entry) for entry in entries).encode('utf-8')
+    return b''.join([
+        HEADER.pack(MAGIC, len(hashes), len(phrases), len(phrase_tokens), len(text)),
+        hashes.tobytes(), phrase_tokens.tobytes(), phrase_offsets.tobytes(), text,
+    ])
+
+
+def compile_file(source_path: str, binary_path: str):
+    ''' compile a text exclude list to a binary index file, replacing any previous one
+    atomically, so processes loading it never see a partly written file '''
+    data = compile_entries(read_entries(source_path))
+    temp_path = '%s.%d.tmp' % (binary_path, os.getpid())
+    with open(temp_path, 'wb') as binary_file:
+        binary_file.write(data)
+        binary_file.flush()
+        os.fsync(binary_file.fileno())
+    os.replace(temp_path, binary_path)
+    return binary_path
+
+
+class ExcludeIndex():
+    ''' Immutable exclude index over a compiled buffer, usually a memory-mapped file.
+
+    `hashes` holds the sorted string store hashes of the excluded words, compared
+    against the LOWER attribute of tokens, so tokens are never lowercased to look them
+    up. Phrases are kept in a trie keyed by token hashes. `version` is a digest of the
+    compiled index, which changes whenever its words or phrases do. '''
+
+    def __init__(self, buffer):
+        magic, n_hashes, n_phrases, n_phrase_tokens, n_text = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise Exception('not a compiled exclude index')
+        offset = HEADER.size
+        self.hashes = numpy.frombuffer(buffer, dtype='<u8', count=n_hashes, offset=offset)
+        offset += 8 * n_hashes
+        phrase_tokens = numpy.frombuffer(buffer, dtype='<u8', count=n_phrase_tokens, offset=offset)
+        offset += 8 * n_phrase_tokens
+        phrase_offsets = numpy.frombuffer(buffer, dtype='<u4', count=n_phrases + 1, offset=offset)
+        offset += 4 * (n_phrases + 1)
+        text = bytes(buffer[offset:offset + n_text]).decode('utf-8')
+
+        self.buffer = buffer
+        self.version = hashlib.sha1(buffer).hexdigest()[:12]
+        self.hash_set = frozenset(int(word_hash) for word_hash in self.hashes)
+        self.words = frozenset(line for line in text.split('\n') if line and ' ' not in line)
+        self.phrases = frozenset(line for line in text.split('\n') if ' ' in line)
+        # trie of phrases: token hash -> child node; a None key marks the end of a phrase
+        self.trie = {}
+        for start, end in zip(phrase_offsets[:-1], phrase_offsets[1:]):
+            node = self.trie
+            for token_hash in phrase_tokens[start:end]:
+                node = node.setdefault(int(token_hash), {})
+            node[None] = True
+        self.first_tokens = numpy.array(sorted(self.trie), dtype=numpy.uint64)
+
+
+    @classmethod
+    def load(cls, path: str):
+        ''' memory-map a compiled index file '''
+        with open(path, 'rb') as binary_file:
+            if os.fstat(binary_file.fileno()).st_size == 0:
+                return cls(compile_entries([]))
+            return cls(mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+    @classmethod
+    def from_words(cls, words):
+        ''' index of an iterable of words and phrases, compiled in memory '''
+        return cls(compile_entries([tuple(word.lower().split()) for word in words if word.strip()]))
+
+
+    def __len__(self):
+        return len(self.words) + len(self.phrases)
+
+
+    def phrase_spans(self, lower):
+        ''' (start, end) token spans of the excluded phrases found in an array of
+        token LOWER hashes '''
+        if not self.trie:
+            return []
+        spans = []
+        # only walk the trie from tokens that start a phrase
+        starts = numpy.flatnonzero(numpy.isin(numpy.asarray(lower, dtype=numpy.uint64), self.first_tokens))
+        lower = [int(token_hash) for token_hash in lower]
+        for start in starts:
+            node = self.trie
+            for end in range(start, len(lower)):
+                node = node.get(lower[end])
+                if node is None:
+                    break
+                if None in node:
+                    spans.append((start, end + 1))
+        return spans
+
+
+class ExcludeList():
+    ''' The current ExcludeIndex of a source file, which is either a text list (one
+    word or phrase per line) or a compiled index. Text lists are compiled to
+    `compiled_path` and memory-mapped from there, so processes share one copy, or
+    without it compiled in memory.
+
+    `index` is replaced as a whole when the source changes, so readers take one
+    reference to it per document and need no lock. Watching is done by a background
+    thread that checks the source every `interval` seconds; processes forked from a
+    watching one start their own thread with `watch()`. '''
+
+    def __init__(self, path: str, compiled_path: str=None):
+        self.path = path
+        self.compiled_path = compiled_path
+        self.interval = None
+        self.signature = None
+        self.watch_pid = None
+        self.index = ExcludeIndex.from_words([])
+        self.reload()
+
+
+    def is_compiled(self):
+        with open(self.path, 'rb') as source:
+            return source.read(len(MAGIC)) == MAGIC
+
+
+    def get_signature(self):
+        ''' identity of the current source file contents, or None if it is missing '''
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+    def reload(self):
+        ''' load the source if it changed since it was last loaded. Returns whether a
+        new index was loaded. '''
+        signature = self.get_signature()
+        if signature is None:
+            if self.signature != 'missing':
+                logger.warning('cannot find exclude list %s', self.path)
+                self.signature = 'missing'
+            return False
+        if signature == self.signature:
+            return False
+
+        start_time = time.time()
+        if self.is_compiled():
+            index = ExcludeIndex.load(self.path)
+        elif self.compiled_path:
+            index = ExcludeIndex.load(compile_file(self.path, self.compiled_path))
+        else:
+            index = ExcludeIndex(compile_entries(read_entries(self.path)))
+        if self.signature not in (None, 'missing'):
+            logger.info('reloaded exclude list %s: %d words, %d phrases in %.1f ms',
+                self.path, len(index.words), len(index.phrases), (time.time() - start_time) * 1000)
+        self.index = index
+        self.signature = signature
+        return True
+
+
+    def settings(self):
+        ''' keyword arguments of configure that reproduce this list in another process '''
+        return {'path': self.path, 'compiled_path': self.compiled_path, 'interval': self.interval}
+
+
+    def configure(self, path: str, compiled_path: str=None, interval: float=None):
+        ''' switch to another source and (re)start watching it every `interval` seconds '''
+        if (path, compiled_path) != (self.path, self.compiled_path):
+            self.path, self.compiled_path, self.signature = path, compiled_path, None
+            self.reload()
+        if interval:
+            self.watch(interval)
+
+
+    def watch(self, interval: float=5.0):
+        ''' check the source for changes every `interval` seconds on a daemon thread,
+        once per process '''
+        self.interval = interval
+        if self.watch_pid == os.getpid():
+            return
+        self.watch_pid = os.getpid()
+        threading.Thread(target=self.run, name='exclude-watcher', daemon=True).start()
+
+
+    def run(self):
+        pid = os.getpid()
+        while self.watch_pid == pid:
+            time.sleep(self.interval)
+            try:
+                self.reload()
+            except Exception:
+                logger.exception('Problem reloading exclude list %s', self.path)
+
+
+if __name__ == '__main__':
+    # compile a text exclude list: python -m d3m_ibex.exclude exclude_words.txt exclude_words.bin
+    if len(sys.argv) != 3:
+        sys.exit('usage: python -m d3m_ibex.exclude SOURCE.txt COMPILED.bin')
+    index = ExcludeIndex.load(compile_file(sys.argv[1], sys.argv[2]))
+    print('%s: %d words, %d phrases' % (sys.argv[2], len(index.words), len(index.phrases)))
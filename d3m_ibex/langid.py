@@ -0,0 +1,115 @@
+''' Fast in-process identification of the language (english or spanish) of a document,
+from function words and character n-grams '''
+import math
+import re
+import time
+
+from d3m_ibex.metrics import Counter, Histogram
+from d3m_ibex.registry import REGISTRY
+
+# log-odds evidence for spanish (positive) over english (negative) of whole words.
+# Function words that are common in one language and rare in the other; words shared
+# by both (a, no, me, he, once, ...) are left out.
+ENGLISH_WORDS = '''the and of to in is that for it with was on are as this be at by have from or an but
+not what all were we when your can said there which she do how their if will up about out them
+these so some her would like him into has more two could been than who its did my they you our
+i just over after also new get got being does should where why us i'm it's don't'''.split()
+SPANISH_WORDS = '''de la que el en y los se del las un por con una su para es al lo como más pero
+sus le ya este sí porque esta entre cuando muy sobre también hasta hay donde quien desde
+todo nos durante todos uno les ni contra otros ese eso ante ellos esto mí antes algunos qué unos
+yo otro otras otra él tanto esa estos mucho quienes nada muchos cual poco ella estar estas
+algunas algo nosotros mi tu te ti tus ellas nosotras vosotros fue está han hace según tras así'''.split()
+
+WORD_WEIGHTS = dict([(word, -1.5) for word in ENGLISH_WORDS] + [(word, 1.5) for word in SPANISH_WORDS])
+
+# evidence of the endings of words that are not function words, first match only
+SUFFIX_WEIGHTS = [
+    ('ción', 2.0), ('ciones', 2.0), ('mente', 1.0), ('idad', 1.0), ('ado', 0.5), ('ada', 0.5), ('os', 0.3), ('as', 0.2),
+    ('ing', -1.0), ('tion', -1.5), ('ly', -0.8), ('ed', -0.5), ('ght', -1.5), ('ness', -1.5), ('ship', -1.0),
+]
+# evidence of each occurrence of a character sequence anywhere in the text
+INFIX_WEIGHTS = [
+    ('th', -0.7), ('wh', -1.0), ('sh', -0.5), ('ck', -0.8), ('w', -0.4), ('k', -0.2), ('ee', -0.5), ('oo', -0.4),
+    ('ñ', 2.0), ('á', 1.2), ('é', 1.0), ('í', 1.2), ('ó', 1.2), ('ú', 1.2), ('ll', 0.3), ('rr', 0.5), ('ue', 0.3),
+]
+
+# inverted punctuation only occurs in spanish
+SPANISH_MARKS = re.compile('[¿¡]')
+WORD = re.compile(r"[^\W\d_]+(?:'[a-z]+)?")
+# links, hashtags and mentions say little about the language of the text around them
+NOT_TEXT = re.compile(r'https?://\S+|[#@]\w*')
+
+# only the start of a document is looked at, bounding detection time
+DEFAULT_MAX_CHARS = 400
+
+DETECT_SECONDS = Histogram('ibex_langid_seconds', 'Time to identify the language of a document',
+                           buckets=(0.00001, 0.00002, 0.00005, 0.0001, 0.0002, 0.0005, 0.001, 0.002))
+DETECT_CONFIDENCE = Histogram('ibex_langid_confidence', 'Confidence of detected languages',
+                              buckets=(0.6, 0.75, 0.9, 0.95, 0.99, 0.999))
+ROUTED = Counter('ibex_langid_routed_total',
+                 'Documents whose language was detected, per declared language (none if missing or unsupported) and language routed to',
+                 ['declared', 'routed'])
+
+ROUTING_MODES = ('off', 'missing', 'always')
+
+# languages detect_language tells apart
+DETECTABLE = ('english', 'spanish')
+
+
+def detect_language(text: str, max_chars: int=DEFAULT_MAX_CHARS):
+    ''' the more likely of english and spanish for a text, and the confidence of that
+    guess between 0.5 (no evidence either way) and 1. '''
+    start_time = time.perf_counter()
+    text = NOT_TEXT.sub(' ', text[:max_chars].lower())
+
+    log_odds = 1.5 * len(SPANISH_MARKS.findall(text))
+    for infix, weight in INFIX_WEIGHTS:
+        log_odds += weight * text.count(infix)
+    for word in WORD.findall(text):
+        weight = WORD_WEIGHTS.get(word)
+        if weight is not None:
+            log_odds += weight
+        elif len(word) > 3:
+            for suffix, weight in SUFFIX_WEIGHTS:
+                if word.endswith(suffix):
+                    log_odds += weight
+                    break
+
+    # clamp, so that exp cannot overflow on long texts
+    confidence = 1.0 / (1.0 + math.exp(-min(abs(log_odds), 50.0)))
+    DETECT_SECONDS.observe(time.perf_counter() - start_time)
+    return ('spanish' if log_odds > 0 else 'english'), confidence
+
+
+class LanguageRouter():
+    ''' picks the language a document is parsed as. With mode 'missing', the language is
+    detected only for documents without a supported declared language; with 'always',
+    for every document, so mislabelled ones are parsed as the detected language; 'off'
+    trusts the declared language. Detections less confident than `min_confidence`, or
+    of languages without a registered parser, leave the declared language, or
+    `default` if there is none. Documents declared in other languages than those
+    detect_language knows are left alone. '''
+
+    def __init__(self, mode: str='missing', min_confidence: float=0.75, max_chars: int=DEFAULT_MAX_CHARS,
+                 default: str='english'):
+        if mode not in ROUTING_MODES:
+            raise Exception('unknown language detection mode %s' % mode)
+        self.mode = mode
+        self.min_confidence = min_confidence
+        self.max_chars = max_chars
+        self.default = default
+
+
+    def route(self, text: str, declared: str=None):
+        ''' language to parse `text` as, given its declared language name or None '''
+        if self.mode == 'off' or (declared is not None and (self.mode == 'missing' or declared not in DETECTABLE)):
+            return declared or self.default
+
+        detected, confidence = detect_language(text, self.max_chars)
+        DETECT_CONFIDENCE.observe(confidence)
+        if confidence >= self.min_confidence and detected in REGISTRY.languages:
+            routed = detected
+        else:
+            routed = declared or self.default
+        ROUTED.labels(declared or 'none', routed).inc()
+        return routed
@@ -0,0 +1,107 @@
+''' Logging off the request path: a queue handler that leaves formatting and I/O to a
+background thread, and sampled, structured request logs '''
+import json
+import logging
+import logging.handlers
+import queue
+import random
+
+logger = logging.getLogger('d3m_ibex')
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    ''' QueueHandler that queues records as they are, so their messages are formatted
+    on the listener thread instead of the logging one. Records with exceptions are
+    still formatted here, while their traceback is current. When the queue is full,
+    records are dropped and counted instead of blocking or raising. '''
+
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if record.exc_info:
+            return super().prepare(record)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def start_queue_logging(level=logging.INFO, queue_size: int=10000, handler=None):
+    ''' route all logging through a bounded queue to `handler` (stderr by default) on a
+    background thread. Returns the QueueListener; stop it to flush on exit. '''
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    queue_handler = DeferredQueueHandler(queue.Queue(maxsize=queue_size))
+    # loggers that set their own, lower level (e.g. d3m_ibex) are cut off here too
+    queue_handler.setLevel(level)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def log_directly():
+    ''' in a forked process, replace the inherited queue handler, whose listener thread
+    only runs in the parent, by one writing records straight to stderr '''
+    root = logging.getLogger()
+    for queue_handler in [handler for handler in root.handlers if isinstance(handler, DeferredQueueHandler)]:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handler.setLevel(queue_handler.level)
+        root.removeHandler(queue_handler)
+        root.addHandler(handler)
+
+
+class JSONMessage():
+    ''' log message rendered as a JSON object when, and only if, it is formatted '''
+    __slots__ = ('fields',)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return json.dumps(self.fields, ensure_ascii=False, default=str)
+
+
+class RequestLogger():
+    ''' logs one JSON line for a random `sample_rate` fraction of requests, with the
+    document cut to its first `max_chars` characters. Unsampled requests cost one
+    random number; sampled ones a dict, formatted later by the queue listener. '''
+
+    def __init__(self, sample_rate: float=0.01, max_chars: int=200, name: str='d3m_ibex.requests'):
+        self.sample_rate = sample_rate
+        self.max_chars = max_chars
+        self.logger = logging.getLogger(name)
+
+
+    def sampled(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+
+    def log(self, rpc: str, language: str, text: str, entities, seconds: float, **fields):
+        ''' log a request if it is sampled '''
+        if not self.sampled() or not self.logger.isEnabledFor(logging.INFO):
+            return
+        fields.update(
+            rpc=rpc,
+            language=language,
+            chars=len(text),
+            text=text[:self.max_chars],
+            entities=len(entities),
+            ms=round(seconds * 1000, 3),
+        )
+        self.logger.info('%s', JSONMessage(fields))
@@ -0,0 +1,148 @@
+''' Parser arrays (the word vectors table and the weights of the pipeline components)
+exported to .npy files once and memory-mapped, so processes on a host that load the
+same parser share one copy in the page cache instead of each holding its own '''
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import zlib
+
+import numpy
+
+logger = logging.getLogger('d3m_ibex')
+
+# arrays smaller than this stay in process memory; mapping them would save little
+MIN_MAPPED_BYTES = 64 * 1024
+INDEX_FILE = 'index.json'
+
+
+def get_model_arrays(pipe_name, model, seen):
+    ''' (name, array, setter) of each weight of a thinc 8 (spacy 3) model '''
+    arrays = []
+    for index, node in enumerate(model.walk()):
+        if node.id in seen:
+            continue
+        seen.add(node.id)
+        for param_name in node.param_names:
+            if node.has_param(param_name):
+                arrays.append(('%s.%d.%s.%s' % (pipe_name, index, node.name, param_name), node.get_param(param_name),
+                               functools.partial(node.set_param, param_name)))
+    return arrays
+
+
+def get_layer_arrays(pipe_name, model, seen):
+    ''' (name, array, setter) of the parameter memory of each layer of a thinc 7
+    (spacy 2) model. A layer keeps its weights (and gradients, which parsing never
+    touches) in one array, `_mem._mem`, and takes views of it on every access, so
+    replacing that array replaces all of them. '''
+    arrays = []
+    layers = [model]
+    index = 0
+    while layers:
+        layer = layers.pop(0)
+        layer_id = getattr(layer, 'id', id(layer))
+        if layer_id in seen:
+            continue
+        seen.add(layer_id)
+        memory = getattr(layer, '_mem', None)
+        if isinstance(getattr(memory, '_mem', None), numpy.ndarray):
+            arrays.append(('%s.%d.%s.mem' % (pipe_name, index, getattr(layer, 'name', type(layer).__name__)),
+                           memory._mem, functools.partial(setattr, memory, '_mem')))
+        layers.extend(getattr(layer, '_layers', []))
+        index += 1
+    return arrays
+
+
+def get_arrays(parser):
+    ''' (name, array, setter) of the vectors table and of each weight of the pipeline
+    components of a spacy parser, in a fixed order '''
+    arrays = []
+    vectors = parser.vocab.vectors
+    if vectors.data.size:
+        arrays.append(('vectors', vectors.data, functools.partial(setattr, vectors, 'data')))
+
+    seen = set()  # layers shared by several components
+    skipped = []
+    for pipe_name, pipe in parser.pipeline:
+        model = getattr(pipe, 'model', None)
+        if hasattr(model, 'get_param'):  # thinc 7.4 models have walk() too
+            arrays.extend(get_model_arrays(pipe_name, model, seen))
+        elif hasattr(model, '_mem') or hasattr(model, '_layers'):
+            arrays.extend(get_layer_arrays(pipe_name, model, seen))
+        elif model is not None and model is not True:  # True: a spacy 2 pipe not yet trained
+            skipped.append(pipe_name)
+    if skipped:
+        logger.warning("Weights of %s of parser %s are kept in process memory: their models are not thinc models",
+                       ', '.join(skipped), parser.meta.get('name'))
+    return arrays
+
+
+def get_fingerprint(parser, arrays):
+    ''' directory name of the exported arrays of a parser: its name and version, and a
+    digest of the names, shapes and types of its arrays and of a sample of their
+    contents, so a changed model never maps stale arrays '''
+    digest = hashlib.sha1()
+    for name, array, _ in arrays:
+        data = numpy.ascontiguousarray(array).view(numpy.uint8).reshape(-1)
+        digest.update(('%s %s %s %d;' % (name, array.shape, array.dtype, zlib.crc32(data[:4096]) ^ zlib.crc32(data[-4096:]))).encode('utf-8'))
+    return '%s_%s-%s-%s' % (parser.meta.get('lang', 'xx'), parser.meta.get('name', 'parser'),
+                            parser.meta.get('version', '0'), digest.hexdigest()[:12])
+
+
+def export_arrays(arrays, path: str):
+    ''' write arrays to .npy files in directory `path`, with an index of their names.
+    The directory appears complete or not at all, so processes exporting the same
+    parser at once do not see each other's partial files. '''
+    temp_path = '%s.%d.tmp' % (path, os.getpid())
+    os.makedirs(temp_path, exist_ok=True)
+    index = []
+    for number, (name, array, _) in enumerate(arrays):
+        file_name = '%03d.npy' % number
+        numpy.save(os.path.join(temp_path, file_name), numpy.ascontiguousarray(array))
+        index.append({'name': name, 'file': file_name})
+    with open(os.path.join(temp_path, INDEX_FILE), 'w') as index_file:
+        json.dump(index, index_file)
+    try:
+        os.rename(temp_path, path)
+    except OSError:
+        # another process exported it first
+        shutil.rmtree(temp_path, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+
+
+def map_parser(parser, directory: str):
+    ''' replace the large arrays of a loaded parser by memory maps of their copies
+    under `directory`, exporting them there first if no process has yet. Returns the
+    number of bytes mapped.
+
+    Maps are copy-on-write ('c'), as thinc and spacy kernels take writable buffers:
+    pages are shared with every other process mapping the file until written, which
+    parsing never does. '''
+    arrays = [(name, array, set_array) for name, array, set_array in get_arrays(parser)
+              if isinstance(array, numpy.ndarray) and array.nbytes >= MIN_MAPPED_BYTES]
+    if not arrays:
+        return 0
+
+    path = os.path.join(directory, get_fingerprint(parser, arrays))
+    if not os.path.isdir(path):
+        os.makedirs(directory, exist_ok=True)
+        export_arrays(arrays, path)
+        logger.info("Exported %d arrays of parser %s to %s", len(arrays), parser.meta.get('name'), path)
+
+    with open(os.path.join(path, INDEX_FILE)) as index_file:
+        index = json.load(index_file)
+    if [entry['name'] for entry in index] != [name for name, _, _ in arrays]:
+        raise Exception('arrays in %s do not match the parser' % path)
+    # map and check all arrays before replacing any, so a parser is never half mapped
+    mapped = []
+    for (name, array, _), entry in zip(arrays, index):
+        mapped_array = numpy.load(os.path.join(path, entry['file']), mmap_mode='c')
+        if mapped_array.shape != array.shape or mapped_array.dtype != array.dtype:
+            raise Exception('array %s in %s does not match the parser' % (name, path))
+        mapped.append(mapped_array)
+    for (_, _, set_array), mapped_array in zip(arrays, mapped):
+        set_array(mapped_array)
+    return sum(array.nbytes for array in mapped)
@@ -0,0 +1,263 @@
+''' Prometheus-style metrics: counters, gauges and histograms rendered in the Prometheus
+text exposition format, and a small HTTP server exposing them on /metrics '''
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+logger = logging.getLogger('d3m_ibex')
+
+# all metrics, in the order they are rendered
+REGISTRY = []
+
+# upper bounds of the default histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+def format_labels(names, values, extra=''):
+    pairs = ['%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric():
+    ''' a named metric with optional labels. Values are kept per tuple of label
+    values; `labels(...)` returns the child for one such tuple. '''
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=(), register: bool=True):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.children = {}
+        self.function = None
+        if register:
+            REGISTRY.append(self)
+
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.new_child())
+        return child
+
+
+    def set_function(self, function):
+        ''' compute the values at scrape time instead: `function` returns a dict from
+        tuples of label values (or a number, without labels) to values '''
+        self.function = function
+        return self
+
+
+    def samples(self):
+        ''' (suffix, label values, extra label, value) tuples of this metric '''
+        if self.function is not None:
+            values = self.function()
+            if not isinstance(values, dict):
+                values = {(): values}
+            return [('', labels, '', value) for labels, value in values.items() if value is not None]
+        with self.lock:
+            children = list(self.children.items())
+        return [sample for labels, child in children for sample in child.samples(labels)]
+
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s %s' % (self.name, self.kind)]
+        for suffix, labels, extra, value in self.samples():
+            lines.append('%s%s%s %s' % (self.name, suffix, format_labels(self.labelnames, labels, extra), format_value(value)))
+        return '\n'.join(lines)
+
+
+class Value():
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def take(self):
+        ''' the value, resetting it '''
+        with self.lock:
+            value, self.value = self.value, 0
+        return value
+
+    def add(self, value):
+        self.inc(value)
+
+    def samples(self, labels):
+        return [('', labels, '', self.value)]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def new_child(self):
+        return Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def new_child(self):
+        return Value()
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class Buckets():
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def take(self):
+        ''' (bucket counts, sum) of the observations, resetting them; None without any '''
+        with self.lock:
+            if not any(self.counts):
+                return None
+            value = (self.counts, self.sum)
+            self.counts, self.sum = [0] * len(self.counts), 0.0
+        return value
+
+    def add(self, value):
+        counts, total = value
+        with self.lock:
+            self.counts = [count + other for count, other in zip(self.counts, counts)]
+            self.sum += total
+
+    def samples(self, labels):
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        samples, cumulative = [], 0
+        for bound, count in zip(self.bounds + (float('inf'),), counts):
+            cumulative += count
+            samples.append(('_bucket', labels, 'le="%s"' % format_value(bound), cumulative))
+        samples.append(('_sum', labels, '', total))
+        samples.append(('_count', labels, '', cumulative))
+        return samples
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS, register: bool=True):
+        self.buckets = tuple(float(bound) for bound in buckets)
+        super().__init__(name, documentation, labelnames, register)
+
+    def new_child(self):
+        return Buckets(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class Timer():
+    ''' context manager observing its elapsed time on a histogram child '''
+    __slots__ = ('child', 'start')
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+def render():
+    ''' all registered metrics in the Prometheus text format '''
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+def take_deltas(metrics):
+    ''' what counters and histograms of `metrics` recorded since the last call, as
+    {name: {label values: value}}, resetting them. Worker processes send these to the
+    parent, which exports them after adding them to its own metrics with add_deltas. '''
+    deltas = {}
+    for metric in metrics:
+        with metric.lock:
+            children = list(metric.children.items())
+        values = {labels: value for labels, value in ((labels, child.take()) for labels, child in children) if value}
+        if values:
+            deltas[metric.name] = values
+    return deltas
+
+
+def add_deltas(deltas):
+    ''' add the output of take_deltas in another process to the registered metrics '''
+    metrics = {metric.name: metric for metric in REGISTRY}
+    for name, values in deltas.items():
+        metric = metrics.get(name)
+        if metric is None:
+            continue
+        for labels, value in values.items():
+            metric.labels(*labels).add(value)
+
+
+# metrics of the extraction pipeline, per spacy parser. Stages are timed per call, so
+# a get_entities_batch call makes one observation of each stage for the whole batch.
+STAGE_SECONDS = Histogram('ibex_stage_seconds',
+    'Time spent per extraction stage: prep (prep_text), parse (spaCy), filter (entity filtering), serialize (result message)',
+    ['stage', 'parser'])
+BATCH_SIZE = Histogram('ibex_batch_size', 'Documents per get_entities_batch call', ['parser'], buckets=SIZE_BUCKETS)
+DOCUMENTS = Counter('ibex_documents_total', 'Documents extracted, including cache hits', ['parser'])
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes are not worth a log line each
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_http_server(port: int, address: str=''):
+    ''' serve /metrics on a daemon thread. Returns the server. '''
+    server = MetricsServer((address, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='ibex-metrics', daemon=True).start()
+    logger.info("serving metrics on http://%s:%d/metrics", address or '0.0.0.0', port)
+    return server
@@ -0,0 +1,329 @@
+''' Registry of the spacy parser used for each language: loads parsers on first use,
+once, and evicts the least recently used ones to keep loaded parsers within a memory
+budget '''
+import collections
+import gc
+import importlib
+import logging
+import os
+import threading
+import time
+
+from d3m_ibex.metrics import Counter, Gauge
+
+logger = logging.getLogger('d3m_ibex')
+
+# spacy parser of each language that can be enabled by name alone, e.g. in the models
+# option of config.ini. There is no official spacy model for Hungarian; hu_core_news_lg
+# is the HuSpaCy one.
+DEFAULT_PARSERS = {
+    'english': 'en_core_web_md',
+    'spanish': 'es_core_news_md',
+    'french': 'fr_core_news_md',
+    'italian': 'it_core_news_md',
+    'hungarian': 'hu_core_news_lg',
+}
+
+# ISO 639-1 codes of languages, as sent in the language field of messages
+LANGUAGE_CODES = {
+    'english': 'en', 'spanish': 'es', 'french': 'fr', 'italian': 'it', 'hungarian': 'hu',
+    'german': 'de', 'portuguese': 'pt', 'dutch': 'nl', 'danish': 'da', 'finnish': 'fi',
+    'norwegian': 'no', 'romanian': 'ro', 'russian': 'ru', 'swedish': 'sv',
+}
+
+# load time and resident memory growth of each parser, recorded when it is loaded
+PARSER_STATS = {}
+
+LOADS = Counter('ibex_parser_loads_total', 'Parsers loaded, including reloads after eviction', ['parser'])
+EVICTIONS = Counter('ibex_parser_evictions_total', 'Parsers evicted to stay within the memory budget', ['parser'])
+RECYCLES = Counter('ibex_parser_recycles_total', 'Parsers replaced by a fresh copy after their vocab grew past max_vocab_growth',
+                   ['parser'])
+
+
+def get_rss(pid=None):
+    ''' resident set size of this process (or of process `pid`) in bytes, or None where
+    it cannot be read '''
+    try:
+        with open('/proc/%s/statm' % (pid or 'self')) as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_disk_size(path: str):
+    ''' size in bytes of a file, or of the files under a directory '''
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+
+def parse_models(spec: str):
+    ''' language to parser mapping from a comma-separated list of `language` (for its
+    parser in DEFAULT_PARSERS) or `language:parser` entries, where parser is the name
+    of an installed spacy model package or the path of a model directory '''
+    models = collections.OrderedDict()
+    for entry in spec.split(','):
+        language, _, parser_name = entry.strip().partition(':')
+        language, parser_name = language.strip().lower(), parser_name.strip()
+        if not language:
+            continue
+        parser_name = parser_name or DEFAULT_PARSERS.get(language)
+        if not parser_name:
+            raise Exception('no default parser for language %s, give one as %s:<parser>' % (language, language))
+        models[language] = parser_name
+    return models
+
+
+class ParserRegistry():
+    ''' Maps languages to spacy parsers and holds the loaded ones, shared by all Ibex
+    instances of a process.
+
+    A parser is loaded the first time it is asked for. Each parser has a lock of its
+    own, so concurrent requests for one parser wait for a single load while parsers
+    that are already loaded are served without waiting.
+
+    With a `memory_budget` in bytes, the least recently used parsers are evicted once
+    the loaded ones take more than the budget, and reloaded when next asked for. The
+    size of a parser is the resident memory this process grew by while loading it
+    (overestimated when other parsers load at the same time), or the size of its
+    files where that cannot be measured. A parser in use when it is evicted stays in
+    memory until its last caller is done with it.
+
+    spacy adds the strings of unseen tokens to the vocab of a parser, which never
+    shrinks. With `max_vocab_growth`, a parser that has added more strings than that
+    since it was loaded is replaced by a fresh copy, loaded on a background thread
+    while the old one keeps serving (see check_growth).
+
+    With `mmap_dir`, the word vectors and weights of each parser are exported there
+    once and memory-mapped by every process that loads it (see d3m_ibex.mapped), so
+    workers on a host share one copy of them.
+    '''
+
+    def __init__(self, models=None, memory_budget: int=None, max_vocab_growth: int=None, mmap_dir: str=None):
+        # language -> parser name, and the languages in the order they were registered.
+        # Both are updated in place, so modules can keep references to them.
+        self.models = {}
+        self.languages = []
+        self.memory_budget = memory_budget
+        self.max_vocab_growth = max_vocab_growth
+        self.mmap_dir = mmap_dir
+        # loaded parsers by name, least recently used first
+        self.parsers = collections.OrderedDict()
+        self.sizes = {}
+        # vocab size of each loaded parser when it was loaded, and the parsers being
+        # replaced by a fresh copy
+        self.vocab_sizes = {}
+        self.recycling = set()
+        self.lock = threading.Lock()
+        self.load_locks = {}
+        for language, parser_name in (models if models is not None else DEFAULT_PARSERS).items():
+            self.register(language, parser_name)
+
+
+    def register(self, language: str, parser_name: str):
+        ''' use the parser named `parser_name` for `language` '''
+        language = language.lower()
+        self.models[language] = parser_name
+        if language not in self.languages:
+            self.languages.append(language)
+
+
+    def configure(self, models, memory_budget: int=None, max_vocab_growth: int=None, mmap_dir: str=None):
+        ''' replace the registered languages by `models` (language -> parser name) and
+        set the memory budget, vocab growth limit and directory of memory-mapped
+        arrays. Loaded parsers no longer registered are evicted; those still
+        registered are only mapped once they are next loaded. '''
+        with self.lock:
+            self.models.clear()
+            del self.languages[:]
+            for language, parser_name in models.items():
+                self.register(language, parser_name)
+            self.memory_budget = memory_budget
+            self.max_vocab_growth = max_vocab_growth
+            self.mmap_dir = mmap_dir
+            for parser_name in [name for name in self.parsers if name not in self.models.values()]:
+                self.evict(parser_name)
+            self.enforce_budget()
+
+
+    def settings(self):
+        ''' keyword arguments of configure that reproduce this registry, e.g. in a
+        spawned worker process '''
+        return {'models': dict(self.models), 'memory_budget': self.memory_budget,
+                'max_vocab_growth': self.max_vocab_growth, 'mmap_dir': self.mmap_dir}
+
+
+    def get_parser_name(self, language: str):
+        ''' resolve a language (or the name of a registered parser) to a parser name '''
+        parser_name = language if language in self.models.values() else self.models.get(language.lower())
+        if not parser_name:
+            raise Exception('language not supported')
+        return parser_name
+
+
+    def get_language(self, code: str):
+        ''' registered language with an ISO 639-1 code or name, or None '''
+        code = (code or '').lower()
+        for language in self.languages:
+            if code == language or code == LANGUAGE_CODES.get(language):
+                return language
+        return None
+
+
+    def get(self, parser_name: str):
+        ''' the loaded parser named `parser_name`, loading it first if needed '''
+        with self.lock:
+            parser = self.parsers.get(parser_name)
+            if parser is not None:
+                self.parsers.move_to_end(parser_name)
+                return parser
+            load_lock = self.load_locks.setdefault(parser_name, threading.Lock())
+
+        with load_lock:
+            # another thread may have loaded it while we waited for the lock
+            with self.lock:
+                parser = self.parsers.get(parser_name)
+                if parser is not None:
+                    self.parsers.move_to_end(parser_name)
+                    return parser
+                # make room up front if the parser was loaded before, so memory does
+                # not peak over the budget while it loads
+                self.enforce_budget(PARSER_STATS.get(parser_name, {}).get('size_bytes', 0))
+
+            parser, size = self.load(parser_name)
+
+            with self.lock:
+                self.parsers[parser_name] = parser
+                self.sizes[parser_name] = size
+                self.vocab_sizes[parser_name] = len(parser.vocab.strings)
+                self.enforce_budget()
+        gc.collect()
+        return parser
+
+
+    def vocab_growth(self, parser_name: str):
+        ''' strings added to the vocab of a loaded parser since it was loaded, or None
+        if it is not loaded '''
+        parser = self.parsers.get(parser_name)
+        if parser is None or parser_name not in self.vocab_sizes:
+            return None
+        return len(parser.vocab.strings) - self.vocab_sizes[parser_name]
+
+
+    def check_growth(self, parser_name: str):
+        ''' start replacing a parser by a fresh copy if its vocab grew past
+        max_vocab_growth. Cheap enough to call after every batch. Returns whether a
+        replacement was started. '''
+        if not self.max_vocab_growth:
+            return False
+        growth = self.vocab_growth(parser_name)
+        if growth is None or growth <= self.max_vocab_growth:
+            return False
+        with self.lock:
+            if parser_name in self.recycling:
+                return False
+            self.recycling.add(parser_name)
+        logger.info("Vocab of parser %s grew by %d strings, loading a fresh copy", parser_name, growth)
+        threading.Thread(target=self.recycle, args=(parser_name,), name='recycle-%s' % parser_name, daemon=True).start()
+        return True
+
+
+    def recycle(self, parser_name: str):
+        ''' load a fresh copy of a parser and swap it in for the loaded one. Calls in
+        flight finish on the old copy, which is freed after them. '''
+        try:
+            with self.load_locks.setdefault(parser_name, threading.Lock()):
+                parser, size = self.load(parser_name)
+                with self.lock:
+                    if parser_name in self.parsers:
+                        self.parsers[parser_name] = parser
+                        self.sizes[parser_name] = size
+                        self.vocab_sizes[parser_name] = len(parser.vocab.strings)
+                        RECYCLES.labels(parser_name).inc()
+            gc.collect()
+        except Exception:
+            logger.exception("Problem recycling parser %s", parser_name)
+        finally:
+            with self.lock:
+                self.recycling.discard(parser_name)
+
+
+    def load(self, parser_name: str):
+        ''' load a parser from a model package or directory. Returns the parser and its
+        size in bytes. '''
+        try:
+            start_time, start_rss = time.time(), get_rss()
+            if os.path.isdir(parser_name):
+                import spacy
+                parser, path = spacy.load(parser_name), parser_name
+            else:
+                parser_package = importlib.import_module(parser_name)
+                logger.info("Success importing %s", parser_name)
+                parser = parser_package.load()
+                path = parser_package.__path__[0] if hasattr(parser_package, '__path__') else parser_package.__file__
+        except Exception:
+            logger.exception("Error loading parser %s", parser_name)
+            raise Exception('cannot load parser %s' % parser_name)
+
+        mapped = 0
+        if self.mmap_dir:
+            try:
+                from d3m_ibex.mapped import map_parser
+                mapped = map_parser(parser, self.mmap_dir)
+            except Exception:
+                logger.exception("Problem memory-mapping parser %s, keeping it in process memory", parser_name)
+        end_rss = get_rss()
+
+        rss = end_rss - start_rss if start_rss is not None and end_rss is not None else None
+        size = rss if rss and rss > 0 else get_disk_size(path)
+        # reloads reuse memory freed by the evicted copy and measure smaller
+        size = max(size, PARSER_STATS.get(parser_name, {}).get('size_bytes', 0))
+        PARSER_STATS[parser_name] = {'load_seconds': time.time() - start_time, 'rss_bytes': rss, 'size_bytes': size,
+                                     'mapped_bytes': mapped}
+        LOADS.labels(parser_name).inc()
+        logger.info("Loaded parser %s in %.2f sec, %.0f MB, %.0f MB of it memory-mapped",
+            parser_name, time.time() - start_time, size / 2**20, mapped / 2**20)
+        return parser, size
+
+
+    def enforce_budget(self, incoming: int=0):
+        ''' evict least recently used parsers until the loaded ones plus `incoming`
+        bytes fit the memory budget. The most recently used parser is kept unless a
+        parser is incoming. Call with self.lock held. '''
+        if not self.memory_budget:
+            return
+        keep = 0 if incoming else 1
+        while len(self.parsers) > keep and sum(self.sizes.values()) + incoming > self.memory_budget:
+            self.evict(next(iter(self.parsers)))
+
+
+    def evict(self, parser_name: str):
+        ''' drop a loaded parser. Call with self.lock held. '''
+        self.parsers.pop(parser_name, None)
+        self.vocab_sizes.pop(parser_name, None)
+        size = self.sizes.pop(parser_name, 0)
+        EVICTIONS.labels(parser_name).inc()
+        logger.info("Evicted parser %s (%.0f MB)", parser_name, size / 2**20)
+
+
+    def memory(self):
+        ''' total size in bytes of the loaded parsers '''
+        with self.lock:
+            return sum(self.sizes.values())
+
+
+REGISTRY = ParserRegistry(collections.OrderedDict((language, DEFAULT_PARSERS[language]) for language in ('english', 'spanish')))
+
+Gauge('ibex_parser_memory_bytes', 'Size of each loaded parser (resident memory growth measured while loading it)',
+      ['parser']).set_function(lambda: {(parser_name,): size for parser_name, size in list(REGISTRY.sizes.items())})
+Gauge('ibex_parsers_loaded', 'Parsers loaded in this process').set_function(lambda: len(REGISTRY.parsers))
+Gauge('ibex_parser_vocab_growth', 'Strings added to the vocab of each loaded parser since it was loaded',
+      ['parser']).set_function(lambda: {(parser_name,): REGISTRY.vocab_growth(parser_name) or 0
+                                        for parser_name in list(REGISTRY.parsers)})
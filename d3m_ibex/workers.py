@@ -0,0 +1,317 @@
+''' Pool of entity extraction worker processes '''
+import itertools
+import logging
+import multiprocessing
+import multiprocessing.connection
+import signal
+import threading
+from concurrent.futures import Future
+
+from d3m_ibex.logs import log_directly
+from d3m_ibex.metrics import BATCH_SIZE, DOCUMENTS, STAGE_SECONDS, add_deltas, take_deltas
+from d3m_ibex.registry import RECYCLES, REGISTRY, get_rss
+
+# languages with a registered parser; d3m_ibex.d3m_ibex, and with it spacy, is only
+# imported once parsers are needed
+LANGUAGES = REGISTRY.languages
+
+# metrics recorded in worker processes, sent back with each result and exported by
+# the parent
+WORKER_METRICS = [STAGE_SECONDS, BATCH_SIZE, DOCUMENTS, RECYCLES]
+
+logger = logging.getLogger('d3m_ibex')
+
+
+class WorkerDiedError(Exception):
+    ''' raised for batches that were in flight on a worker process that died '''
+    pass
+
+
+def get_worker_metrics():
+    ''' what WORKER_METRICS recorded since the last call, and the vocab growth of each
+    loaded parser '''
+    return take_deltas(WORKER_METRICS), {parser_name: REGISTRY.vocab_growth(parser_name) or 0
+                                         for parser_name in list(REGISTRY.parsers)}
+
+
+def worker_main(index: int, tasks, results, languages, profile, cache, chunk_size, registry_settings,
+                exclude_settings=None, dedup=None, max_rss=None):
+    ''' worker process loop: load parsers once, then extract entities from batches of
+    documents until a None task arrives. Results are (task id, ok, entities or error,
+    metrics) tuples, with metrics from get_worker_metrics. Once its resident memory
+    passes `max_rss` bytes after a batch, the worker asks to be replaced with a
+    (None, True, rss, None) result and carries on with the batches already queued to
+    it. '''
+    # the parent handles Ctrl-C and shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    log_directly()
+    # a spawned process starts with the default parsers; a forked one keeps those it has
+    REGISTRY.configure(**registry_settings)
+    from d3m_ibex.d3m_ibex import EXCLUDE, Ibex
+    # a forked process has the parent's exclude list but not its watcher thread
+    if exclude_settings:
+        EXCLUDE.configure(**exclude_settings)
+
+    # one long-lived extractor per language; parsers inherited from the parent on fork are not reloaded
+    extractors = {language: Ibex(language=language, profile=profile, cache=cache, preload=language in languages,
+                                 chunk_size=chunk_size, dedup=dedup)
+                  for language in LANGUAGES}
+    Ibex(profile=profile).warmup(languages)
+
+    retiring = False
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        task_id, documents, language, method = task
+        try:
+            ibex = extractors.get(language) or Ibex(language=language, profile=profile, cache=cache, chunk_size=chunk_size,
+                                                    dedup=dedup)
+            entities = getattr(ibex, method)(documents, language)
+            results.send((task_id, True, entities, get_worker_metrics()))
+        except Exception as ex:
+            logger.exception("Worker %d failed extracting a batch of %d documents", index, len(documents))
+            results.send((task_id, False, repr(ex), get_worker_metrics()))
+
+        if max_rss and not retiring:
+            rss = get_rss()
+            if rss is not None and rss > max_rss:
+                results.send((None, True, rss, None))
+                retiring = True
+
+
+class Worker():
+    ''' a worker process, its task queue, the read end of its result pipe and the ids
+    of the tasks sent to it '''
+
+    def __init__(self, process, tasks, results):
+        self.process = process
+        self.tasks = tasks
+        self.results = results
+        self.closed = False  # result pipe hit EOF, i.e. the process is gone
+        self.pending = set()
+        self.restarts = 0
+        self.recycles = 0
+        self.vocab_growth = {}  # parser name -> strings added, as last reported
+
+
+class WorkerPool():
+    ''' Runs `n_workers` processes that each hold their own spacy parsers, so parsing
+    scales past the one core a single Python process can use.
+
+    With the default 'fork' start method the parsers for `languages` are loaded in the
+    parent before any worker starts, so workers share the model weights copy-on-write
+    instead of each loading their own. Start the pool before creating the gRPC server:
+    forking a process that already runs gRPC threads is not safe. For the same reason
+    workers started later, to replace dead or recycled ones, are spawned instead and
+    load their own parsers.
+
+    Batches go to the worker with the fewest batches in flight. Each worker reports back
+    on a pipe of its own, so a worker killed mid-write cannot wedge the others. A monitor
+    thread checks the workers every `health_check_interval` seconds, fails the batches of
+    a dead worker with WorkerDiedError and starts a replacement.
+
+    With `max_rss` in bytes, a worker whose resident memory grows past it (e.g. through
+    spacy vocab growth, or memory fragmentation a fresh parser copy does not give back)
+    is replaced by a new process and exits once it has finished its queued batches.
+    '''
+
+    def __init__(self, n_workers: int, languages=LANGUAGES, health_check_interval: float=1.0,
+                 start_method: str='fork', profile: str='full', cache=None, chunk_size: int=None,
+                 exclude_settings=None, dedup=None, max_rss: int=None):
+        self.n_workers = n_workers
+        self.languages = languages
+        self.profile = profile
+        # EntityCache copied into each worker; share results across workers through its path
+        self.cache = cache
+        # documents longer than this are parsed in chunks, see Ibex.get_entities_chunked
+        self.chunk_size = chunk_size
+        # ExcludeList.configure arguments of the exclude list used and watched by workers
+        self.exclude_settings = exclude_settings
+        # NearDuplicateWindow copied into each worker, which then keeps its own window
+        self.dedup = dedup
+        self.max_rss = max_rss
+        self.health_check_interval = health_check_interval
+        self.start_method = start_method
+        self.context = multiprocessing.get_context(start_method)
+        # by the time a worker is replaced, gRPC, metrics and watcher threads are
+        # running, and a fork could copy a lock one of them holds into a child that
+        # would then wait on it forever
+        self.restart_context = multiprocessing.get_context('spawn') if start_method == 'fork' else self.context
+
+        self.workers = []
+        self.retired = []  # workers being recycled, finishing their queued batches
+        self.dead = []  # replaced dead workers whose result pipes the collector closes
+        self.futures = {}  # task id -> Future
+        self.task_ids = itertools.count()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.collector = None
+
+
+    def start(self):
+        ''' preload parsers, start the worker processes and the result and monitor threads '''
+        if self.start_method == 'fork':
+            from d3m_ibex.d3m_ibex import Ibex
+            Ibex(profile=self.profile).warmup(self.languages)
+
+        self.workers = [self.start_worker(index) for index in range(self.n_workers)]
+
+        self.collector = threading.Thread(target=self.collect, daemon=True)
+        self.collector.start()
+        threading.Thread(target=self.monitor, daemon=True).start()
+        logger.info("started %d extraction worker processes", self.n_workers)
+        return self
+
+
+    def start_worker(self, index: int, context=None):
+        context = context or self.context
+        tasks = context.Queue()
+        results, worker_results = context.Pipe(duplex=False)
+        process = context.Process(target=worker_main,
+                                  args=(index, tasks, worker_results, self.languages, self.profile, self.cache,
+                                        self.chunk_size, REGISTRY.settings(), self.exclude_settings,
+                                        self.dedup, self.max_rss),
+                                  name='ibex-worker-%d' % index, daemon=True)
+        process.start()
+        # only the worker holds the write end, so the pipe hits EOF when it dies
+        worker_results.close()
+        return Worker(process, tasks, results)
+
+
+    def submit(self, documents, language: str='english', method: str='get_entities_batch'):
+        ''' send a batch of documents to the least busy worker. Returns a Future resolving
+        to one entity list per document, from the Ibex batch `method` (get_entities_batch
+        or get_entity_spans_batch). '''
+        future = Future()
+        with self.lock:
+            task_id = next(self.task_ids)
+            worker = min(self.workers, key=lambda worker: len(worker.pending))
+            worker.pending.add(task_id)
+            self.futures[task_id] = future
+            worker.tasks.put((task_id, list(documents), language, method))
+        return future
+
+
+    def get_entities_batch(self, documents, language: str='english'):
+        ''' blocking equivalent of Ibex.get_entities_batch, run on a worker process '''
+        return self.submit(documents, language).result()
+
+
+    def collect(self):
+        ''' result thread: resolve futures as workers report back '''
+        while not self.stopped.is_set():
+            with self.lock:
+                dead, self.dead = self.dead, []
+                workers = {worker.results: worker for worker in self.workers + self.retired if not worker.closed}
+            # only this thread closes result pipes, so none is closed while waited on
+            for worker in dead:
+                worker.results.close()
+            # time out now and then to pick up replacement workers
+            try:
+                ready = multiprocessing.connection.wait(list(workers), timeout=self.health_check_interval)
+            except (OSError, ValueError):
+                logger.exception("Waiting on worker results failed, rebuilding the pipe list")
+                continue
+            for results in ready:
+                worker = workers[results]
+                try:
+                    task_id, ok, payload, worker_metrics = results.recv()
+                except (EOFError, OSError):
+                    worker.closed = True  # dead; the monitor fails its batches and replaces it
+                    if worker in self.retired:
+                        self.remove_retired(worker)
+                    continue
+
+                if worker_metrics is not None:
+                    deltas, worker.vocab_growth = worker_metrics
+                    add_deltas(deltas)
+                if task_id is None:
+                    self.recycle(worker, payload)
+                    continue
+
+                with self.lock:
+                    future = self.futures.pop(task_id, None)
+                    worker.pending.discard(task_id)
+                if future is None:
+                    continue  # already failed by the monitor
+                if ok:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(Exception(payload))
+
+
+    def monitor(self):
+        ''' health thread: replace dead workers, failing the batches they held '''
+        while not self.stopped.wait(self.health_check_interval):
+            with self.lock:
+                for index, worker in enumerate(self.workers):
+                    if worker.process.is_alive() or self.stopped.is_set():
+                        continue
+                    logger.error("Extraction worker %d (pid %s) died with exit code %s, restarting",
+                        index, worker.process.pid, worker.process.exitcode)
+                    for task_id in worker.pending:
+                        future = self.futures.pop(task_id, None)
+                        if future is not None:
+                            future.set_exception(WorkerDiedError("worker %d died" % index))
+                    self.dead.append(worker)
+                    replacement = self.start_worker(index, self.restart_context)
+                    replacement.restarts = worker.restarts + 1
+                    self.workers[index] = replacement
+
+
+    def recycle(self, worker, rss):
+        ''' replace a worker that passed max_rss. It is told to exit after the batches
+        queued to it, and new batches go to its replacement. '''
+        with self.lock:
+            if self.stopped.is_set() or worker not in self.workers:
+                return
+            index = self.workers.index(worker)
+            logger.info("Recycling extraction worker %d (pid %s) at %.0f MB resident memory",
+                index, worker.process.pid, rss / 2**20)
+            replacement = self.start_worker(index, self.restart_context)
+            replacement.restarts = worker.restarts
+            replacement.recycles = worker.recycles + 1
+            self.workers[index] = replacement
+            self.retired.append(worker)
+            worker.tasks.put(None)
+
+
+    def remove_retired(self, worker):
+        ''' forget a recycled worker that exited, failing any batches it did not finish '''
+        worker.process.join(1.0)
+        with self.lock:
+            self.retired.remove(worker)
+            for task_id in worker.pending:
+                future = self.futures.pop(task_id, None)
+                if future is not None:
+                    future.set_exception(WorkerDiedError("recycled worker (pid %s) exited" % worker.process.pid))
+        worker.results.close()
+
+
+    def health(self):
+        ''' per-worker status: pid, liveness, batches in flight, restart and recycle
+        counts, resident memory in bytes and vocab growth of each parser '''
+        with self.lock:
+            return [{'pid': worker.process.pid, 'alive': worker.process.is_alive(),
+                     'pending': len(worker.pending), 'restarts': worker.restarts,
+                     'recycles': worker.recycles, 'rss': get_rss(worker.process.pid),
+                     'vocab_growth': dict(worker.vocab_growth)}
+                    for worker in self.workers]
+
+
+    def stop(self, timeout: float=5.0):
+        ''' ask workers to exit after their queued batches, terminating stragglers '''
+        self.stopped.set()
+        with self.lock:
+            workers = list(self.workers)
+            retired = list(self.retired)
+        for worker in workers:
+            worker.tasks.put(None)
+        workers += retired
+        for worker in workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        if self.collector is not None:
+            self.collector.join(timeout)
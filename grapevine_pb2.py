@@ -19,7 +19,7 @@ DESCRIPTOR = _descriptor.FileDescriptor(
   package='grapevine',
   syntax='proto3',
   serialized_options=None,
-  serialized_pb=_b('\n\x0fgrapevine.proto\x12\tgrapevine\"J\n\x07Message\x12\x0b\n\x03raw\x18\x01 \x01(\t\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x10\n\x08language\x18\x03 \x01(\t\x12\x12\n\ncreated_at\x18\x04 \x01(\x03\"\x87\x01\n\x0e\x43lassification\x12\x0e\n\x06\x64omain\x18\x01 \x01(\t\x12\x12\n\nprediction\x18\x02 \x01(\t\x12\x12\n\nconfidence\x18\x03 \x01(\x01\x12\r\n\x05model\x18\x04 \x01(\t\x12\x0f\n\x07version\x18\x05 \x01(\t\x12\x1d\n\x04meta\x18\x06 \x01(\x0b\x32\x0f.grapevine.Meta\".\n\x04Meta\x12&\n\tsentences\x18\x01 \x03(\x0b\x32\x13.grapevine.Sentence\"F\n\x08Sentence\x12\x16\n\x0esentence_score\x18\x01 \x01(\x01\x12\x13\n\x0bword_scores\x18\x02 \x03(\x01\x12\r\n\x05words\x18\x03 \x03(\t\"]\n\nExtraction\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0e\n\x06values\x18\x02 \x03(\t\x12\x12\n\nconfidence\x18\x03 \x01(\x01\x12\r\n\x05model\x18\x04 \x01(\t\x12\x0f\n\x07version\x18\x05 \x01(\t2I\n\nClassifier\x12;\n\x08\x43lassify\x12\x12.grapevine.Message\x1a\x19.grapevine.Classification\"\x00\x32\x43\n\tExtractor\x12\x36\n\x07\x45xtract\x12\x12.grapevine.Message\x1a\x15.grapevine.Extraction\"\x00\x62\x06proto3')
+  serialized_pb=_b('\n\x0fgrapevine.proto\x12\tgrapevine\"d\n\x07Message\x12\x0b\n\x03raw\x18\x01 \x01(\t\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x10\n\x08language\x18\x03 \x01(\t\x12\x12\n\ncreated_at\x18\x04 \x01(\x03\x12\n\n\x02id\x18\x05 \x01(\t\x12\x0c\n\x04rich\x18\x06 \x01(\x08\"4\n\x0cMessageBatch\x12$\n\x08messages\x18\x01 \x03(\x0b\x32\x12.grapevine.Message\"\x87\x01\n\x0e\x43lassification\x12\x0e\n\x06\x64omain\x18\x01 \x01(\t\x12\x12\n\nprediction\x18\x02 \x01(\t\x12\x12\n\nconfidence\x18\x03 \x01(\x01\x12\r\n\x05model\x18\x04 \x01(\t\x12\x0f\n\x07version\x18\x05 \x01(\t\x12\x1d\n\x04meta\x18\x06 \x01(\x0b\x32\x0f.grapevine.Meta\".\n\x04Meta\x12&\n\tsentences\x18\x01 \x03(\x0b\x32\x13.grapevine.Sentence\"F\n\x08Sentence\x12\x16\n\x0esentence_score\x18\x01 \x01(\x01\x12\x13\n\x0bword_scores\x18\x02 \x03(\x01\x12\r\n\x05words\x18\x03 \x03(\t\"\x9d\x01\n\nExtraction\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0e\n\x06values\x18\x02 \x03(\t\x12\x12\n\nconfidence\x18\x03 \x01(\x01\x12\r\n\x05model\x18\x04 \x01(\t\x12\x0f\n\x07version\x18\x05 \x01(\t\x12\n\n\x02id\x18\x06 \x01(\t\x12\r\n\x05index\x18\x07 \x01(\x05\x12#\n\x08\x65ntities\x18\x08 \x03(\x0b\x32\x11.grapevine.Entity\"n\n\x06\x45ntity\x12\x0c\n\x04text\x18\x01 \x01(\t\x12\r\n\x05label\x18\x02 \x01(\t\x12\r\n\x05start\x18\x03 \x01(\x05\x12\x0b\n\x03\x65nd\x18\x04 \x01(\x05\x12\r\n\x05\x63ount\x18\x05 \x01(\x05\x12\x0e\n\x06starts\x18\x06 \x03(\x05\x12\x0c\n\x04\x65nds\x18\x07 \x03(\x05\"=\n\x0f\x45xtractionBatch\x12*\n\x0b\x65xtractions\x18\x01 \x03(\x0b\x32\x15.grapevine.Extraction2I\n\nClassifier\x12;\n\x08\x43lassify\x12\x12.grapevine.Message\x1a\x19.grapevine.Classification\"\x00\x32\xcc\x01\n\tExtractor\x12\x36\n\x07\x45xtract\x12\x12.grapevine.Message\x1a\x15.grapevine.Extraction\"\x00\x12@\n\rExtractStream\x12\x12.grapevine.Message\x1a\x15.grapevine.Extraction\"\x00(\x01\x30\x01\x12\x45\n\x0c\x45xtractBatch\x12\x17.grapevine.MessageBatch\x1a\x1a.grapevine.ExtractionBatch\"\x00\x62\x06proto3')
 )
 
 
@@ -60,6 +60,20 @@ _MESSAGE = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='id', full_name='grapevine.Message.id', index=4,
+      number=5, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='rich', full_name='grapevine.Message.rich', index=5,
+      number=6, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
   ],
   extensions=[
   ],
@@ -73,7 +87,38 @@ _MESSAGE = _descriptor.Descriptor(
   oneofs=[
   ],
   serialized_start=30,
-  serialized_end=104,
+  serialized_end=130,
+)
+
+
+_MESSAGEBATCH = _descriptor.Descriptor(
+  name='MessageBatch',
+  full_name='grapevine.MessageBatch',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='messages', full_name='grapevine.MessageBatch.messages', index=0,
+      number=1, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto3',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=132,
+  serialized_end=184,
 )
 
 
@@ -138,8 +183,8 @@ _CLASSIFICATION = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=107,
-  serialized_end=242,
+  serialized_start=187,
+  serialized_end=322,
 )
 
 
@@ -169,8 +214,8 @@ _META = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=244,
-  serialized_end=290,
+  serialized_start=324,
+  serialized_end=370,
 )
 
 
@@ -214,8 +259,8 @@ _SENTENCE = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=292,
-  serialized_end=362,
+  serialized_start=372,
+  serialized_end=442,
 )
 
 
@@ -261,6 +306,100 @@ _EXTRACTION = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='id', full_name='grapevine.Extraction.id', index=5,
+      number=6, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='index', full_name='grapevine.Extraction.index', index=6,
+      number=7, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='entities', full_name='grapevine.Extraction.entities', index=7,
+      number=8, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto3',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=445,
+  serialized_end=602,
+)
+
+
+_ENTITY = _descriptor.Descriptor(
+  name='Entity',
+  full_name='grapevine.Entity',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='text', full_name='grapevine.Entity.text', index=0,
+      number=1, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='label', full_name='grapevine.Entity.label', index=1,
+      number=2, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='start', full_name='grapevine.Entity.start', index=2,
+      number=3, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='end', full_name='grapevine.Entity.end', index=3,
+      number=4, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='count', full_name='grapevine.Entity.count', index=4,
+      number=5, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='starts', full_name='grapevine.Entity.starts', index=5,
+      number=6, type=5, cpp_type=1, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='ends', full_name='grapevine.Entity.ends', index=6,
+      number=7, type=5, cpp_type=1, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
   ],
   extensions=[
   ],
@@ -273,17 +412,54 @@ _EXTRACTION = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=364,
-  serialized_end=457,
+  serialized_start=604,
+  serialized_end=714,
 )
 
+
+_EXTRACTIONBATCH = _descriptor.Descriptor(
+  name='ExtractionBatch',
+  full_name='grapevine.ExtractionBatch',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='extractions', full_name='grapevine.ExtractionBatch.extractions', index=0,
+      number=1, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto3',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=716,
+  serialized_end=777,
+)
+
+_MESSAGEBATCH.fields_by_name['messages'].message_type = _MESSAGE
 _CLASSIFICATION.fields_by_name['meta'].message_type = _META
 _META.fields_by_name['sentences'].message_type = _SENTENCE
+_EXTRACTION.fields_by_name['entities'].message_type = _ENTITY
+_EXTRACTIONBATCH.fields_by_name['extractions'].message_type = _EXTRACTION
 DESCRIPTOR.message_types_by_name['Message'] = _MESSAGE
+DESCRIPTOR.message_types_by_name['MessageBatch'] = _MESSAGEBATCH
 DESCRIPTOR.message_types_by_name['Classification'] = _CLASSIFICATION
 DESCRIPTOR.message_types_by_name['Meta'] = _META
 DESCRIPTOR.message_types_by_name['Sentence'] = _SENTENCE
 DESCRIPTOR.message_types_by_name['Extraction'] = _EXTRACTION
+DESCRIPTOR.message_types_by_name['Entity'] = _ENTITY
+DESCRIPTOR.message_types_by_name['ExtractionBatch'] = _EXTRACTIONBATCH
 _sym_db.RegisterFileDescriptor(DESCRIPTOR)
 
 Message = _reflection.GeneratedProtocolMessageType('Message', (_message.Message,), dict(
@@ -293,6 +469,13 @@ Message = _reflection.GeneratedProtocolMessageType('Message', (_message.Message,
   ))
 _sym_db.RegisterMessage(Message)
 
+MessageBatch = _reflection.GeneratedProtocolMessageType('MessageBatch', (_message.Message,), dict(
+  DESCRIPTOR = _MESSAGEBATCH,
+  __module__ = 'grapevine_pb2'
+  # @@protoc_insertion_point(class_scope:grapevine.MessageBatch)
+  ))
+_sym_db.RegisterMessage(MessageBatch)
+
 Classification = _reflection.GeneratedProtocolMessageType('Classification', (_message.Message,), dict(
   DESCRIPTOR = _CLASSIFICATION,
   __module__ = 'grapevine_pb2'
@@ -321,6 +504,20 @@ Extraction = _reflection.GeneratedProtocolMessageType('Extraction', (_message.Me
   ))
 _sym_db.RegisterMessage(Extraction)
 
+Entity = _reflection.GeneratedProtocolMessageType('Entity', (_message.Message,), dict(
+  DESCRIPTOR = _ENTITY,
+  __module__ = 'grapevine_pb2'
+  # @@protoc_insertion_point(class_scope:grapevine.Entity)
+  ))
+_sym_db.RegisterMessage(Entity)
+
+ExtractionBatch = _reflection.GeneratedProtocolMessageType('ExtractionBatch', (_message.Message,), dict(
+  DESCRIPTOR = _EXTRACTIONBATCH,
+  __module__ = 'grapevine_pb2'
+  # @@protoc_insertion_point(class_scope:grapevine.ExtractionBatch)
+  ))
+_sym_db.RegisterMessage(ExtractionBatch)
+
 
 
 _CLASSIFIER = _descriptor.ServiceDescriptor(
@@ -329,8 +526,8 @@ _CLASSIFIER = _descriptor.ServiceDescriptor(
   file=DESCRIPTOR,
   index=0,
   serialized_options=None,
-  serialized_start=459,
-  serialized_end=532,
+  serialized_start=779,
+  serialized_end=852,
   methods=[
   _descriptor.MethodDescriptor(
     name='Classify',
@@ -353,8 +550,8 @@ _EXTRACTOR = _descriptor.ServiceDescriptor(
   file=DESCRIPTOR,
   index=1,
   serialized_options=None,
-  serialized_start=534,
-  serialized_end=601,
+  serialized_start=855,
+  serialized_end=1059,
   methods=[
   _descriptor.MethodDescriptor(
     name='Extract',
@@ -365,6 +562,24 @@ _EXTRACTOR = _descriptor.ServiceDescriptor(
     output_type=_EXTRACTION,
     serialized_options=None,
   ),
+  _descriptor.MethodDescriptor(
+    name='ExtractStream',
+    full_name='grapevine.Extractor.ExtractStream',
+    index=1,
+    containing_service=None,
+    input_type=_MESSAGE,
+    output_type=_EXTRACTION,
+    serialized_options=None,
+  ),
+  _descriptor.MethodDescriptor(
+    name='ExtractBatch',
+    full_name='grapevine.Extractor.ExtractBatch',
+    index=2,
+    containing_service=None,
+    input_type=_MESSAGEBATCH,
+    output_type=_EXTRACTIONBATCH,
+    serialized_options=None,
+  ),
 ])
 _sym_db.RegisterServiceDescriptor(_EXTRACTOR)
 
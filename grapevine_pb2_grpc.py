@@ -61,6 +61,16 @@ class ExtractorStub(object):
         request_serializer=grapevine__pb2.Message.SerializeToString,
         response_deserializer=grapevine__pb2.Extraction.FromString,
         )
+    self.ExtractStream = channel.stream_stream(
+        '/grapevine.Extractor/ExtractStream',
+        request_serializer=grapevine__pb2.Message.SerializeToString,
+        response_deserializer=grapevine__pb2.Extraction.FromString,
+        )
+    self.ExtractBatch = channel.unary_unary(
+        '/grapevine.Extractor/ExtractBatch',
+        request_serializer=grapevine__pb2.MessageBatch.SerializeToString,
+        response_deserializer=grapevine__pb2.ExtractionBatch.FromString,
+        )
 
 
 class ExtractorServicer(object):
@@ -74,6 +84,20 @@ class ExtractorServicer(object):
     context.set_details('Method not implemented!')
     raise NotImplementedError('Method not implemented!')
 
+  def ExtractStream(self, request_iterator, context):
+    # missing associated documentation comment in .proto file
+    pass
+    context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+    context.set_details('Method not implemented!')
+    raise NotImplementedError('Method not implemented!')
+
+  def ExtractBatch(self, request, context):
+    # missing associated documentation comment in .proto file
+    pass
+    context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+    context.set_details('Method not implemented!')
+    raise NotImplementedError('Method not implemented!')
+
 
 def add_ExtractorServicer_to_server(servicer, server):
   rpc_method_handlers = {
@@ -82,6 +106,16 @@ def add_ExtractorServicer_to_server(servicer, server):
           request_deserializer=grapevine__pb2.Message.FromString,
           response_serializer=grapevine__pb2.Extraction.SerializeToString,
       ),
+      'ExtractStream': grpc.stream_stream_rpc_method_handler(
+          servicer.ExtractStream,
+          request_deserializer=grapevine__pb2.Message.FromString,
+          response_serializer=grapevine__pb2.Extraction.SerializeToString,
+      ),
+      'ExtractBatch': grpc.unary_unary_rpc_method_handler(
+          servicer.ExtractBatch,
+          request_deserializer=grapevine__pb2.MessageBatch.FromString,
+          response_serializer=grapevine__pb2.ExtractionBatch.SerializeToString,
+      ),
   }
   generic_handler = grpc.method_handlers_generic_handler(
       'grapevine.Extractor', rpc_method_handlers)
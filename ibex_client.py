@@ -55,6 +55,18 @@ def run():
     except Exception:
         logger.exception("Problem running client to extract entities from message 2.")
         raise Exception
+
+    # Stream both messages over a single ExtractStream call. The server micro-batches
+    # them and returns one Extraction per message, in the order they were sent.
+    try:
+        extractions = stub.ExtractStream(iter([testMessage1, testMessage2]))
+        for message, extraction in zip([testMessage1, testMessage2], extractions):
+            if (DEBUG):
+                logger.info("Streamed extracted_entities for %s: " % message.raw)
+                logger.info(extraction.values)
+    except Exception:
+        logger.exception("Problem running client to extract entities from message stream.")
+        raise Exception
     
 
 if __name__ == '__main__':
@@ -5,109 +5,639 @@
 # Uses GRPC service config in protos/grapevine.proto
 # 
 
-import nltk.data
-import nltk
-from random import shuffle
-from json import JSONEncoder
-from flask import Flask, request
-
+# Module-level imports are kept light so the server starts quickly: spaCy is only
+# imported when parsers are loaded, by serve() or the worker processes (check with
+# benchmarks/check_import_time.py).
 import time
-import pandas
-import pickle
-import numpy as np
 import configparser
-import os.path
-import os
-import pandas as pd
-import datetime
 
+import asyncio
 import grpc
 import logging
+import queue
+import signal
+import threading
 import grapevine_pb2
 import grapevine_pb2_grpc
 from concurrent import futures
 
-import logging
-from collections import Counter
-from d3m_ibex import Ibex
+from d3m_ibex import metrics
+from d3m_ibex.batching import MicroBatcher
+from d3m_ibex.cache import EntityCache
+from d3m_ibex.langid import LanguageRouter
+from d3m_ibex.logs import RequestLogger, start_queue_logging
+from d3m_ibex.registry import REGISTRY, parse_models
+from d3m_ibex.workers import WorkerPool
 
 logger = logging.getLogger('nk_ibex_server')
-logger.setLevel(logging.DEBUG)
 
 # GLOBALS
 _ONE_DAY_IN_SECONDS = 60 * 60 * 24
 # LANGUAGE_ABBREVIATIONS = ['da','nl','en','fi','fr','de','hu','it','no','pt','ro','ru','es','sv']
 # LANGUAGES = ['danish','dutch','english','finnish','french','german','hungarian','italian','norwegian','portuguese','romanian','russian','spanish','swedish']
-LANGUAGE_ABBREVIATIONS = ['en','es']
-LANGUAGES = ['english','spanish']
-LANGUAGE_MAPPING = dict(zip(LANGUAGE_ABBREVIATIONS, LANGUAGES))
+# supported languages, and the parser of each, come from the models option of the
+# MODELS config section, see d3m_ibex.registry
+LANGUAGES = REGISTRY.languages
+LANG_TO_PARSER = REGISTRY.models
+
+# ExtractStream micro-batching: max messages parsed together, and how long to wait
+# for more messages to arrive once the first one of a batch is in
+STREAM_MAX_BATCH_SIZE = 64
+STREAM_MAX_WAIT_SECONDS = 0.01
+
+_END_OF_STREAM = object() # sentinel queued once the client half-closes the stream
+
+REQUESTS = metrics.Counter('ibex_requests_total', 'Non-empty messages received, per RPC and language', ['rpc', 'language'])
+REJECTED = metrics.Counter('ibex_requests_rejected_total', 'Requests rejected with RESOURCE_EXHAUSTED', ['rpc'])
+TOO_LARGE = metrics.Counter('ibex_requests_too_large_total',
+    'Requests rejected with INVALID_ARGUMENT for a message text over max_text_chars', ['rpc'])
+REQUEST_SECONDS = metrics.Histogram('ibex_request_seconds',
+    'Extraction time of a message (Extract) or of the messages of one language in a batch (ExtractStream)', ['rpc', 'language'])
+
+
+class MessageTooLarge(Exception):
+    ''' raised for messages whose text is longer than the server accepts '''
+    pass
+
+
+def new_extraction():
+    ''' init Extraction result object '''
+    return grapevine_pb2.Extraction(
+        key = "extracted_entities",
+        confidence=0.0,
+        model="NK_ibex_entity_extractor",
+        version="0.0.1",
+    )
+
+
+def get_language(request, router=None):
+    ''' map the language abbreviation of a message to a language name, or have `router`
+    detect it from the text when the abbreviation is missing or unsupported (or always,
+    depending on its mode) '''
+    if router is not None:
+        return router.route(request.text, REGISTRY.get_language(request.language))
+
+    # Check the language of the English. Use English 'en' as the default and fallback option.
+    language = REGISTRY.get_language(request.language)
+    if language is None:
+        logger.warning("Unknown or unsupported language abbreviation. Using en = English.")
+        return "english"
+    return language
+
+
+def set_entities(result, entities, rich=False):
+    ''' fill an Extraction with entity strings, or with the values and entities of
+    RichEntity tuples in rich mode '''
+    if not rich:
+        result.values[:] = entities
+        return
+    # a text found with two labels is one value
+    result.values[:] = list(dict.fromkeys(entity.text for entity in entities))
+    for entity in entities:
+        result.entities.add(text=entity.text, label=entity.label, start=entity.start, end=entity.end,
+                            count=entity.count, starts=entity.starts[1:], ends=entity.ends[1:])
+
+
+def drain_requests(request_iterator, requests):
+    ''' read messages off a client stream into a queue, ending with _END_OF_STREAM '''
+    try:
+        for request in request_iterator:
+            requests.put(request)
+    except Exception:
+        logger.exception("Problem reading from request stream.")
+    finally:
+        requests.put(_END_OF_STREAM)
 
-DEBUG = True # boolean to specify whether to print DEBUG information
 
 #-----
 class NKIbexEntityExtractor(grapevine_pb2_grpc.ExtractorServicer):
 
-    def __init__(self):
-        pass
+    def __init__(self, extractors, batcher=None, pool=None, request_logger=None, router=None, max_text_chars=None):
+        # long-lived Ibex instance per language name, shared by all request threads
+        self.extractors = extractors
+        # optional MicroBatcher that parses concurrent Extract calls together
+        self.batcher = batcher
+        # optional WorkerPool that parses in separate processes instead of in this one
+        self.pool = pool
+        # logs a sample of requests
+        self.request_logger = request_logger or RequestLogger(sample_rate=0)
+        # optional LanguageRouter that detects the language of messages
+        self.router = router
+        # messages with longer texts are rejected, bounding the memory a parse can take
+        self.max_text_chars = max_text_chars
+
+    def check_size(self, requests, rpc):
+        ''' raise MessageTooLarge if any message text is over max_text_chars '''
+        if not self.max_text_chars:
+            return
+        for request in requests:
+            if len(request.text) > self.max_text_chars:
+                logger.warning("Rejecting message %s of %d characters.", request.id, len(request.text))
+                TOO_LARGE.labels(rpc).inc()
+                raise MessageTooLarge("Message text is longer than %d characters." % self.max_text_chars)
 
     # Main extraction function
     def Extract(self, request, context):
+        try:
+            return self.extract(request)
+        except queue.Full:
+            logger.warning("Extraction queue is full, rejecting request.")
+            REJECTED.labels('Extract').inc()
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Too many pending extraction requests.")
+        except MessageTooLarge as ex:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(ex))
 
-        # init Extraction result object
-        result = grapevine_pb2.Extraction(
-            key = "extracted_entities",
-            confidence=0.0,
-            model="NK_ibex_entity_extractor",
-            version="0.0.1",
-        )
-
-        # Get text from input message.
+    def extract(self, request):
+        ''' Extraction of a message. Raises queue.Full if the batcher has too many
+        documents waiting, and MessageTooLarge for texts over max_text_chars. '''
+        language = self.get_extract_language(request)
+        if language is None:
+            return self.new_result(request)
         input_doc = request.text
-        logger.debug("Input doc: " + input_doc)
-
-        # Exception cases.
-        if (len(input_doc.strip()) == 0) or (input_doc is None):
-            return result
-
-        # Check the language of the English. Use English 'en' as the default and fallback option.
-        language_abbrev = request.language
-        if language_abbrev not in LANGUAGE_ABBREVIATIONS:
-            logger.warning("Unknown or unsupported language abbreviation. Using en = English.")
-            language_abbrev = "en"
-
-        if language_abbrev in LANGUAGE_MAPPING:
-            language = LANGUAGE_MAPPING[language_abbrev]
-        else:
-            language = "english"
 
         start_time = time.time()
 
-        TopicExtractor = Ibex(language = language)
-        
         try:
-            entities = TopicExtractor.get_entities(input_doc)
+            if request.rich:
+                # rich requests are rare, so they skip the batcher instead of needing queues of their own
+                entities = self.get_entities_batch([input_doc], language, rich=True)[0]
+            elif self.batcher is not None:
+                entities = self.batcher.submit(input_doc, language).result()
+            elif self.pool is not None:
+                entities = self.pool.get_entities_batch([input_doc], language)[0]
+            else:
+                entities = self.extractors[language].get_entities(input_doc, language)
+        except queue.Full:
+            raise
         except Exception:
             logger.exception("Problem extracting named entities.")
             raise Exception
 
+        return self.finish_extract(request, language, entities, start_time)
+
+    def new_result(self, request):
+        result = new_extraction()
+        result.id = request.id
+        return result
+
+    def get_extract_language(self, request):
+        ''' language of a message for Extract, or None if its text is empty. Raises
+        MessageTooLarge for texts over max_text_chars. '''
+        self.check_size([request], 'Extract')
+
+        # Exception cases.
+        if (request.text is None) or (len(request.text.strip()) == 0):
+            return None
+
+        language = get_language(request, self.router)
+        REQUESTS.labels('Extract', language).inc()
+        return language
+
+    def finish_extract(self, request, language, entities, start_time):
+        ''' record and log an Extract call, and return the Extraction of its entities '''
+        input_doc = request.text
         elapsed_time = time.time()-start_time
-        if (DEBUG):
-            logger.info("Total time for entity extraction is : %.2f sec" % elapsed_time)
-        
+        REQUEST_SECONDS.labels('Extract', language).observe(elapsed_time)
+        self.request_logger.log('Extract', language, input_doc, entities, elapsed_time)
+        result = self.new_result(request)
+
         # Include the summary sentences in the result object.
         try:
-            result.values[:] = entities 
+            with metrics.Timer(metrics.STAGE_SECONDS.labels('serialize', LANG_TO_PARSER[language])):
+                set_entities(result, entities, request.rich)
         except Exception:
             logger.exception("Problem embedding extracted entities in result object.")
             raise Exception
 
         return result
 
+    # Streaming extraction function
+    def ExtractStream(self, request_iterator, context):
+        ''' micro-batch a stream of messages through the spacy pipeline, yielding one
+        Extraction per Message in the order the messages arrived '''
+        requests = queue.Queue(maxsize=4 * STREAM_MAX_BATCH_SIZE)
+        reader = threading.Thread(target=drain_requests, args=(request_iterator, requests), daemon=True)
+        reader.start()
+
+        end_of_stream = False
+        while not end_of_stream and context.is_active():
+            # block for the first message of a batch, then top it up until it is full or
+            # STREAM_MAX_WAIT_SECONDS have passed, so a slow client is never left waiting
+            batch = [requests.get()]
+            deadline = time.time() + STREAM_MAX_WAIT_SECONDS
+            while len(batch) < STREAM_MAX_BATCH_SIZE and batch[-1] is not _END_OF_STREAM:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            if batch[-1] is _END_OF_STREAM:
+                batch.pop()
+                end_of_stream = True
+
+            try:
+                results = self.extract_batch(batch)
+            except MessageTooLarge as ex:
+                context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(ex))
+            for result in results:
+                yield result
+
+    # Batch extraction function
+    def ExtractBatch(self, request, context):
+        ''' extract entities from a batch of messages in one call, with one nlp.pipe pass
+        per language. Each Extraction carries the id and index of its message and, as
+        if every message asked for rich results, the label, offsets and count of each
+        entity. '''
+        try:
+            return self.extract_message_batch(request)
+        except MessageTooLarge as ex:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(ex))
+
+    def extract_message_batch(self, request):
+        ''' ExtractionBatch for a MessageBatch '''
+        extractions = self.extract_batch(request.messages, rpc='ExtractBatch', rich=True)
+        for index, extraction in enumerate(extractions):
+            extraction.index = index
+        return grapevine_pb2.ExtractionBatch(extractions=extractions)
+
+    def extract_batch(self, requests, rpc='ExtractStream', rich=False):
+        ''' extract entities from a list of messages, one nlp.pipe pass per language
+        (and per result mode, messages asking for rich results being parsed apart).
+        Returns one Extraction per message, in input order. With `rich`, all messages
+        get rich results. Raises MessageTooLarge, before parsing any, if a message
+        text is over max_text_chars. '''
+        self.check_size(requests, rpc)
+        results = [new_extraction() for _ in requests]
+        for result, request in zip(results, requests):
+            result.id = request.id
+
+        # group non-empty messages by language, remembering their position in the batch
+        by_language = {}
+        for i, request in enumerate(requests):
+            if len(request.text.strip()) == 0:
+                continue
+            by_language.setdefault((get_language(request, self.router), rich or request.rich), []).append(i)
+
+        start_time = time.time()
+
+        for (language, rich_group), indices in by_language.items():
+            REQUESTS.labels(rpc, language).inc(len(indices))
+            language_start_time = time.time()
+            try:
+                entities = self.get_entities_batch([requests[i].text for i in indices], language, rich_group)
+            except Exception:
+                logger.exception("Problem extracting named entities.")
+                raise Exception
+            language_time = time.time() - language_start_time
+            REQUEST_SECONDS.labels(rpc, language).observe(language_time)
+            for i, doc_entities in zip(indices, entities):
+                self.request_logger.log(rpc, language, requests[i].text, doc_entities, language_time, batch=len(indices))
+
+            with metrics.Timer(metrics.STAGE_SECONDS.labels('serialize', LANG_TO_PARSER[language])):
+                for i, doc_entities in zip(indices, entities):
+                    set_entities(results[i], doc_entities, rich_group)
+
+        logger.debug("Total time for entity extraction of %d docs is : %.2f sec", len(requests), time.time() - start_time)
+
+        return results
+
+    def get_entities_batch(self, documents, language, rich=False):
+        ''' extract entities from documents of one language, on the worker pool if any.
+        With `rich`, returns RichEntity tuples (see Ibex.get_rich_entities_batch). '''
+        method = 'get_rich_entities_batch' if rich else 'get_entities_batch'
+        if self.pool is not None:
+            return self.pool.submit(documents, language, method).result()
+        return getattr(self.extractors[language], method)(documents, language)
+
 
 #-----
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    grapevine_pb2_grpc.add_ExtractorServicer_to_server(NKIbexEntityExtractor(), server)
+class NKIbexAsyncEntityExtractor(grapevine_pb2_grpc.ExtractorServicer):
+    ''' grpc.aio servicer. Admits at most `max_in_flight` requests (a stream counts
+    as one) and rejects the rest straight away with RESOURCE_EXHAUSTED instead of
+    queueing them. Parsing runs on `executor` threads through the synchronous
+    `extractor`, which hands it on to its batcher or worker processes if it has them,
+    so the event loop only moves messages. '''
+
+    def __init__(self, extractor, executor, max_in_flight=256):
+        self.extractor = extractor
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0  # only touched on the event loop, so needs no lock
+
+    async def admit(self, context, rpc):
+        if self.in_flight >= self.max_in_flight:
+            logger.warning("%d requests in flight, rejecting request.", self.in_flight)
+            REJECTED.labels(rpc).inc()
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Too many extraction requests in flight.")
+        self.in_flight += 1
+
+    async def Extract(self, request, context):
+        await self.admit(context, 'Extract')
+        try:
+            if self.extractor.batcher is not None and not request.rich:
+                return await self.extract_batched(request)
+            return await asyncio.get_event_loop().run_in_executor(self.executor, self.extractor.extract, request)
+        except queue.Full:
+            logger.warning("Extraction queue is full, rejecting request.")
+            REJECTED.labels('Extract').inc()
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Too many pending extraction requests.")
+        except MessageTooLarge as ex:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(ex))
+        finally:
+            self.in_flight -= 1
+
+    async def extract_batched(self, request):
+        ''' Extraction of a message through the batcher, awaiting its result on the
+        event loop instead of holding an executor thread, so up to max_in_flight
+        messages (not executor_threads) can be waiting to be batched '''
+        language = self.extractor.get_extract_language(request)
+        if language is None:
+            return self.extractor.new_result(request)
+        start_time = time.time()
+        try:
+            entities = await asyncio.wrap_future(self.extractor.batcher.submit(request.text, language))
+        except queue.Full:
+            raise
+        except Exception:
+            logger.exception("Problem extracting named entities.")
+            raise Exception
+        return self.extractor.finish_extract(request, language, entities, start_time)
+
+    async def ExtractBatch(self, request, context):
+        await self.admit(context, 'ExtractBatch')
+        try:
+            return await asyncio.get_event_loop().run_in_executor(self.executor, self.extractor.extract_message_batch, request)
+        except MessageTooLarge as ex:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(ex))
+        finally:
+            self.in_flight -= 1
+
+    async def ExtractStream(self, request_iterator, context):
+        ''' micro-batch a stream of messages like NKIbexEntityExtractor.ExtractStream '''
+        await self.admit(context, 'ExtractStream')
+        loop = asyncio.get_event_loop()
+        requests = asyncio.Queue(maxsize=4 * STREAM_MAX_BATCH_SIZE)
+
+        async def drain():
+            try:
+                async for request in request_iterator:
+                    await requests.put(request)
+            except Exception:
+                logger.exception("Problem reading from request stream.")
+            finally:
+                await requests.put(_END_OF_STREAM)
+
+        reader = asyncio.ensure_future(drain())
+        try:
+            end_of_stream = False
+            while not end_of_stream:
+                batch = [await requests.get()]
+                deadline = loop.time() + STREAM_MAX_WAIT_SECONDS
+                while len(batch) < STREAM_MAX_BATCH_SIZE and batch[-1] is not _END_OF_STREAM:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(requests.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                if batch[-1] is _END_OF_STREAM:
+                    batch.pop()
+                    end_of_stream = True
+
+                try:
+                    results = await loop.run_in_executor(self.executor, self.extractor.extract_batch, batch)
+                except MessageTooLarge as ex:
+                    await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(ex))
+                for result in results:
+                    yield result
+        finally:
+            reader.cancel()
+            self.in_flight -= 1
+
+
+#-----
+def get_cache(config):
+    ''' build the EntityCache from the CACHE config section, if enabled '''
+    if not config.getboolean('CACHE', 'enabled', fallback=False):
+        return None
+
+    return EntityCache(
+        max_size = config.getint('CACHE', 'max_size', fallback=100000),
+        ttl = config.getfloat('CACHE', 'ttl_seconds', fallback=3600),
+        path = config.get('CACHE', 'path', fallback='') or None,
+    )
+
+
+def get_dedup(config):
+    ''' build the NearDuplicateWindow from the DEDUP config section, if enabled '''
+    if not config.getboolean('DEDUP', 'enabled', fallback=False):
+        return None
+
+    from d3m_ibex.dedup import NearDuplicateWindow
+    return NearDuplicateWindow(
+        threshold = config.getfloat('DEDUP', 'threshold', fallback=0.9),
+        window_seconds = config.getfloat('DEDUP', 'window_seconds', fallback=60),
+        max_size = config.getint('DEDUP', 'max_size', fallback=10000),
+        min_words = config.getint('DEDUP', 'min_words', fallback=5),
+    )
+
+
+def get_worker_pool(config, languages=LANGUAGES, profile='full', cache=None, chunk_size=None, exclude_settings=None,
+                    dedup=None):
+    ''' start the extraction WorkerPool from the WORKERS config section, if enabled.
+    Workers are recycled past max_worker_rss_mb of the MEMORY section. '''
+    processes = config.getint('WORKERS', 'processes', fallback=0)
+    if processes <= 0:
+        return None
+
+    return WorkerPool(processes, languages,
+        health_check_interval = config.getfloat('WORKERS', 'health_check_interval', fallback=1.0),
+        start_method = config.get('WORKERS', 'start_method', fallback='fork'),
+        profile = profile,
+        cache = cache,
+        chunk_size = chunk_size,
+        exclude_settings = exclude_settings,
+        dedup = dedup,
+        max_rss = int(config.getfloat('MEMORY', 'max_worker_rss_mb', fallback=0) * 2**20) or None,
+    ).start()
+
+
+def get_batcher(config, process_batch, threads_per_language=1):
+    ''' build the MicroBatcher for unary Extract calls from the BATCHING config section '''
+    if not config.getboolean('BATCHING', 'enabled', fallback=False):
+        return None
+
+    batcher = MicroBatcher(process_batch,
+        max_batch_size = config.getint('BATCHING', 'max_batch_size', fallback=32),
+        max_wait_ms = config.getfloat('BATCHING', 'max_wait_ms', fallback=5),
+        max_queue_depth = config.getint('BATCHING', 'max_queue_depth', fallback=1024),
+        threads_per_language = threads_per_language,
+    )
+    logger.info("batching Extract calls: max_batch_size=%d, max_wait_ms=%.1f, max_queue_depth=%d",
+        batcher.max_batch_size, batcher.max_wait * 1000, batcher.max_queue_depth)
+    return batcher
+
+
+def get_request_logger(config):
+    ''' build the RequestLogger from the LOGGING config section '''
+    return RequestLogger(
+        sample_rate = config.getfloat('LOGGING', 'request_sample_rate', fallback=0.0),
+        max_chars = config.getint('LOGGING', 'request_max_chars', fallback=200),
+    )
+
+
+def get_language_router(config):
+    ''' build the LanguageRouter from the LANGID config section, if detection is on '''
+    mode = config.get('LANGID', 'mode', fallback='off')
+    if mode == 'off':
+        return None
+
+    return LanguageRouter(
+        mode = mode,
+        min_confidence = config.getfloat('LANGID', 'min_confidence', fallback=0.75),
+        max_chars = config.getint('LANGID', 'max_chars', fallback=400),
+    )
+
+
+def get_metrics_server(config, cache=None, batcher=None, pool=None, dedup=None):
+    ''' serve /metrics from the METRICS config section, if enabled, adding gauges for
+    the cache, near-duplicate window, batcher and worker pool. Stage timings, batch
+    sizes and document counts of worker processes come back with their results and
+    are exported with those of this process. '''
+    if not config.getboolean('METRICS', 'enabled', fallback=False):
+        return None
+
+    if cache is not None:
+        metrics.Counter('ibex_cache_lookups_total', 'Entity cache lookups, by result', ['result']).set_function(
+            lambda: {(result,): value for result, value in cache.stats().items() if result in ('hits', 'disk_hits', 'misses')})
+        metrics.Counter('ibex_cache_evictions_total', 'Entity cache entries evicted to stay within max_size').set_function(
+            lambda: cache.stats()['evictions'])
+        metrics.Gauge('ibex_cache_entries', 'Entries in the in-memory entity cache').set_function(lambda: cache.stats()['size'])
+        metrics.Gauge('ibex_cache_hit_ratio', 'Fraction of entity cache lookups that hit').set_function(
+            lambda: cache.stats()['hit_rate'])
+    if dedup is not None:
+        metrics.Counter('ibex_near_duplicate_lookups_total', 'Documents looked up in the near-duplicate window').set_function(
+            lambda: dedup.stats()['lookups'])
+        metrics.Counter('ibex_near_duplicate_skips_total', 'Documents given the entities of a near-duplicate instead of being parsed').set_function(
+            lambda: dedup.stats()['skips'])
+        metrics.Gauge('ibex_near_duplicate_entries', 'Documents in the near-duplicate window').set_function(
+            lambda: dedup.stats()['size'])
+        metrics.Gauge('ibex_near_duplicate_skip_ratio', 'Fraction of near-duplicate lookups that skipped parsing').set_function(
+            lambda: dedup.stats()['skip_rate'])
+    if batcher is not None:
+        metrics.Gauge('ibex_queue_depth', 'Documents waiting to be batched, per language', ['language']).set_function(
+            lambda: {(language,): batcher.queue_depth(language) for language in list(batcher.queues)})
+    if pool is not None:
+        metrics.Gauge('ibex_worker_pending_batches', 'Batches in flight per worker process', ['worker']).set_function(
+            lambda: {(index,): worker['pending'] for index, worker in enumerate(pool.health())})
+        metrics.Counter('ibex_worker_restarts_total', 'Worker processes restarted after dying', ['worker']).set_function(
+            lambda: {(index,): worker['restarts'] for index, worker in enumerate(pool.health())})
+        metrics.Counter('ibex_worker_recycles_total', 'Worker processes replaced after passing max_worker_rss_mb',
+                        ['worker']).set_function(
+            lambda: {(index,): worker['recycles'] for index, worker in enumerate(pool.health())})
+        metrics.Gauge('ibex_worker_resident_memory_bytes', 'Resident memory of each worker process', ['worker']).set_function(
+            lambda: {(index,): worker['rss'] for index, worker in enumerate(pool.health()) if worker['rss'] is not None})
+        metrics.Gauge('ibex_worker_parser_vocab_growth', 'Strings added to the vocab of each parser of each worker process since it was loaded',
+                      ['worker', 'parser']).set_function(
+            lambda: {(index, parser_name): growth for index, worker in enumerate(pool.health())
+                     for parser_name, growth in worker['vocab_growth'].items()})
+
+    return metrics.start_http_server(config.getint('METRICS', 'port', fallback=50054),
+                                     config.get('METRICS', 'address', fallback=''))
+
+
+def get_warmup_languages(config):
+    ''' languages whose parsers are loaded before the server starts listening '''
+    languages = config.get('MODELS', 'warmup', fallback=','.join(LANGUAGES))
+    return [language.strip() for language in languages.split(',') if language.strip()]
+
+
+def get_extractors(languages, profile='full', cache=None, preload=True, chunk_size=None, dedup=None):
+    ''' one Ibex per supported language, created once and shared by all requests.
+    Parsers of `languages` are loaded up front, the others on first use. '''
+    from d3m_ibex import Ibex
+    return {language: Ibex(language = language, profile = profile, cache = cache,
+                           preload = preload and language in languages, chunk_size = chunk_size, dedup = dedup)
+            for language in LANGUAGES}
+
+
+def configure_parsers(config):
+    ''' register the parsers of the models option of the MODELS config section, with
+    the memory budget for loaded parsers, the directory their arrays are
+    memory-mapped from, and the vocab growth limit of the MEMORY section '''
+    models = config.get('MODELS', 'models', fallback='')
+    budget = config.getfloat('MODELS', 'memory_budget_mb', fallback=0)
+    REGISTRY.configure(parse_models(models) if models.strip() else REGISTRY.settings()['models'],
+                       memory_budget = int(budget * 2**20) or None,
+                       max_vocab_growth = config.getint('MEMORY', 'max_vocab_growth', fallback=0) or None,
+                       mmap_dir = config.get('MODELS', 'mmap_dir', fallback='') or None)
+
+
+def configure_exclude(config):
+    ''' load the exclude list of the EXCLUDE config section and start watching it for
+    changes. Returns its settings, for worker processes. '''
+    from d3m_ibex.d3m_ibex import EXCLUDE, exclude_path
+    EXCLUDE.configure(config.get('EXCLUDE', 'path', fallback='') or exclude_path,
+                      compiled_path = config.get('EXCLUDE', 'compiled_path', fallback='') or None,
+                      interval = config.getfloat('EXCLUDE', 'reload_interval_seconds', fallback=0) or None)
+    logger.info('exclude list %s: %d words, %d phrases', EXCLUDE.path, len(EXCLUDE.index.words), len(EXCLUDE.index.phrases))
+    return EXCLUDE.settings()
+
+
+def serve(config):
+    configure_parsers(config)
+    exclude_settings = configure_exclude(config)
+    # load and warm parsers before opening the port, so first requests are not slow
+    languages = get_warmup_languages(config)
+    profile = config.get('MODELS', 'profile', fallback='full')
+    cache = get_cache(config)
+    dedup = get_dedup(config)
+    chunk_size = config.getint('MODELS', 'chunk_size', fallback=0) or None
+    # worker processes are forked before any gRPC threads exist
+    pool = get_worker_pool(config, languages, profile, cache, chunk_size, exclude_settings, dedup)
+    # with a pool the parsers live in the worker processes instead
+    extractors = get_extractors(languages, profile, cache, preload = pool is None, chunk_size = chunk_size,
+                                dedup = dedup)
+    if pool is None:
+        extractors[LANGUAGES[0]].warmup(languages)
+    extractor = NKIbexEntityExtractor(extractors, pool=pool, request_logger=get_request_logger(config),
+                                      router=get_language_router(config),
+                                      max_text_chars=config.getint('MEMORY', 'max_text_chars', fallback=0) or None)
+    # keep every worker process busy with a batch of its own
+    batcher = get_batcher(config, extractor.get_entities_batch,
+                          threads_per_language = pool.n_workers if pool is not None else 1)
+    extractor.batcher = batcher
+    metrics_server = get_metrics_server(config, cache, batcher, pool, dedup)
+
+    if config.get('SERVER', 'mode', fallback='threads') == 'aio':
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(serve_aio(config, extractor))
+        loop.close()
+    else:
+        serve_threads(config, extractor)
+
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    if batcher is not None:
+        batcher.stop()
+    if pool is not None:
+        pool.stop()
+
+
+def serve_threads(config, extractor):
+    ''' run the synchronous server until interrupted, with `threads` handler threads of
+    the SERVER config section. Requests beyond those wait for a free thread, or with
+    max_concurrent_rpcs set, beyond that many are rejected with RESOURCE_EXHAUSTED. '''
+    threads = config.getint('SERVER', 'threads', fallback=10)
+    max_concurrent_rpcs = config.getint('SERVER', 'max_concurrent_rpcs', fallback=0) or None
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=threads), maximum_concurrent_rpcs=max_concurrent_rpcs)
+    grapevine_pb2_grpc.add_ExtractorServicer_to_server(extractor, server)
     server.add_insecure_port('[::]:' + GRPC_PORT)
     server.start()
     try:
@@ -117,12 +647,48 @@ def serve():
         server.stop(0)
 
 
+async def serve_aio(config, extractor):
+    ''' run the grpc.aio server until SIGTERM or SIGINT, then stop accepting requests
+    and give those in flight up to shutdown_grace_seconds to finish '''
+    from grpc import aio
+
+    max_in_flight = config.getint('SERVER', 'max_in_flight', fallback=256)
+    executor = futures.ThreadPoolExecutor(max_workers=config.getint('SERVER', 'executor_threads', fallback=16))
+    grace = config.getfloat('SERVER', 'shutdown_grace_seconds', fallback=10)
+
+    servicer = NKIbexAsyncEntityExtractor(extractor, executor, max_in_flight)
+    metrics.Gauge('ibex_requests_in_flight', 'Requests admitted by the grpc.aio server and not finished').set_function(
+        lambda: servicer.in_flight)
+
+    server = aio.server()
+    grapevine_pb2_grpc.add_ExtractorServicer_to_server(servicer, server)
+    server.add_insecure_port('[::]:' + GRPC_PORT)
+    await server.start()
+    logger.info("serving with grpc.aio, at most %d requests in flight", max_in_flight)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+    await stopping.wait()
+
+    logger.info("shutting down, draining requests in flight for up to %.0f sec", grace)
+    await server.stop(grace)
+    executor.shutdown(wait=True)
+
+
 if __name__ == '__main__':
     config = configparser.ConfigParser()
     config.read('config.ini')
+    # formatting and writing log lines happens on a background thread
+    listener = start_queue_logging(
+        level = config.get('LOGGING', 'level', fallback='INFO').upper(),
+        queue_size = config.getint('LOGGING', 'queue_size', fallback=10000),
+    )
     port_config = config['DEFAULT']['port_config']
     logger.info("using port " + port_config + " ...")
     global GRPC_PORT
     GRPC_PORT = port_config
     
-    serve()
\ No newline at end of file
+    serve(config)
+    listener.stop()
@@ -13,11 +13,20 @@ setup(
     description='Named entity extraction',
     author='New Knowledge',
     packages=['d3m_ibex'],
+    # the package loads spacy lazily through a module __getattr__ (PEP 562), and the
+    # server has async generator RPCs, so older Pythons cannot import them
+    python_requires='>=3.7',
     package_data={'d3m_ibex': ['exclude_words.txt']},
     include_package_data=True,
     install_requires=[
         'spacy>=2.0.11',
-        'flask>=1.0.2',
         'nose>=1.3.7'
     ],
+    extras_require={
+        'parquet': ['pyarrow'],
+        'test': ['pytest', 'hypothesis'],
+    },
+    entry_points={
+        'console_scripts': ['ibex-extract=d3m_ibex.cli:main'],
+    },
 )
@@ -0,0 +1,34 @@
+''' chunked parsing of long documents, with text repeated across chunk boundaries '''
+
+import pytest
+
+from d3m_ibex.d3m_ibex import Ibex, chunk_text, prep_text
+
+SENTENCE = 'Barack Obama visited Paris with Angela Merkel. '
+# a sentence too long for one chunk, split into overlapping windows
+RUN_ON = 'Barack Obama met Angela Merkel in Paris and ' * 12 + 'left.'
+DOCUMENTS = [
+    SENTENCE * 12,
+    SENTENCE * 3 + '\n\n' + RUN_ON + '\n\n #tag ' + SENTENCE * 3,
+    RUN_ON + ' ' + RUN_ON,
+]
+
+
+@pytest.mark.parametrize('document', DOCUMENTS)
+@pytest.mark.parametrize('chunk_size', [60, 100, 250])
+def test_chunk_offsets(document, chunk_size):
+    text = prep_text(document).lstrip()
+    chunks = chunk_text(document, chunk_size, overlap=20)
+    assert len(chunks) > 1
+    for chunk, keep_from, keep_to, offset in chunks:
+        assert text[offset:offset + len(chunk.rstrip())] == chunk.rstrip()
+
+
+@pytest.mark.parametrize('chunk_size', [60, 100, 250])
+def test_chunked_spans(chunk_size):
+    pytest.importorskip('en_core_web_md')
+    whole = Ibex(language='english', preload=False).get_entity_spans_batch(DOCUMENTS)
+    chunked = Ibex(language='english', preload=False, chunk_size=chunk_size).get_entity_spans_batch(DOCUMENTS)
+    for document, spans in zip(DOCUMENTS, chunked):
+        assert all(document[start:end] == text for text, _, start, end in spans)
+    assert [sorted(spans) for spans in chunked] == [sorted(spans) for spans in whole]
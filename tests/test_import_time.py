@@ -0,0 +1,39 @@
+''' import-time budget of the server: importing it must stay fast and must not pull
+in spaCy or other heavy dependencies, which are loaded on first use (see
+benchmarks/check_import_time.py for a report of the heaviest imports) '''
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+# best of REPEAT imports, in milliseconds; slow CI machines can raise it
+BUDGET_MS = float(os.environ.get('IBEX_IMPORT_BUDGET_MS', 400))
+REPEAT = 3
+FORBIDDEN = {'spacy', 'thinc', 'nltk', 'flask', 'pandas'}
+
+
+def import_times(module):
+    ''' (name, cumulative microseconds) of each module imported by `import module`
+    in a fresh interpreter, in import order '''
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+                             cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert process.returncode == 0, process.stderr[-2000:]
+    times = []
+    for line in process.stderr.splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            _, cumulative_us, name = line[len('import time:'):].split('|')
+            times.append((name.strip(), int(cumulative_us)))
+    return times
+
+
+@pytest.mark.parametrize('module', ['ibex_server', 'd3m_ibex'])
+def test_import_time(module):
+    runs = [import_times(module) for _ in range(REPEAT)]
+    imported = set(name.split('.')[0] for name, _ in runs[0])
+    assert not imported & FORBIDDEN
+    total_ms = min(sum(cumulative for name, cumulative in times if name == module) for times in runs) / 1000.0
+    assert total_ms <= BUDGET_MS
@@ -0,0 +1,97 @@
+''' memory-mapped parser weights: a parser whose arrays are mapped from the exported
+files parses exactly like the one loaded from disk, and really runs on the mapped
+arrays. A small tagger and NER model is trained for the installed spaCy, with thinc
+7 (spacy 2) or thinc 8 (spacy 3) weights. '''
+
+import random
+
+import numpy
+import pytest
+
+spacy = pytest.importorskip('spacy')
+
+from d3m_ibex import mapped
+
+TRAIN = [('Barack Obama visited Paris on Monday.', [(0, 12, 'PERSON'), (21, 26, 'GPE')]),
+         ('Angela Merkel met Emmanuel Macron in Berlin.', [(0, 13, 'PERSON'), (18, 33, 'PERSON'), (37, 43, 'GPE')]),
+         ('The Bank of England raised rates in London.', [(0, 19, 'ORG'), (36, 42, 'GPE')])]
+TEXTS = [text for text, _ in TRAIN] + ['Obama and Merkel met in Paris and London.', 'Nothing to see here.']
+
+
+def get_tags(doc):
+    return ['NNP' if token.is_title else '.' if token.is_punct else 'IN' for token in doc]
+
+
+def train_parser(path):
+    ''' train a small English tagger and NER model with word vectors, saved to path '''
+    random.seed(0)
+    nlp = spacy.blank('en')
+    nlp.vocab.reset_vectors(width=16)
+    for word in 'Barack Obama Paris Angela Merkel Berlin London the of in met'.split():
+        nlp.vocab.set_vector(word, numpy.random.RandomState(len(word)).rand(16).astype('f'))
+    if spacy.__version__.startswith('2.'):
+        from spacy.gold import GoldParse
+        nlp.add_pipe(nlp.create_pipe('tagger'))
+        nlp.add_pipe(nlp.create_pipe('ner'))
+        for tag in ['NNP', 'IN', '.']:
+            nlp.get_pipe('tagger').add_label(tag)
+        for label in ['PERSON', 'GPE', 'ORG']:
+            nlp.get_pipe('ner').add_label(label)
+        optimizer = nlp.begin_training()
+        for _ in range(20):
+            for text, ents in TRAIN:
+                doc = nlp.make_doc(text)
+                nlp.update([doc], [GoldParse(doc, entities=ents, tags=get_tags(doc))], sgd=optimizer, drop=0.1)
+    else:
+        from spacy.training import Example
+        nlp.add_pipe('tagger')
+        nlp.add_pipe('ner')
+        examples = []
+        for text, ents in TRAIN:
+            doc = nlp.make_doc(text)
+            examples.append(Example.from_dict(doc, {'entities': ents, 'tags': get_tags(doc)}))
+        optimizer = nlp.initialize(lambda: examples)
+        for _ in range(20):
+            nlp.update(examples, sgd=optimizer, drop=0.1)
+    nlp.to_disk(path)
+
+
+def parse(parser):
+    return [([(ent.text, ent.label_, ent.start_char) for ent in doc.ents], [token.tag_ for token in doc])
+            for doc in parser.pipe(TEXTS)]
+
+
+@pytest.fixture(scope='module')
+def model_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('model'))
+    train_parser(path)
+    return path
+
+
+def test_mapped_parses(model_path, tmp_path):
+    loaded = spacy.load(model_path)
+    expected = parse(loaded)
+    for _ in range(2):  # exports the arrays, then maps the existing export
+        parser = spacy.load(model_path)
+        assert mapped.map_parser(parser, str(tmp_path)) > 0
+        arrays = mapped.get_arrays(parser)
+        assert any(isinstance(array, numpy.memmap) for _, array, _ in arrays)
+        for (name, array, _), (mapped_name, mapped_array, _) in zip(mapped.get_arrays(loaded), arrays):
+            assert name == mapped_name and numpy.array_equal(array, mapped_array)
+        assert parse(parser) == expected
+
+
+@pytest.mark.parametrize('pipe_name', ['tagger', 'ner'])
+def test_mapped_arrays_used(model_path, tmp_path, pipe_name):
+    # overwriting the mapped weights of a pipe (in this process only: the maps are
+    # copy-on-write) must change its parses, or the pipe still runs on a copy
+    expected = parse(spacy.load(model_path))
+    parser = spacy.load(model_path)
+    mapped.map_parser(parser, str(tmp_path))
+    overwritten = 0
+    for name, array, _ in mapped.get_arrays(parser):
+        if name.startswith(pipe_name + '.') and isinstance(array, numpy.memmap):
+            array[...] = numpy.random.RandomState(0).rand(*array.shape)
+            overwritten += 1
+    assert overwritten
+    assert parse(parser) != expected
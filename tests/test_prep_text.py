@@ -0,0 +1,61 @@
+''' prep_text, prep_texts and prep_text_offsets against the original multi-pass
+implementation, on generated documents '''
+
+import re
+
+from hypothesis import given, settings, strategies as st
+
+from d3m_ibex.d3m_ibex import prep_text, prep_texts, prep_text_offsets
+
+# the original prep_text: one regex pass per filter, in dict order, then a pass
+# collapsing the spaces
+REFERENCE_FILTERS = [
+    (re.compile(r'RT @\w+'), ''),  # retweet (filter before removing mentions)
+    (re.compile(r'https?://\S+'), ''),  # uri
+    (re.compile(r'#\w*'), ''),  # hashtag
+    (re.compile(r'@\w*'), ''),  # mention
+    (re.compile(r'\s'), ' '),  # whitespace [ \t\n\r\f\v]
+]
+REFERENCE_SPACES = re.compile('  +')
+
+def reference_prep_text(text):
+    for regex, replacement in REFERENCE_FILTERS:
+        text = regex.sub(replacement, text)
+    return REFERENCE_SPACES.sub(' ', text)
+
+# fragments the rules match on, glued together so matches start and end inside and
+# across them ('#tag' + 'https://..', 'R' + 'T @'), plus arbitrary text
+FRAGMENTS = ['word', 'Madrid', 'ñandú', '¿Qué?', 'RT @bob', 'RT', 'R', 'T', '@', '#', '@ana',
+             '#tag_2', 'http://x.co/a?b=1', 'https://t.co/Zz', 'http', 'https:', '://', '/', '.',
+             ' ', '  ', '\n', '\t', '\r\n', '\xa0', '\x1c', '\u2028', '\x00']
+documents = st.one_of(
+    st.lists(st.one_of(st.sampled_from(FRAGMENTS), st.text(max_size=3)), max_size=20).map(''.join),
+    st.text(),
+)
+
+
+@given(documents)
+@settings(max_examples=2000)
+def test_prep_text(text):
+    assert prep_text(text) == reference_prep_text(text)
+
+
+@given(st.lists(documents, max_size=10))
+@settings(max_examples=500)
+def test_prep_texts(texts):
+    # batches with a NUL in a document are prepped one by one, the others joined
+    assert prep_texts(texts) == [reference_prep_text(text) for text in texts]
+    texts = [text.replace('\x00', '') for text in texts]
+    assert prep_texts(texts) == [reference_prep_text(text) for text in texts]
+
+
+@given(documents)
+@settings(max_examples=2000)
+def test_prep_text_offsets(text):
+    prepped, offsets = prep_text_offsets(text)
+    assert prepped == prep_text(text)
+    assert len(offsets) == len(prepped)
+    assert all(a < b for a, b in zip(offsets, offsets[1:]))
+    # kept characters map to themselves, collapsed whitespace to the start of its run
+    for char, offset in zip(prepped, offsets):
+        assert text[offset] == char or (char == ' ' and text[offset].isspace())